@@ -7,7 +7,8 @@ Description: Script to apply GAMETES to generate and organize a variety of SNP 2
 import sys
 import os
 import argparse
-import time
+from gametes_jobs import Job, dataset_files
+from gametes_schedulers import add_run_arguments, run_jobs
 
 def main(argv):
     #Parse arguments
@@ -15,48 +16,63 @@ def main(argv):
     #No defaults
     parser.add_argument('--output-path',dest='output_path',type=str,help='path to output directory')
     parser.add_argument('--archive-name', dest='archive_name',type=str, help='name of archive output folder (no spaces)')
-    parser.add_argument('--run-parallel',dest='run_parallel',type=str,help='path to directory containing datasets',default="True")
-    parser.add_argument('--use', dest='use', help='', type=str, default ='model') #defaults to model generation
+    parser.add_argument('--use', dest='use', help='model, data, or all (models and datasets in one run, each dataset job waiting only on the model it uses); defaults to model, or to all with --plan-only', type=str, default =None) #defaults to model generation (all with --plan-only)
+    add_run_arguments(parser)
 
     options = parser.parse_args(argv[1:])
     output_path = options.output_path
     archive_name = options.archive_name
-    run_parallel = options.run_parallel
     use = options.use
+    if use is None:
+        use = 'all' if options.plan_only else 'model' #a plan costs the whole archive unless told otherwise
 
-    if not os.path.exists(output_path):
-        os.mkdir(output_path)
+    job_dest = output_path+'/temporary'+'/jobs'
+    log_dest = output_path+'/temporary'+'/logs'
 
-    this_file_path = os.path.dirname(os.path.realpath(__file__))
+    #Create folders (a plan only writes nothing)
+    if not options.plan_only:
+        for folder in (output_path,output_path+'/temporary',job_dest,log_dest):
+            if not os.path.exists(folder):
+                os.mkdir(folder)
+
+    if use not in ('model','data','all'):
+        print("GAMETES use not recognized.")
+        return 1
+
+    jobs = plan_archive(output_path,archive_name,use,not options.plan_only)
 
+    #Submit or run the planned jobs
+    failed = run_jobs(jobs,options,job_dest,log_dest)
+    if failed:
+        return 1
+    return 0
+
+def plan_archive(output_path,archive_name,use,create_folders=True):
+    """ Jobs generating the models ('model'), datasets ('data') or both ('all') of the archive, creating the archive,
+    model and dataset folders unless create_folders is False (--plan-only). Also used by gametes_planner.py to plan
+    several archive scripts as one run. """
+    this_file_path = os.path.dirname(os.path.realpath(__file__))
     model_dest = output_path+'/'+archive_name+'/models'
-    job_dest = output_path+'/temporary'+'/jobs'
-    log_dest = output_path+'/temporary'+'/logs'
 
-    #Create folders
-    if not os.path.exists(output_path+'/'+archive_name):
-        os.mkdir(output_path+'/'+archive_name)
-    if not os.path.exists(model_dest):
-        os.mkdir(model_dest)
-    if not os.path.exists(output_path+'/temporary'):
-        os.mkdir(output_path+'/temporary')
-    if not os.path.exists(job_dest):
-        os.mkdir(job_dest)
-    if not os.path.exists(log_dest):
-        os.mkdir(log_dest)
-
-    if use == 'model':
+    jobs = []
+    if use in ('model','all'):
         #Generate core epistasis models
-        epistasis_2_locus_core_model(output_path,archive_name,model_dest,job_dest,log_dest,run_parallel,this_file_path)
+        epistasis_2_locus_core_model(output_path,archive_name,model_dest,this_file_path,jobs)
 
-    elif use == 'data':
+    if use in ('data','all'):
         #Generate core epistasis data
-        epistasis_2_locus_core_data(output_path,archive_name,model_dest,job_dest,log_dest,run_parallel,this_file_path)
+        epistasis_2_locus_core_data(output_path,archive_name,model_dest,this_file_path,jobs)
 
-    else:
-        print("GAMETES use not recognized.")
+    #Create folders (one dataset folder per generator, named after its job group)
+    if create_folders:
+        data_folders = sorted(set(output_path+'/'+archive_name+'/'+job.group for job in jobs if job.group != 'models'))
+        for folder in [output_path+'/'+archive_name,model_dest]+data_folders:
+            if not os.path.exists(folder):
+                os.mkdir(folder)
+
+    return jobs
 
-def epistasis_2_locus_core_model(output_path,archive_name,model_dest,job_dest,log_dest,run_parallel,this_file_path):
+def epistasis_2_locus_core_model(output_path,archive_name,model_dest,this_file_path,jobs):
     #Define model parameters
     locus = 2
     heritability = [0.05, 0.1, 0.2, 0.4]
@@ -80,30 +96,17 @@ def epistasis_2_locus_core_model(output_path,archive_name,model_dest,job_dest,lo
             for i in range(locus):
                 filewrite = filewrite +' -a '+str(m)
             filewrite = filewrite +' -o '+model_path_name+'.txt'+'" -q '+str(quantiles)+' -p '+str(pop_count)+' -t '+str(try_count)
+            params = {'locus':locus,'heritability':h,'minorAF':[m]*locus,'K':K if setK else None,'quantiles':quantiles,'pop_count':pop_count,'try_count':try_count}
 
-            if run_parallel:
-                job_ref = str(time.time())
-                job_path_name = job_dest+'/gametes_'+"H_"+str(h)+"_F_"+str(m)+'_'+job_ref+'_run.sh'
-                sh_file = open(job_path_name,'w')
-                sh_file.write('#!/bin/bash\n')
-                sh_file.write('#BSUB -q i2c2_normal'+'\n')
-                sh_file.write('#BSUB -J '+job_ref+'\n')
-                sh_file.write('#BSUB -R "rusage[mem=4G]"'+'\n')
-                sh_file.write('#BSUB -M 15GB'+'\n')
-                sh_file.write('#BSUB -o ' + log_dest+'/gametes_'+"H_"+str(h)+"_F_"+str(m)+'_'+job_ref+'.o\n')
-                sh_file.write('#BSUB -e ' + log_dest+'/gametes_'+"H_"+str(h)+"_F_"+str(m)+'_'+job_ref+'.e\n')
-                sh_file.write(filewrite)
-                sh_file.close()
-                os.system('bsub < '+job_path_name)
-                pass
-            else:
-                os.system(filewrite)
+            jobs.append(Job('gametes_'+"H_"+str(h)+"_F_"+str(m),filewrite,'models',outputs=[model_path_name+'_Models.txt',model_path_name+'_Scores.txt'],params=params))
 
-def epistasis_2_locus_core_data(output_path,archive_name,model_dest,job_dest,log_dest,run_parallel,this_file_path):
+def epistasis_2_locus_core_data(output_path,archive_name,model_dest,this_file_path,jobs):
     #Model parameters needed
+    locus = 2
     heritability = [0.05, 0.1, 0.2, 0.4]
     minorAF = [0.2]
     K = 0.3  #population prevelance
+    quantiles = 2 #number of models in each model file (one dataset per model)
     #Define dataset parameters
     data_name = 'gametes_2way_epistasis'
     samplesize = [200, 400, 800, 1600] #[200, 400, 800, 1600, 3200, 6400] #assumes balanced datasets (#cases = #controls)
@@ -112,10 +115,6 @@ def epistasis_2_locus_core_data(output_path,archive_name,model_dest,job_dest,log
     AF_Max = 0.5
     replicates = 30 #100
 
-    #Make dataset folder
-    if not os.path.exists(output_path+'/'+archive_name+'/'+data_name):
-        os.mkdir(output_path+'/'+archive_name+'/'+data_name)
-
     #Generate datasets and folders
     for n in numberofattributes:
         for s in samplesize:
@@ -127,23 +126,8 @@ def epistasis_2_locus_core_data(output_path,archive_name,model_dest,job_dest,log
                     #Create gametes run command
                     filewrite = 'java -jar '+this_file_path+'/gametes_2.2_dev.jar -i '+modelFile+' -D "-n '+str(AF_Min)+' -x '+str(AF_Max)+' -a '+str(n)+' -s '+str(int(s/2))+' -w '+str(int(s/2))+' -r '+str(replicates)+' -o '+str(genDataName)+'"'
 
-                    if run_parallel:
-                        job_ref = str(time.time())
-                        job_path_name = job_dest+'/gametes_'+'A_'+str(n)+'_S_'+str(s)+'_H_'+str(h)+'_F_'+str(m)+'_'+job_ref+'_run.sh'
-                        sh_file = open(job_path_name,'w')
-                        sh_file.write('#!/bin/bash\n')
-                        sh_file.write('#BSUB -q i2c2_normal'+'\n')
-                        sh_file.write('#BSUB -J '+job_ref+'\n')
-                        sh_file.write('#BSUB -R "rusage[mem=4G]"'+'\n')
-                        sh_file.write('#BSUB -M 15GB'+'\n')
-                        sh_file.write('#BSUB -o ' + log_dest+'/gametes_'+'A_'+str(n)+'_S_'+str(s)+'_H_'+str(h)+'_F_'+str(m)+'_'+job_ref+'.o\n')
-                        sh_file.write('#BSUB -e ' + log_dest+'/gametes_'+'A_'+str(n)+'_S_'+str(s)+'_H_'+str(h)+'_F_'+str(m)+'_'+job_ref+'.e\n')
-                        sh_file.write(filewrite)
-                        sh_file.close()
-                        os.system('bsub < '+job_path_name)
-                        pass
-                    else:
-                        os.system(filewrite)
+                    params = {'attributes':n,'samples':s,'replicates':replicates,'loci':locus,'models':1,'quantiles':quantiles,'heritability':h,'minorAF':m,'K':K}
+                    jobs.append(Job('gametes_'+'A_'+str(n)+'_S_'+str(s)+'_H_'+str(h)+'_F_'+str(m),filewrite,data_name,inputs=[modelFile],outputs=dataset_files(genDataName,quantiles,replicates),params=params))
 
 ######################################
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+"""
+Description: Adaptive try budgets for model searches. The generator functions give every -M search a fixed try count
+(10000000 for 1 and 2 loci, 100000000 for 3), which easy searches never need and hard ones (high heritability, low MAF,
+more loci) may still exhaust. With --adaptive-tries, that count becomes a cap: each model search runs through this
+driver, which starts with a small budget (--start-tries, or the budget that last succeeded for the same parameters) and
+reruns the search with a budget --tries-factor times larger whenever too few models met the constraints, i.e. the search
+failed, its _Models.txt file is missing or holds fewer models than quantiles, or it found fewer valid models than the
+requested population (as the native engine reports, and the jar warns while still exiting 0). Every attempt is appended
+to a history file (default ~/.cache/gametes_archive_gen/try_budgets.jsonl, or $GAMETES_TRY_HISTORY), and later runs of
+the same search start at the budget that succeeded.
+
+Usage (added to model jobs automatically):
+python gametes_adaptive.py --key <key> --models-file <file> --quantiles Q --population P --start S --factor F --cap C --history <file> '<search command with {tries}>'
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import subprocess
+
+DEFAULT_TRY_HISTORY = os.environ.get('GAMETES_TRY_HISTORY',os.path.join(os.path.expanduser('~'),'.cache','gametes_archive_gen','try_budgets.jsonl'))
+DEFAULT_START_TRIES = 100000
+DEFAULT_TRIES_FACTOR = 10
+TRIES_PLACEHOLDER = '{tries}'
+TRY_OPTION = re.compile(r'(\s-t\s+)(\d+)')
+NATIVE_FOUND = re.compile(r'Model search: (\d+) valid model\(s\) in (\d+) tries')
+JAR_FOUND = re.compile(r'You asked for a population of (\d+) models?, but I only found (\d+)') #the jar still exits 0
+
+def add_adaptive_arguments(parser):
+    """ Command line options for adaptive model search budgets. """
+    parser.add_argument('--adaptive-tries',dest='adaptive_tries',action='store_true',help='start every model search with a small try budget and raise it only while too few models are found (the planned try count is the cap)')
+    parser.add_argument('--start-tries',dest='start_tries',type=int,help='with --adaptive-tries: first budget of a search with no recorded budget',default=DEFAULT_START_TRIES)
+    parser.add_argument('--tries-factor',dest='tries_factor',type=float,help='with --adaptive-tries: growth of the budget between attempts',default=DEFAULT_TRIES_FACTOR)
+    parser.add_argument('--try-history',dest='try_history',type=str,help='file recording the budget every model search needed',default=DEFAULT_TRY_HISTORY)
+
+def search_key(params):
+    """ Identity of a model search for the history: its parameters except the try count. """
+    keyed = dict((key,value) for key, value in params.items() if key != 'try_count')
+    return hashlib.sha256(json.dumps(keyed,sort_keys=True).encode()).hexdigest()[:16]
+
+def read_budgets(path):
+    """ Budget of the latest successful attempt of every search in the history, by key. """
+    budgets = {}
+    if not os.path.isfile(path):
+        return budgets
+    history_file = open(path)
+    for line in history_file:
+        try:
+            attempt = json.loads(line)
+        except ValueError:
+            continue
+        if attempt.get('succeeded'):
+            budgets[attempt['key']] = attempt['tries']
+    history_file.close()
+    return budgets
+
+def record_attempt(history,attempt):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(history)),exist_ok=True)
+        history_file = open(history,'a')
+        history_file.write(json.dumps(attempt,sort_keys=True)+'\n')
+        history_file.close()
+    except OSError as error:
+        print('Could not record the try budget in '+history+': '+str(error))
+
+def apply_adaptive_tries(jobs,options):
+    """ Run every model search through the adaptive driver, its planned try count (-t) becoming the cap and its first
+    budget the one recorded for the same search, else --start-tries. Only the search itself (the command up to the
+    first ' && ') is wrapped, so steps appended to it still run once. """
+    if not options.adaptive_tries:
+        return jobs
+    budgets = read_budgets(options.try_history)
+    adapted = 0
+    for job in jobs:
+        if job.group != 'models' or 'try_count' not in job.params:
+            continue
+        search, separator, rest = job.command.partition(' && ')
+        head, quote, options_tail = search.rpartition('"') #-t follows the quoted -M option string
+        match = TRY_OPTION.search(options_tail)
+        if match is None:
+            continue
+        cap = int(match.group(2))
+        key = search_key(job.params)
+        start = min(cap,budgets.get(key,options.start_tries))
+        template = head+quote+options_tail[:match.start(2)]+TRIES_PLACEHOLDER+options_tail[match.end(2):]
+        models_file = [output for output in job.outputs if output.endswith('_Models.txt')][0]
+        wrapped = sys.executable+' '+os.path.realpath(__file__)+' --key '+key+' --models-file '+models_file+' --quantiles '+str(job.params.get('quantiles',1))\
+                  +' --population '+str(job.params.get('pop_count',0))+' --start '+str(start)+' --factor '+str(options.tries_factor)+' --cap '+str(cap)\
+                  +' --history '+options.try_history+' '+shlex.quote(template)
+        job.command = wrapped+separator+rest
+        adapted += 1
+    if adapted:
+        print('Adaptive tries: '+str(adapted)+' model search(es) start small and grow by '+str(options.tries_factor)+'x up to their planned try count')
+    return jobs
+
+def count_models(path):
+    """ Number of models in a _Models.txt file (0 if it does not exist). """
+    if not os.path.isfile(path):
+        return 0
+    models_file = open(path)
+    count = len([line for line in models_file if line.startswith('Attribute names:')])
+    models_file.close()
+    return count
+
+def run_search(command,key,models_file,quantiles,population,start,factor,cap,history):
+    """ Run the search with growing budgets until it yields enough models or the cap is reached. Returns the exit status
+    of the last attempt (1 if it exited 0 without writing every model). """
+    tries = max(1,min(start,cap))
+    while True:
+        if os.path.isfile(models_file):
+            os.remove(models_file) #so a file left by an earlier attempt is never taken for this one's
+        started = time.time()
+        result = subprocess.run(command.replace(TRIES_PLACEHOLDER,str(tries)),shell=True,stdout=subprocess.PIPE,stderr=subprocess.STDOUT,universal_newlines=True)
+        sys.stdout.write(result.stdout)
+        sys.stdout.flush()
+        found = [int(count) for count, tried in NATIVE_FOUND.findall(result.stdout)]+[int(count) for asked, count in JAR_FOUND.findall(result.stdout)]
+        written = count_models(models_file)
+        complete = result.returncode == 0 and written >= quantiles
+        enough = complete and (not found or found[-1] >= population)
+        record_attempt(history,{'key':key,'model':os.path.basename(models_file),'tries':tries,'succeeded':enough or (complete and tries >= cap),
+                                'returncode':result.returncode,'models_written':written,'valid_found':found[-1] if found else None,
+                                'seconds':round(time.time()-started,1),'recorded':started})
+        if enough:
+            print('Adaptive tries: '+os.path.basename(models_file)+' found with a budget of '+str(tries)+' tries')
+            return 0
+        if tries >= cap:
+            if complete:
+                print('Adaptive tries: only '+str(found[-1])+' of '+str(population)+' models within the cap of '+str(cap)+' tries; keeping them')
+                return 0
+            print('Adaptive tries: no complete model file within the cap of '+str(cap)+' tries')
+            return result.returncode or 1
+        reason = 'exit '+str(result.returncode) if result.returncode else (str(written)+' of '+str(quantiles)+' models written' if written < quantiles else str(found[-1])+' of '+str(population)+' valid models')
+        tries = min(cap,int(tries*factor))
+        print('Adaptive tries: too few models ('+reason+'), retrying with '+str(tries)+' tries')
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run a GAMETES model search with a try budget that grows until enough models are found")
+    parser.add_argument('--key',dest='key',type=str,required=True,help='identity of the search in the history')
+    parser.add_argument('--models-file',dest='models_file',type=str,required=True,help='_Models.txt file the search writes')
+    parser.add_argument('--quantiles',dest='quantiles',type=int,default=1,help='models the file must hold')
+    parser.add_argument('--population',dest='population',type=int,default=0,help='valid models the search should find')
+    parser.add_argument('--start',dest='start',type=int,default=DEFAULT_START_TRIES,help='first try budget')
+    parser.add_argument('--factor',dest='factor',type=float,default=DEFAULT_TRIES_FACTOR,help='growth of the budget between attempts')
+    parser.add_argument('--cap',dest='cap',type=int,required=True,help='largest try budget')
+    parser.add_argument('--history',dest='history',type=str,default=DEFAULT_TRY_HISTORY,help='file recording every attempt')
+    parser.add_argument('command',help='search command, with '+TRIES_PLACEHOLDER+' in place of the try count')
+    options = parser.parse_args(argv[1:])
+    if options.factor <= 1:
+        parser.error('--factor must be greater than 1')
+    return run_search(options.command,options.key,options.models_file,options.quantiles,options.population,options.start,
+                      options.factor,options.cap,options.history)
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,316 @@
+"""
+Description: Batching of small jobs. Most cells of the smaller generators (e.g. 100 attributes x 200-1600 samples) finish
+in seconds, so JVM startup and scheduler dispatch cost more than the work itself. With --batch-minutes M, jobs predicted
+(by the cost model in gametes_resources.py) to take less than M minutes are packed, per generator output, into batch jobs
+of up to M predicted minutes. A batch worker runs its commands back to back. Every command keeps its own telemetry row,
+manifest record and status line, and the worker writes the exit status and run time of each command to
+<batch>.status.jsonl. By default (--batch-jvm cold) every GAMETES jar call still starts its own JVM. With --batch-jvm
+warm, jar calls are served by one JVM per batch: a small launcher class (compiled with javac on first use) calls the jar's
+main class for every command, and each command's java call is replaced by a client that sends the arguments to that JVM
+and relays the output and exit status. Where javac is missing or the warm JVM cannot be reached, the client runs java as
+before. Warm calls share the jar's static state, so warm is opt-in.
+
+Usage (batch worker and client, added to batched jobs automatically):
+python gametes_batch.py run <batch file>
+python gametes_batch.py call --jar <jar> [--jvm-option=<option> ...] -- <GAMETES arguments>
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import socket
+import shutil
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import subprocess
+from gametes_jobs import Job
+from gametes_resources import read_history, calibrate, estimate
+
+WARM_JVM_VARIABLE = 'GAMETES_WARM_JVM' #host:port of the batch's warm JVM, set by the worker for its commands
+JAR_CALL = re.compile(r'^java((?: -X\S+)*) -jar (\S+\.jar) ')
+
+LAUNCHER_SOURCE = """import java.io.*;
+import java.lang.reflect.*;
+import java.net.*;
+import java.nio.charset.StandardCharsets;
+
+/* Serves calls of a jar's main class in one JVM: each connection sends the argument count and one argument per line,
+   and gets back "<exit status> <output bytes>" and the output the call printed. "quit" stops the launcher. */
+public class GametesLauncher {
+    public static void main(String[] args) throws Exception {
+        Method main = Class.forName(args[0]).getMethod("main", String[].class);
+        ServerSocket server = new ServerSocket(0, 1, InetAddress.getLoopbackAddress());
+        System.out.println(server.getLocalPort());
+        System.out.flush();
+        PrintStream base = System.err;
+        while (true) {
+            Socket connection = server.accept();
+            BufferedReader request = new BufferedReader(new InputStreamReader(connection.getInputStream(), StandardCharsets.UTF_8));
+            String first = request.readLine();
+            if (first == null || first.equals("quit")) {
+                connection.close();
+                break;
+            }
+            String[] callArgs = new String[Integer.parseInt(first)];
+            for (int i = 0; i < callArgs.length; i++) {
+                callArgs[i] = request.readLine();
+            }
+            ByteArrayOutputStream captured = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(captured, true, "UTF-8");
+            System.setOut(capture);
+            System.setErr(capture);
+            int status = 0;
+            try {
+                main.invoke(null, (Object) callArgs);
+            } catch (InvocationTargetException error) {
+                error.getCause().printStackTrace(capture);
+                status = 1;
+            } catch (Throwable error) {
+                error.printStackTrace(capture);
+                status = 1;
+            } finally {
+                System.setOut(base);
+                System.setErr(base);
+            }
+            capture.flush();
+            byte[] output = captured.toByteArray();
+            OutputStream reply = connection.getOutputStream();
+            reply.write((status + " " + output.length + "\\n").getBytes(StandardCharsets.UTF_8));
+            reply.write(output);
+            reply.flush();
+            connection.close();
+        }
+        server.close();
+    }
+}
+"""
+
+def add_batch_arguments(parser):
+    """ Command line options for batching small jobs. """
+    parser.add_argument('--batch-minutes',dest='batch_minutes',type=float,help='pack jobs predicted to take less than this many minutes into batch jobs of up to this many minutes (0: no batching)',default=0)
+    parser.add_argument('--batch-size',dest='batch_size',type=int,help='maximum number of jobs in one batch',default=200)
+    parser.add_argument('--batch-jvm',dest='batch_jvm',type=str,help='start a JVM per GAMETES jar call of a batch (cold), or serve them all from one warm JVM (experimental: the calls share the jar\'s static state)',default='cold',choices=['warm','cold'])
+
+def batch_dir_for(job_dest):
+    """ Batch files live next to the job scripts, in <output_path>/temporary/jobs/batches. """
+    return os.path.join(job_dest,'batches')
+
+def warm_command(command):
+    """ Replace the GAMETES jar call a command starts with by the warm JVM client (same arguments). """
+    match = JAR_CALL.match(command)
+    if match is None:
+        return command
+    jvm_options = ''.join(' --jvm-option='+option for option in match.group(1).split())
+    return sys.executable+' '+os.path.realpath(__file__)+' call --jar '+match.group(2)+jvm_options+' -- '+command[match.end():]
+
+def plan_batches(jobs,options):
+    """ Assign every job predicted to take less than --batch-minutes to a batch (job.batch), packing the jobs of each
+    generator output (by model file, otherwise in planned order) up to --batch-minutes predicted minutes and --batch-size
+    jobs. Jobs left alone in their batch are not batched. Must run before add_telemetry_step (batched jobs do not add to
+    the resource history, since a warm JVM's memory is not their own); apply_batches then replaces the batched jobs with
+    batch jobs. """
+    if not options.batch_minutes:
+        return jobs
+    coefficients = calibrate(read_history(options.resource_history))
+    groups = {}
+    for job in jobs:
+        predicted = estimate(job,coefficients,getattr(options,'data_format','text'))
+        if predicted is not None and predicted['walltime_min'] < options.batch_minutes:
+            groups.setdefault(job.group,[]).append((job,predicted['walltime_min']))
+    for group, members in groups.items():
+        members.sort(key=lambda member: member[0].inputs) #jobs reading the same model share batches (stable sort)
+        batches = [[]]
+        minutes = 0.0
+        for job, predicted in members:
+            if batches[-1] and (minutes+predicted > options.batch_minutes or len(batches[-1]) >= options.batch_size):
+                batches.append([])
+                minutes = 0.0
+            batches[-1].append(job)
+            minutes += predicted
+        for k, batch in enumerate(batches):
+            if len(batch) < 2:
+                continue
+            for job in batch:
+                job.batch = group+'_batch-'+str(k+1)
+                if options.batch_jvm == 'warm':
+                    job.command = warm_command(job.command)
+    return jobs
+
+def apply_batches(jobs,batch_dir,dry_run=False):
+    """ Replace the jobs of every batch with one batch job running them back to back (see run_batch), reading every input
+    and writing every output of its jobs. Call once the job commands are complete (after add_record_step). """
+    batches = {}
+    planned = []
+    for job in jobs:
+        if job.batch is None:
+            planned.append(job)
+            continue
+        if job.batch not in batches:
+            batches[job.batch] = []
+            planned.append(job.batch)
+        batches[job.batch].append(job)
+    if not batches:
+        return jobs
+    if not dry_run:
+        os.makedirs(batch_dir,exist_ok=True)
+    for index, item in enumerate(planned):
+        if not isinstance(item,str):
+            continue
+        members = batches[item]
+        batch_path = os.path.join(batch_dir,item+'.json')
+        outputs = [output for job in members for output in job.outputs]
+        produced = set(outputs)
+        inputs = sorted(set(input_file for job in members for input_file in job.inputs if input_file not in produced))
+        batch = Job(item,sys.executable+' '+os.path.realpath(__file__)+' run '+batch_path,members[0].group,inputs=inputs,outputs=outputs,params={'jobs':len(members)})
+        requests = [job.resources for job in members]
+        if None not in requests:
+            batch.resources = {'memory_mb':max(request['memory_mb'] for request in requests),
+                               'memory_limit_mb':max(request['memory_limit_mb'] for request in requests),
+                               'walltime_min':sum(request['walltime_min'] for request in requests)}
+        if not dry_run:
+            jars = sorted(set(re.findall(r' call --jar (\S+)',' '.join(job.command for job in members))))
+            heaps = [int(size) for size in re.findall(r'--jvm-option=-Xmx(\d+)m',' '.join(job.command for job in members))]
+            description = {'name':item,'jar':jars[0] if jars else None,'jvm_options':['-Xmx'+str(max(heaps))+'m'] if heaps else [],
+                           'launcher_dir':os.path.join(batch_dir,'launcher'),'commands':[{'name':job.name,'command':job.command} for job in members]}
+            batch_file = open(batch_path,'w')
+            json.dump(description,batch_file,indent=1)
+            batch_file.close()
+        planned[index] = batch
+    print('Batching: '+str(sum(len(members) for members in batches.values()))+' small jobs in '+str(len(batches))+' batch jobs')
+    return planned
+
+def jar_main_class(jar):
+    """ Main class named in a jar's manifest. """
+    archive = zipfile.ZipFile(jar)
+    manifest = archive.read('META-INF/MANIFEST.MF').decode('utf-8')
+    archive.close()
+    return re.search(r'^Main-Class:\s*(\S+)',manifest,re.M).group(1)
+
+def compile_launcher(launcher_dir):
+    """ Folder holding the compiled launcher class (compiled once per launcher version), or None without javac. """
+    class_dir = os.path.join(launcher_dir,hashlib.sha256(LAUNCHER_SOURCE.encode()).hexdigest()[:12])
+    if os.path.isfile(os.path.join(class_dir,'GametesLauncher.class')):
+        return class_dir
+    javac = shutil.which('javac')
+    if javac is None:
+        return None
+    os.makedirs(launcher_dir,exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=launcher_dir)
+    source = open(os.path.join(build_dir,'GametesLauncher.java'),'w')
+    source.write(LAUNCHER_SOURCE)
+    source.close()
+    result = subprocess.run([javac,'-d',build_dir,source.name],stdout=subprocess.PIPE,stderr=subprocess.STDOUT,universal_newlines=True)
+    if result.returncode != 0:
+        print('Could not compile the warm JVM launcher: '+result.stdout.strip())
+        shutil.rmtree(build_dir)
+        return None
+    try:
+        os.rename(build_dir,class_dir)
+    except OSError: #compiled concurrently by another batch
+        shutil.rmtree(build_dir)
+    return class_dir
+
+def start_launcher(batch):
+    """ Start the warm JVM of a batch and return (process, address), or None if it cannot be started. """
+    class_dir = compile_launcher(batch['launcher_dir'])
+    if class_dir is None or shutil.which('java') is None:
+        return None
+    command = ['java']+batch['jvm_options']+['-cp',batch['jar']+os.pathsep+class_dir,'GametesLauncher',jar_main_class(batch['jar'])]
+    process = subprocess.Popen(command,stdout=subprocess.PIPE,universal_newlines=True)
+    port = process.stdout.readline().strip()
+    if not port.isdigit():
+        process.wait()
+        return None
+    return process, '127.0.0.1:'+port
+
+def stop_launcher(process,address):
+    host, port = address.rsplit(':',1)
+    try:
+        connection = socket.create_connection((host,int(port)),timeout=10)
+        connection.sendall(b'quit\n')
+        connection.close()
+        process.wait(timeout=10)
+    except (OSError,subprocess.TimeoutExpired):
+        process.kill()
+        process.wait()
+
+def run_batch(batch_path):
+    """ Run the commands of a batch one after the other, recording each one's exit status and run time in
+    <batch>.status.jsonl. Returns 1 if any command failed, so jobs waiting on the batch are held back. """
+    batch_file = open(batch_path)
+    batch = json.load(batch_file)
+    batch_file.close()
+    environment = dict(os.environ)
+    launcher = None
+    if batch['jar']:
+        launcher = start_launcher(batch)
+        if launcher is None:
+            print('No warm JVM for '+batch['name']+' (javac or java not found): every GAMETES call starts its own JVM')
+        else:
+            environment[WARM_JVM_VARIABLE] = launcher[1]
+    status_path = batch_path[:-len('.json')]+'.status.jsonl'
+    failed = 0
+    try:
+        for entry in batch['commands']:
+            started = time.time()
+            sys.stdout.flush()
+            returncode = subprocess.call(entry['command'],shell=True,env=environment)
+            seconds = time.time()-started
+            status_file = open(status_path,'a')
+            status_file.write(json.dumps({'name':entry['name'],'returncode':returncode,'started':started,'wall_s':seconds})+'\n')
+            status_file.close()
+            print(entry['name']+': '+('done' if returncode == 0 else 'FAILED ('+str(returncode)+')')+' in '+str(round(seconds,1))+'s')
+            failed += returncode != 0
+    finally:
+        if launcher is not None:
+            stop_launcher(*launcher)
+    print(batch['name']+': '+str(len(batch['commands'])-failed)+' of '+str(len(batch['commands']))+' commands completed successfully')
+    return 1 if failed else 0
+
+def call(jar,jvm_options,arguments):
+    """ Run one GAMETES call in the batch's warm JVM, relaying its output, and return its exit status. Falls back to a
+    java process of its own when no warm JVM is reachable. """
+    address = os.environ.get(WARM_JVM_VARIABLE)
+    if address and not any('\n' in argument for argument in arguments):
+        host, port = address.rsplit(':',1)
+        try:
+            connection = socket.create_connection((host,int(port)))
+            connection.sendall((str(len(arguments))+'\n'+''.join(argument+'\n' for argument in arguments)).encode('utf-8'))
+            reply = connection.makefile('rb')
+            header = reply.readline().split()
+            output = reply.read(int(header[1])) if len(header) == 2 else None
+            connection.close()
+        except OSError:
+            output = None
+        if output is not None:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(output)
+            sys.stdout.flush()
+            return int(header[0])
+        print('Warm JVM at '+address+' not reachable, starting java',file=sys.stderr)
+    sys.stdout.flush()
+    os.execvp('java',['java']+jvm_options+['-jar',jar]+arguments)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run batches of small GAMETES jobs, sharing one JVM")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    run = subparsers.add_parser('run',help='run the commands of a batch file back to back')
+    run.add_argument('batch',help='batch file (written by the archive scripts)')
+    call_parser = subparsers.add_parser('call',help='run one GAMETES call in the warm JVM of the enclosing batch')
+    call_parser.add_argument('--jar',dest='jar',type=str,required=True,help='GAMETES jar (used when no warm JVM is reachable)')
+    call_parser.add_argument('--jvm-option',dest='jvm_options',action='append',default=[],help='java option, e.g. --jvm-option=-Xmx2048m')
+    call_parser.add_argument('arguments',nargs=argparse.REMAINDER,help='-- followed by the GAMETES arguments')
+    options = parser.parse_args(argv[1:])
+
+    if options.command == 'run':
+        return run_batch(options.batch)
+    arguments = options.arguments[1:] if options.arguments[:1] == ['--'] else options.arguments
+    return call(options.jar,options.jvm_options,arguments)
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,288 @@
+"""
+Description: Benchmark harness for the archive generators. Every generator of gametes_full_archive_gen.py plans its jobs
+as usual into a scratch folder; the jobs are then scaled down (attributes, samples, replicates, and population/tries for
+model searches), passed through the same engine, storage format and compression steps as a real run, and executed one at
+a time. For every generator, engine combination and sweep point the harness records the wall time, CPU time, peak memory
+and bytes written (best of --repeat runs), for the native engine split into noise generation and file writing time, plus the startup time of an empty JVM when the jar is used, in a JSON results
+file. Given a baseline (an earlier results file) every case whose time, memory or output grew by more than --tolerance
+is reported as a regression and the command exits with status 1. With --record-history, every job run is also appended
+to a resource history (see gametes_resources.py), so these small runs calibrate the cost model of --resources estimate
+and --plan-only.
+
+Usage:
+python gametes_benchmark.py run --output results.json [--baseline baseline.json] [--engines gametes,native] [--model-engines native]
+    [--data-formats text,packed] [--compress none,gzip] [--attributes 100,1000] [--samples 400] [--replicates 2] [--repeat 3]
+    [--generators univariate_core_data,epistasis_2_locus_hetero_data,...] [--record-history <file>]
+python gametes_benchmark.py compare results.json baseline.json [--tolerance 0.25]
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import itertools
+import gametes_full_archive_gen
+from gametes_jobs import dataset_files, apply_engine, apply_format, available_cores
+from gametes_compress import apply_compression, zstandard
+from gametes_resources import run_measured, record_usage, job_kind, job_engine, job_features
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+MODEL_GENERATORS = ['univariate_core_model','epistasis_2_locus_core_model','epistasis_3_locus_model']
+DATA_GENERATORS = ['univariate_core_data','epistasis_2_locus_core_data','epistasis_3_locus_data','epistasis_2_locus_hetero_data',
+                   'epistasis_2_locus_additive_data','univariate_2_locus_hetero_data','univariate_2_locus_additive_data',
+                   'univariate_4_locus_hetero_data','univariate_4_locus_additive_data','epistasis_2_locus_imbalanced_data',
+                   'epistasis_2_locus_quantitative_data','epistasis_2_locus_numfeatures_data']
+METRICS = ['wall_s','cpu_s','noise_s','write_s','max_rss_mb','bytes_written']
+MIN_CHANGE = {'wall_s':0.5,'cpu_s':0.5,'noise_s':0.5,'write_s':0.5,'max_rss_mb':16.0,'bytes_written':0} #smaller changes are treated as noise
+NATIVE_TIMING = re.compile(r'Timing: noise_s=([\d.]+) write_s=([\d.]+)') #printed by gametes_native.py
+
+def comma_list(value):
+    return [item for item in value.split(',') if item]
+
+def comma_ints(value):
+    return [int(item) for item in comma_list(value)]
+
+def generator_jobs(name,output_path,model_dest):
+    """ The jobs a generator of gametes_full_archive_gen.py plans for an archive named 'benchmark' under output_path. """
+    os.makedirs(os.path.join(output_path,'benchmark'),exist_ok=True)
+    os.makedirs(model_dest,exist_ok=True)
+    jobs = []
+    getattr(gametes_full_archive_gen,name)(output_path,'benchmark',model_dest,THIS_DIR,jobs)
+    return jobs
+
+def scale_model_job(job,pop_count,try_count):
+    """ Shrink a model search to pop_count models in at most try_count tries. """
+    head, tail = job.command.rsplit('"',1)
+    tail = re.sub(r' -p \d+',' -p '+str(pop_count),tail)
+    tail = re.sub(r' -t \d+',' -t '+str(try_count),tail)
+    job.command = head+'"'+tail
+    job.params.update({'pop_count':pop_count,'try_count':try_count})
+    return job
+
+def scale_data_job(job,attributes,samples,replicates):
+    """ Shrink a dataset job to the given attributes, samples and replicates. The case/control ratio of imbalanced data
+    is kept, and the expected outputs are planned again. """
+    match = re.search(r'-D "([^"]*)"',job.command)
+    options = match.group(1)
+    options = re.sub(r'-a \d+','-a '+str(attributes),options)
+    options = re.sub(r'-r \d+','-r '+str(replicates),options)
+    if re.search(r'-t \d+',options):
+        options = re.sub(r'-t \d+','-t '+str(samples),options)
+    else:
+        cases = int(re.search(r'-s (\d+)',options).group(1))
+        controls = int(re.search(r'-w (\d+)',options).group(1))
+        scaled_cases = int(round(samples*cases/float(cases+controls)))
+        options = re.sub(r'-s \d+','-s '+str(scaled_cases),options)
+        options = re.sub(r'-w \d+','-w '+str(samples-scaled_cases),options)
+    job.command = job.command[:match.start(1)]+options+job.command[match.end(1):]
+    job.params.update({'attributes':attributes,'samples':samples,'replicates':replicates})
+    gen_data_name = re.search(r'-o (\S+)',options).group(1)
+    job.outputs = dataset_files(gen_data_name,job.params.get('quantiles',1),replicates)
+    return job
+
+def select_cells(jobs,cells):
+    """ The first cells distinct jobs (scaling makes cells that only differed in size identical). """
+    selected = []
+    commands = set()
+    for job in jobs:
+        if job.command not in commands:
+            commands.add(job.command)
+            selected.append(job)
+    return selected[:cells]
+
+class JobProbe:
+    """ A bare command measured like a job (used for the JVM startup time). """
+    def __init__(self,name,command):
+        self.name = name
+        self.command = command
+        self.outputs = []
+
+def run_case(jobs,log_dir,repeat,history=None):
+    """ Run the jobs one after the other, repeat times, and return the metrics of the fastest repetition. With history,
+    the usage of every job run is appended to that resource history. """
+    os.makedirs(log_dir,exist_ok=True)
+    best = None
+    for attempt in range(repeat):
+        totals = {'wall_s':0.0,'cpu_s':0.0,'max_rss_mb':0.0,'failed':0}
+        for job in jobs:
+            out_file = open(os.path.join(log_dir,job.name+'.o'),'w')
+            err_file = open(os.path.join(log_dir,job.name+'.e'),'w')
+            started = time.time()
+            returncode, usage = run_measured(job.command,out_file,err_file)
+            if history is not None and job_features(job) is not None:
+                record_usage(history,job_kind(job),job_engine(job),job_features(job),returncode,usage,started)
+            out_file.close()
+            err_file.close()
+            timing = NATIVE_TIMING.search(open(os.path.join(log_dir,job.name+'.o')).read())
+            if timing:
+                totals['noise_s'] = totals.get('noise_s',0.0)+float(timing.group(1))
+                totals['write_s'] = totals.get('write_s',0.0)+float(timing.group(2))
+            totals['wall_s'] += usage['wall_s']
+            totals['cpu_s'] += usage['cpu_s']
+            totals['max_rss_mb'] = max(totals['max_rss_mb'],usage['max_rss_mb'])
+            if returncode != 0:
+                totals['failed'] += 1
+                print('FAILED '+job.name+' (exit '+str(returncode)+', see '+log_dir+')')
+        if best is None or totals['wall_s'] < best['wall_s']:
+            best = totals
+    best['bytes_written'] = sum(os.path.getsize(output) for job in jobs for output in job.outputs if os.path.isfile(output))
+    best['jobs'] = len(jobs)
+    return best
+
+def case_key(case):
+    fields = [case['generator']]
+    for field in ('engine','model_engine','data_format','compress','attributes','samples','replicates','pop_count','try_count'):
+        if field in case:
+            fields.append(field+'='+str(case[field]))
+    return ' '.join(fields)
+
+def record_case(cases,case,metrics):
+    case.update(metrics)
+    case['key'] = case_key(case)
+    cases.append(case)
+    print(case['key']+': '+'%.2fs wall, %.2fs CPU, %.0f MB peak, %d bytes' % (case['wall_s'],case['cpu_s'],case['max_rss_mb'],case['bytes_written'])
+          +(' (noise %.2fs, writing %.2fs)' % (case['noise_s'],case['write_s']) if 'noise_s' in case else '')
+          +(' ('+str(case['failed'])+' failed)' if case.get('failed') else ''))
+
+def available_engines(engines):
+    """ Drop the jar engine when no java is installed. """
+    if 'gametes' in engines and shutil.which('java') is None:
+        print('java not found: skipping the GAMETES jar engine')
+        return [engine for engine in engines if engine != 'gametes']
+    return engines
+
+def run_benchmark(options):
+    """ Run every selected generator for every engine combination and sweep point. Returns the list of cases. """
+    engines = available_engines(options.engines)
+    model_engines = available_engines(options.model_engines)
+    data_generators = [name for name in options.generators if name in DATA_GENERATORS]
+    model_generators = [name for name in options.generators if name in MODEL_GENERATORS]
+    unknown = set(options.generators)-set(DATA_GENERATORS)-set(MODEL_GENERATORS)
+    if unknown:
+        raise ValueError('Unknown generator(s): '+', '.join(sorted(unknown)))
+    cases = []
+    if options.work_dir:
+        os.makedirs(options.work_dir,exist_ok=True)
+    root = tempfile.mkdtemp(prefix='gametes_benchmark_',dir=options.work_dir)
+    try:
+        if 'gametes' in engines+model_engines:
+            record_case(cases,{'generator':'jvm_startup'},run_case([JobProbe('jvm_startup','java -version')],os.path.join(root,'logs'),options.repeat))
+        for model_engine in model_engines:
+            #Every model generator runs (the dataset generators need its models); only the selected ones are recorded
+            model_dest = os.path.join(root,'models_'+model_engine)
+            for name in MODEL_GENERATORS:
+                jobs = [scale_model_job(job,options.pop_count,options.try_count) for job in generator_jobs(name,root,model_dest)]
+                metrics = run_case(apply_engine(jobs,'gametes',model_engine),os.path.join(root,'logs',name),options.repeat,options.record_history)
+                if name in model_generators:
+                    record_case(cases,{'generator':name,'model_engine':model_engine,'pop_count':options.pop_count,'try_count':options.try_count},metrics)
+            for engine, data_format, compress in itertools.product(engines,options.data_formats,options.compress):
+                for attributes, samples in itertools.product(options.attributes,options.samples):
+                    output_path = os.path.join(root,'data')
+                    for name in data_generators:
+                        jobs = [scale_data_job(job,attributes,samples,options.replicates) for job in generator_jobs(name,output_path,model_dest)]
+                        jobs = select_cells(jobs,options.cells)
+                        jobs = apply_engine(jobs,engine,model_engine,options.chunk_mb)
+                        jobs = apply_format(jobs,data_format)
+                        jobs = apply_compression(jobs,compress,options.compress_jobs)
+                        metrics = run_case(jobs,os.path.join(root,'logs',name),options.repeat,options.record_history)
+                        record_case(cases,{'generator':name,'engine':engine,'model_engine':model_engine,'data_format':data_format,'compress':compress,
+                                           'attributes':attributes,'samples':samples,'replicates':options.replicates},metrics)
+                    shutil.rmtree(output_path)
+    finally:
+        if options.keep:
+            print('Benchmark files kept in '+root)
+        else:
+            shutil.rmtree(root,ignore_errors=True)
+    return cases
+
+def write_results(path,cases,options):
+    results = {'created':time.strftime('%Y-%m-%d %H:%M:%S'),'host':platform.node(),'python':platform.python_version(),
+               'cores':available_cores(),'settings':dict((key,value) for key, value in vars(options).items() if key not in ('command','baseline','output')),
+               'cases':cases}
+    results_file = open(path,'w')
+    json.dump(results,results_file,indent=1,sort_keys=True)
+    results_file.close()
+    print('Results written to '+path)
+
+def load_results(path):
+    results_file = open(path)
+    results = json.load(results_file)
+    results_file.close()
+    return results
+
+def compare_results(cases,baseline_cases,tolerance):
+    """ Print every case slower, larger or failing more than in the baseline (beyond tolerance and the noise floor in
+    MIN_CHANGE). Returns the number of regressions. """
+    baseline = dict((case['key'],case) for case in baseline_cases)
+    regressions = 0
+    compared = 0
+    for case in cases:
+        before = baseline.get(case['key'])
+        if before is None:
+            continue
+        compared += 1
+        if case.get('failed',0) > before.get('failed',0):
+            print('REGRESSION '+case['key']+': '+str(case['failed'])+' failed job(s), baseline '+str(before.get('failed',0)))
+            regressions += 1
+        for metric in METRICS:
+            old, new = before.get(metric), case.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old*(1+tolerance) and new-old > MIN_CHANGE[metric]:
+                change = '+%.0f%%' % (100.0*(new-old)/old) if old else 'new'
+                print('REGRESSION '+case['key']+': '+metric+' '+('%.2f' % old)+' -> '+('%.2f' % new)+' ('+change+')')
+                regressions += 1
+    missing = set(baseline)-set(case['key'] for case in cases)
+    print('Compared '+str(compared)+' case(s) with the baseline: '+str(regressions)+' regression(s)'
+          +(', '+str(len(missing))+' baseline case(s) not run' if missing else ''))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark scaled-down runs of every GAMETES archive generator")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    run = subparsers.add_parser('run',help='run the benchmark and write a JSON results file')
+    run.add_argument('--output',dest='output',type=str,default='gametes_benchmark.json',help='results file')
+    run.add_argument('--baseline',dest='baseline',type=str,default=None,help='earlier results file to compare with')
+    run.add_argument('--tolerance',dest='tolerance',type=float,default=0.25,help='relative increase over the baseline reported as a regression')
+    run.add_argument('--generators',dest='generators',type=comma_list,default=MODEL_GENERATORS+DATA_GENERATORS,help='comma separated generator functions to benchmark (default: all)')
+    run.add_argument('--engines',dest='engines',type=comma_list,default=['gametes','native'],help='dataset engines (jar skipped without java)')
+    run.add_argument('--model-engines',dest='model_engines',type=comma_list,default=['gametes','native'],help='model search engines (jar skipped without java)')
+    run.add_argument('--data-formats',dest='data_formats',type=comma_list,default=['text'],help='dataset storage formats (text, packed, npy)')
+    run.add_argument('--compress',dest='compress',type=comma_list,default=['none'],help='dataset compression methods (none, gzip, zstd)')
+    run.add_argument('--compress-jobs',dest='compress_jobs',type=int,default=2,help='compression threads per job')
+    run.add_argument('--chunk-mb',dest='chunk_mb',type=float,default=None,help='memory budget of the native dataset writer')
+    run.add_argument('--attributes',dest='attributes',type=comma_ints,default=[100,1000],help='attribute counts swept')
+    run.add_argument('--samples',dest='samples',type=comma_ints,default=[400],help='sample counts swept')
+    run.add_argument('--replicates',dest='replicates',type=int,default=2,help='replicates per dataset cell')
+    run.add_argument('--cells',dest='cells',type=int,default=2,help='dataset cells run per generator')
+    run.add_argument('--pop-count',dest='pop_count',type=int,default=1000,help='models collected per model search')
+    run.add_argument('--try-count',dest='try_count',type=int,default=100000,help='candidate models tried per model search')
+    run.add_argument('--repeat',dest='repeat',type=int,default=1,help='repetitions of every case (the fastest is kept)')
+    run.add_argument('--work-dir',dest='work_dir',type=str,default=None,help='scratch folder (default: system temporary folder)')
+    run.add_argument('--record-history',dest='record_history',type=str,default=None,help='also append the usage of every job run to this resource history, calibrating the cost model (e.g. ~/.cache/gametes_archive_gen/resource_history.jsonl)')
+    run.add_argument('--keep',dest='keep',action='store_true',help='keep the generated files')
+    compare = subparsers.add_parser('compare',help='compare a results file with a baseline')
+    compare.add_argument('results',help='results file')
+    compare.add_argument('baseline',help='baseline results file')
+    compare.add_argument('--tolerance',dest='tolerance',type=float,default=0.25,help='relative increase reported as a regression')
+    options = parser.parse_args(argv[1:])
+
+    if options.command == 'compare':
+        return 1 if compare_results(load_results(options.results)['cases'],load_results(options.baseline)['cases'],options.tolerance) else 0
+    if 'zstd' in options.compress and zstandard is None:
+        parser.error('zstd compression needs the zstandard package (pip install zstandard)')
+    cases = run_benchmark(options)
+    write_results(options.output,cases,options)
+    regressions = 0
+    if options.baseline:
+        regressions = compare_results(cases,load_results(options.baseline)['cases'],options.tolerance)
+    return 1 if regressions or any(case.get('failed') for case in cases) else 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,374 @@
+"""
+Description: Compact binary storage of GAMETES datasets. A dataset <name>.txt is stored as two files:
+- <name>.gt2 (format 'packed'): genotypes 2-bit packed, four per byte, each sample (row) padded to a whole byte, or
+  <name>.npy (format 'npy'): genotypes as a (samples, attributes) uint8 NumPy array;
+- <name>.json: small header holding the attribute names, the columns of the model (predictive) loci, the Class column,
+  the Model label column of heterogeneous data (if any) and the generating parameters (model file(s), -D options,
+  quantile, replicate, seed and the model's heritability/K/MAFs where available).
+Datasets can be written this way directly by the native engine (--data-format), or existing GAMETES text output can be
+converted in bulk. Every conversion is verified by rendering the binary copy back to text and comparing it, value for
+value, with the original before the text file may be removed.
+
+Usage:
+python gametes_binary.py convert <archive, dataset folder or file> [...] [--format packed|npy] [--remove-text] [--jobs N]
+python gametes_binary.py to-text <name.json> [...]   (write the GAMETES text file back next to the binary copy)
+"""
+
+import sys
+import os
+import re
+import json
+import glob
+import shlex
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gametes_jobs import available_cores
+from gametes_compress import open_dataset_file, strip_compression
+
+FORMAT_VERSION = 1
+MODEL_LOCUS = re.compile(r'^M\d+P\d+$')
+DATASET_FILE = re.compile(r'_EDM-(\d+)_(\d+)\.txt(\.gz|\.zst)?$')
+
+def packed_width(columns):
+    """ Bytes per sample of a packed genotype row. """
+    return (columns+3)//4
+
+def pack_genotypes(genotypes):
+    """ Pack a (rows, columns) array of genotypes 0/1/2 into (rows, packed_width) bytes; column j sits in bits
+    2*(j%4)..2*(j%4)+1 of byte j//4. """
+    rows, columns = genotypes.shape
+    padded = np.zeros((rows,4*packed_width(columns)),dtype=np.uint8)
+    padded[:,:columns] = genotypes
+    padded = padded.reshape(rows,-1,4)
+    return padded[:,:,0] | (padded[:,:,1] << 2) | (padded[:,:,2] << 4) | (padded[:,:,3] << 6)
+
+def unpack_genotypes(packed,columns):
+    """ Inverse of pack_genotypes. """
+    rows = packed.shape[0]
+    unpacked = np.empty((rows,packed.shape[1],4),dtype=np.uint8)
+    for k in range(4):
+        unpacked[:,:,k] = (packed >> (2*k)) & 3
+    return unpacked.reshape(rows,-1)[:,:columns]
+
+def endpoint_values(tokens):
+    """ Class column for the header: integers when every value is written as an integer (case/control), otherwise the
+    original strings (continuous endpoints), so the text can be reproduced exactly. """
+    if all(re.match(r'^-?\d+$',token) and str(int(token)) == token for token in tokens):
+        return [int(token) for token in tokens]
+    return list(tokens)
+
+def model_loci(names):
+    return [i for i, name in enumerate(names) if MODEL_LOCUS.match(name)]
+
+class BinaryWriter:
+    """ Write one dataset in binary form a block of samples at a time. The header is written last, once the endpoint
+    is known, so an interrupted write never leaves a valid looking header behind. """
+    def __init__(self,base,names,samples,data_format='packed'):
+        self.base = base
+        self.names = list(names)
+        self.samples = samples
+        self.data_format = data_format
+        self.row = 0
+        if data_format == 'packed':
+            self.out = open(base+'.gt2','wb')
+        elif data_format == 'npy':
+            self.out = np.lib.format.open_memmap(base+'.npy',mode='w+',dtype=np.uint8,shape=(samples,len(self.names)))
+        else:
+            raise ValueError('Unknown binary format: '+str(data_format))
+
+    def write(self,genotypes):
+        if self.data_format == 'packed':
+            self.out.write(pack_genotypes(genotypes).tobytes())
+        else:
+            self.out[self.row:self.row+len(genotypes)] = genotypes
+        self.row += len(genotypes)
+
+    def close(self,endpoint,labels=None,params=None):
+        if self.data_format == 'packed':
+            self.out.close()
+        else:
+            self.out.flush()
+            del self.out
+        if self.row != self.samples:
+            raise ValueError(self.base+': wrote '+str(self.row)+' samples, expected '+str(self.samples))
+        header = {'format':self.data_format,'version':FORMAT_VERSION,'samples':self.samples,'attributes':self.names,
+                  'model_loci':model_loci(self.names),'class':endpoint_values(endpoint)}
+        if labels is not None:
+            header['model'] = list(labels)
+        header['params'] = params or {}
+        write_header(self.base,header)
+
+def write_header(base,header):
+    temp_path = base+'.json.tmp'+str(os.getpid())
+    header_file = open(temp_path,'w')
+    json.dump(header,header_file)
+    header_file.close()
+    os.replace(temp_path,base+'.json')
+
+def read_header(base):
+    """ Header of a binary dataset (base is the dataset path without extension, or its .json file). """
+    if base.endswith('.json'):
+        base = base[:-len('.json')]
+    header_file = open(base+'.json')
+    header = json.load(header_file)
+    header_file.close()
+    return header
+
+def load_genotypes(base,header=None):
+    """ Genotypes of a binary dataset as a (samples, attributes) uint8 array. """
+    if base.endswith('.json'):
+        base = base[:-len('.json')]
+    header = header or read_header(base)
+    columns = len(header['attributes'])
+    if header['format'] == 'npy':
+        return np.load(base+'.npy')
+    packed = np.fromfile(base+'.gt2',dtype=np.uint8).reshape(header['samples'],packed_width(columns))
+    return unpack_genotypes(packed,columns)
+
+def text_lines(base,block=256):
+    """ Render a binary dataset back to the lines of its GAMETES text file. """
+    if base.endswith('.json'):
+        base = base[:-len('.json')]
+    header = read_header(base)
+    genotypes = load_genotypes(base,header)
+    names = list(header['attributes'])
+    labels = header.get('model')
+    if labels is not None:
+        names.append('Model')
+    names.append('Class')
+    yield '\t'.join(names)+'\n'
+    for start in range(0,header['samples'],block):
+        rows = genotypes[start:start+block]
+        text = np.full((len(rows),2*rows.shape[1]),ord('\t'),dtype=np.uint8)
+        text[:,0::2] = rows+ord('0')
+        for i in range(len(rows)):
+            line = text[i].tobytes().decode()
+            if labels is not None:
+                line += labels[start+i]+'\t'
+            yield line+str(header['class'][start+i])+'\n'
+
+def parse_text_row(line,columns):
+    """ Genotypes (first columns values) and the remaining fields of one text row. Rows of single digit genotypes are
+    decoded directly from the bytes; anything else falls back to splitting. """
+    raw = np.frombuffer(line,dtype=np.uint8)
+    if len(raw) > 2*columns and (raw[1:2*columns:2] == 9).all():
+        genotypes = raw[0:2*columns:2]-ord('0')
+        if (genotypes <= 2).all():
+            return genotypes, line[2*columns:].decode().split()
+    fields = line.decode().split()
+    return np.array([int(value) for value in fields[:columns]],dtype=np.uint8), fields[columns:]
+
+def command_params(command):
+    """ Generating parameters recorded from a GAMETES/native dataset command: model file(s), weights, -D options and
+    seed. """
+    tokens = shlex.split(command.split(' && ')[0].split('; ')[0])
+    params = {'models':[],'weights':[]}
+    for i, token in enumerate(tokens[:-1]):
+        if token == '-i':
+            params['models'].append(tokens[i+1])
+        elif token == '-w':
+            params['weights'].append(float(tokens[i+1]))
+        elif token == '-D':
+            params['dataset'] = tokens[i+1]
+        elif token in ('-z','-r'):
+            #-z (native) or top-level -r (jar, as set by replicate shards and model races); -r inside -D is the replicate count
+            params['seed'] = int(tokens[i+1])
+    return params
+
+def model_summary(path,quantile):
+    """ Heritability, K and MAFs of one quantile of a model file, read from its header lines (None if unavailable). """
+    if not os.path.isfile(path):
+        return None
+    models = []
+    model_file = open(path)
+    for line in model_file:
+        if line.startswith('Attribute names:'):
+            models.append({})
+        elif models and line.startswith('Minor allele frequencies:'):
+            models[-1]['mafs'] = [float(value) for value in re.split(r'[\s,]+',line.split(':',1)[1].strip())]
+        elif models and line.startswith('K:'):
+            models[-1]['K'] = float(line.split(':',1)[1])
+        elif models and line.startswith('Heritability:'):
+            models[-1]['heritability'] = float(line.split(':',1)[1])
+    model_file.close()
+    if quantile > len(models):
+        return None
+    return models[quantile-1]
+
+def dataset_params(path,command_parameters):
+    """ Generating parameters of one dataset file: those of the command that wrote it, plus its quantile, replicate
+    and the summary of each generating model at that quantile. """
+    params = dict(command_parameters)
+    match = DATASET_FILE.search(path)
+    if match:
+        params['quantile'] = int(match.group(1))
+        params['replicate'] = int(match.group(2))
+        if params.get('models'):
+            params['model_summary'] = [model_summary(model,params['quantile']) for model in params['models']]
+    return params
+
+def archive_records(path):
+    """ Map every dataset planned in the completion manifest of the archive containing path (by file path without
+    extension, so text and binary outputs match) to the manifest record of the job that generated it (command,
+    params, ...). The manifest sits in <output_path>/temporary/manifest, next to the archive folders. """
+    records = {}
+    folder = os.path.realpath(path if os.path.isdir(path) else os.path.dirname(path))
+    while folder != os.path.dirname(folder):
+        manifest_dir = os.path.join(folder,'temporary','manifest')
+        if os.path.isdir(manifest_dir):
+            for record_path in glob.glob(os.path.join(manifest_dir,'*.json')):
+                try:
+                    record_file = open(record_path)
+                    record = json.load(record_file)
+                    record_file.close()
+                except ValueError:
+                    continue
+                for expected in record.get('expected',[]):
+                    records[os.path.splitext(strip_compression(os.path.realpath(expected)))[0]] = record
+            break
+        folder = os.path.dirname(folder)
+    return records
+
+def archive_commands(path):
+    """ Map every dataset planned in the completion manifest of the archive containing path to the command that
+    generated it (see archive_records). """
+    return dict((base,record.get('command','')) for base, record in archive_records(path).items())
+
+def convert_file(path,data_format='packed',params=None,remove_text=False,base=None):
+    """ Convert one GAMETES text dataset (possibly .gz/.zst compressed) to binary (next to it, or at base if given),
+    then verify the round trip.
+    Returns (path, error or None); the text file is removed only if remove_text is set and the binary copy reproduces
+    it exactly. """
+    base = base or strip_compression(path)[:-len('.txt')]
+    text_file = open_dataset_file(path,'rb')
+    names = text_file.readline().decode().rstrip('\r\n').split('\t')
+    samples = sum(1 for line in text_file if line.strip())
+    text_file.close()
+    text_file = open_dataset_file(path,'rb')
+    text_file.readline()
+    extra = [name for name in names if name in ('Model','Class')]
+    columns = len(names)-len(extra)
+    writer = BinaryWriter(base,names[:columns],samples,data_format)
+    endpoint = []
+    labels = [] if 'Model' in extra else None
+    block = []
+    row = 0
+    try:
+        for line in text_file:
+            if not line.strip():
+                continue
+            row += 1
+            genotypes, fields = parse_text_row(line.rstrip(b'\r\n'),columns)
+            if len(genotypes) != columns or len(fields) != len(extra):
+                raise ValueError(str(len(genotypes)+len(fields))+' fields, expected '+str(len(names)))
+            block.append(genotypes)
+            if labels is not None:
+                labels.append(fields[0])
+            endpoint.append(fields[-1])
+            if len(block) == 256:
+                writer.write(np.stack(block))
+                block = []
+        if block:
+            writer.write(np.stack(block))
+        writer.close(endpoint,labels,params)
+    except ValueError as error:
+        #Unparseable text: drop the partial binary copy and report the file instead of aborting the whole conversion
+        text_file.close()
+        partial = base+('.gt2' if data_format == 'packed' else '.npy')
+        if os.path.exists(partial):
+            os.remove(partial)
+        return path, 'row '+str(row)+': '+str(error)
+    text_file.close()
+    error = verify_file(path,base)
+    if error is None and remove_text:
+        os.remove(path)
+    return path, error
+
+def verify_file(path,base):
+    """ Compare a text dataset with the text rendered from its binary copy, field by field (line endings and trailing
+    whitespace aside). Returns None if identical, otherwise a description of the first difference. """
+    text_file = open_dataset_file(path)
+    rendered = text_lines(base)
+    line_number = 0
+    for line in text_file:
+        if not line.strip():
+            continue
+        line_number += 1
+        expected = next(rendered,None)
+        if expected is None or line.split() != expected.split():
+            text_file.close()
+            return 'line '+str(line_number)+' differs after conversion'
+    text_file.close()
+    if next(rendered,None) is not None:
+        return 'binary copy has more lines than the text file'
+    return None
+
+def dataset_text_files(paths):
+    """ Every GAMETES dataset text file under the given archives, folders or files. """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [name for name in dirs if not name.startswith('.')]
+                files.extend(os.path.join(root,name) for name in sorted(names) if DATASET_FILE.search(name))
+        elif DATASET_FILE.search(path) or path.endswith('.txt'):
+            files.append(path)
+    return files
+
+def convert_archive(paths,data_format='packed',remove_text=False,workers=None):
+    """ Convert every text dataset under paths, one file per worker process. Returns the list of (path, error) of
+    the files that failed to convert or verify. """
+    files = dataset_text_files(paths)
+    commands = {}
+    for path in paths:
+        commands.update(archive_commands(path))
+    failed = []
+    executor = ProcessPoolExecutor(max_workers=workers or available_cores())
+    try:
+        futures = []
+        for path in files:
+            command = commands.get(os.path.splitext(os.path.realpath(path))[0])
+            params = dataset_params(path,command_params(command)) if command else dataset_params(path,{})
+            futures.append(executor.submit(convert_file,path,data_format,params,remove_text))
+        for future in futures:
+            path, error = future.result()
+            if error is not None:
+                print('FAILED '+path+': '+error)
+                failed.append((path,error))
+    finally:
+        executor.shutdown()
+    print('Converted '+str(len(files)-len(failed))+' of '+str(len(files))+' dataset(s) to '+data_format+' format')
+    return failed
+
+def write_text(base):
+    """ Write the GAMETES text file of a binary dataset back next to it. """
+    if base.endswith('.json'):
+        base = base[:-len('.json')]
+    out = open(base+'.txt','w')
+    for line in text_lines(base):
+        out.write(line)
+    out.close()
+    return base+'.txt'
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Convert GAMETES datasets between text and compact binary storage")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    convert = subparsers.add_parser('convert',help='convert text datasets to binary (verified round trip)')
+    convert.add_argument('paths',nargs='+',help='archive folders, dataset folders or dataset files')
+    convert.add_argument('--format',dest='data_format',type=str,default='packed',choices=['packed','npy'],help='2-bit packed genotypes (.gt2) or uint8 arrays (.npy)')
+    convert.add_argument('--remove-text',dest='remove_text',action='store_true',help='delete each text file once its binary copy is verified')
+    convert.add_argument('--jobs',dest='jobs',type=int,default=None,help='number of worker processes (default: all available cores)')
+    to_text = subparsers.add_parser('to-text',help='write the GAMETES text file of binary datasets back')
+    to_text.add_argument('headers',nargs='+',help='.json headers of binary datasets')
+    options = parser.parse_args(argv[1:])
+    if options.command == 'convert':
+        failed = convert_archive(options.paths,options.data_format,options.remove_text,options.jobs)
+        return 1 if failed else 0
+    for header in options.headers:
+        print(write_text(header))
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,173 @@
+"""
+Description: Compression of generated datasets as part of the run. With --compress gzip (or zstd, which needs the
+zstandard package), a compression step is appended to every dataset job, so each job's text files are compressed as
+soon as GAMETES has written them, while other jobs are still generating. Within a job the files are compressed on a
+bounded thread pool (--compress-jobs; zlib and zstd release the GIL). Every compressed file is decompressed and checked
+against the original (size and SHA-256) before the original is removed. The completion manifest expects the compressed
+names, and the readers (gametes_binary.py, gametes_reader.py, gametes_native.py --compare) open .txt.gz/.txt.zst
+files transparently. Binary formats (--data-format packed/npy) are left as they are.
+
+Usage (compression step, appended to dataset jobs automatically; also usable on an existing archive):
+python gametes_compress.py <archive, dataset folder or file> [...] [--method gzip|zstd] [--level L] [--jobs N]
+"""
+
+import sys
+import os
+import io
+import gzip
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+SUFFIXES = {'gzip':'.gz','zstd':'.zst'}
+DEFAULT_LEVELS = {'gzip':6,'zstd':3}
+DEFAULT_COMPRESS_JOBS = 2 #compression threads per job
+
+def add_compress_arguments(parser):
+    """ Command line options for compressing datasets during the run. """
+    parser.add_argument('--compress',dest='compress',type=str,help='compress each text dataset as soon as its job has written it (zstd needs the zstandard package)',default='none',choices=['none','gzip','zstd'])
+    parser.add_argument('--compress-jobs',dest='compress_jobs',type=int,help='compression threads per job',default=DEFAULT_COMPRESS_JOBS)
+
+def check_method(method):
+    if method == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression needs the zstandard package (pip install zstandard); use gzip instead')
+
+def compressed_name(path,method):
+    return path+SUFFIXES[method]
+
+def find_dataset_file(path):
+    """ The file actually holding the dataset path (<name>.txt): itself, or its .gz/.zst compressed version. Returns
+    path unchanged if none exists. """
+    for candidate in [path]+[path+suffix for suffix in SUFFIXES.values()]:
+        if os.path.isfile(candidate):
+            return candidate
+    return path
+
+def strip_compression(path):
+    """ Dataset path without its compression suffix ('x.txt.gz' -> 'x.txt'). """
+    for suffix in SUFFIXES.values():
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+def open_dataset_file(path,mode='r'):
+    """ Open a dataset file, decompressing .gz and .zst transparently. mode is 'r' (text) or 'rb'. """
+    for method, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            check_method(method)
+            reader = decompressing_reader(path,method)
+            return io.TextIOWrapper(reader) if mode == 'r' else reader
+    return open(path,mode)
+
+def decompressing_reader(path,method):
+    """ Binary reader decompressing path with method (used before the file has its final suffix). """
+    if method == 'gzip':
+        return gzip.open(path,'rb')
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path,'rb'),closefd=True))
+
+def file_digest(handle):
+    digest = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: handle.read(1 << 20),b''):
+        digest.update(block)
+        size += len(block)
+    handle.close()
+    return digest.hexdigest(), size
+
+def compress_file(path,method='gzip',level=None):
+    """ Compress one file, check that the result decompresses to the original and only then remove the original.
+    Returns (path, error or None). """
+    level = DEFAULT_LEVELS[method] if level is None else level
+    target = compressed_name(path,method)
+    temp_path = target+'.tmp'+str(os.getpid())
+    source = open(path,'rb')
+    out = open(temp_path,'wb')
+    if method == 'gzip':
+        writer = gzip.GzipFile(filename=os.path.basename(path),mode='wb',compresslevel=level,fileobj=out)
+    else:
+        writer = zstandard.ZstdCompressor(level=level).stream_writer(out,closefd=False)
+    digest = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: source.read(1 << 20),b''):
+        writer.write(block)
+        digest.update(block)
+        size += len(block)
+    writer.close()
+    out.close()
+    source.close()
+    original = (digest.hexdigest(),size)
+    try:
+        restored = file_digest(decompressing_reader(temp_path,method))
+    except (OSError,EOFError) as error:
+        restored = (str(error),-1)
+    if restored != original:
+        os.remove(temp_path)
+        return path, 'compressed copy does not decompress to the original'
+    os.replace(temp_path,target)
+    os.remove(path)
+    return path, None
+
+def uncompressed_text_files(paths):
+    """ Uncompressed dataset text files (…_EDM-<q>_<r>.txt) under the given folders or files. """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [name for name in dirs if name != 'temporary' and not name.startswith('.')]
+                files.extend(os.path.join(root,name) for name in sorted(names) if name.endswith('.txt') and '_EDM-' in name)
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
+def compress_paths(paths,method='gzip',level=None,workers=DEFAULT_COMPRESS_JOBS):
+    """ Compress every dataset text file under paths on a pool of worker threads. Returns the list of (path, error)
+    of the files that failed. """
+    check_method(method)
+    files = uncompressed_text_files(paths)
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=max(1,workers))
+    try:
+        for path, error in executor.map(lambda path: compress_file(path,method,level),files):
+            if error is not None:
+                print('FAILED '+path+': '+error)
+                failed.append((path,error))
+    finally:
+        executor.shutdown()
+    return failed
+
+def apply_compression(jobs,method,workers=DEFAULT_COMPRESS_JOBS):
+    """ Make every dataset job compress its text outputs as soon as it has written them, and expect the compressed
+    names in the manifest. Jobs with binary outputs (and model jobs) are left alone. """
+    if method == 'none':
+        return jobs
+    check_method(method)
+    for job in jobs:
+        texts = [output for output in job.outputs if output.endswith('.txt')]
+        if job.group == 'models' or not texts:
+            continue
+        folders = sorted(set(os.path.dirname(output) for output in texts))
+        job.command = job.command+' && '+sys.executable+' '+os.path.join(THIS_DIR,'gametes_compress.py')+' '+' '.join(folders)+' --method '+method+' --jobs '+str(workers)
+        job.outputs = [compressed_name(output,method) if output.endswith('.txt') else output for output in job.outputs]
+    return jobs
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compress GAMETES dataset text files, verifying each before removing the original")
+    parser.add_argument('paths',nargs='+',help='archive folders, dataset folders or dataset files')
+    parser.add_argument('--method',dest='method',type=str,default='gzip',choices=['gzip','zstd'],help='compression method')
+    parser.add_argument('--level',dest='level',type=int,default=None,help='compression level (default: 6 for gzip, 3 for zstd)')
+    parser.add_argument('--jobs',dest='jobs',type=int,default=DEFAULT_COMPRESS_JOBS,help='number of compression threads')
+    options = parser.parse_args(argv[1:])
+    if options.method == 'zstd' and zstandard is None:
+        parser.error('zstd compression needs the zstandard package (pip install zstandard); use gzip instead')
+    failed = compress_paths(options.paths,options.method,options.level,options.jobs)
+    return 1 if failed else 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
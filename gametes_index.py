@@ -0,0 +1,290 @@
+"""
+Description: Archive index. Scans an archive (models/, gametes_univariate/, gametes_2way_epi_2het/, ...) with one worker
+process per dataset and records per-dataset facts in a SQLite database, so downstream users query them instead of
+re-reading the text: rows and columns, case and control counts (or the mean of a continuous endpoint), the observed
+minor allele frequency of every attribute, the model loci and their observed MAFs, the file size and the generating
+parameters (from the completion manifest where available, otherwise from the cell folder name). Genotypes are read
+from the .npy sidecar or packed file when present, and text is parsed a block of rows at a time with NumPy. Model files
+get one row each with the heritability, K and MAFs of every quantile. Rebuilding only rescans files whose modification
+time or size changed, and drops rows of files that are gone.
+
+Usage (in Python):
+    from gametes_index import query_index, attribute_mafs
+    for row in query_index('/path/to/output/myArchive',generator='gametes_2way_epistasis',attributes=100,heritability=0.4):
+        row['path'], row['cases'], row['controls'], attribute_mafs(row)
+Usage (command line):
+python gametes_index.py build <archive or folder> [...] [--db <file>] [--jobs N]
+python gametes_index.py query <archive or index file> [--where key=value | key<value | ...] [--columns name ...]
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gametes_jobs import available_cores
+from gametes_binary import DATASET_FILE, MODEL_LOCUS, read_header, packed_width, unpack_genotypes, parse_text_row, model_summary, archive_records
+from gametes_compress import find_dataset_file, open_dataset_file
+from gametes_reader import archive_bases, sidecar_current
+
+INDEX_NAME = 'archive_index.sqlite'
+NAME_FIELDS = {'A':'attributes','S':'samples','L':'loci','H':'heritability','F':'minorAF','K':'K','W':'weight'}
+BLOCK_VALUES = 1 << 22 #genotypes parsed or unpacked at once
+
+SCHEMA = ["""CREATE TABLE IF NOT EXISTS datasets (
+    base TEXT PRIMARY KEY, path TEXT, generator TEXT, cell TEXT, quantile INTEGER, replicate INTEGER, format TEXT,
+    size INTEGER, mtime REAL, rows INTEGER, columns INTEGER, cases INTEGER, controls INTEGER, endpoint_mean REAL,
+    maf_min REAL, maf_mean REAL, maf BLOB, model_loci TEXT, model_maf TEXT, params TEXT, indexed REAL)""",
+          """CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY, name TEXT, size INTEGER, mtime REAL, params TEXT, quantiles TEXT, indexed REAL)"""]
+DATASET_COLUMNS = ['base','path','generator','cell','quantile','replicate','format','size','mtime','rows','columns','cases',
+                   'controls','endpoint_mean','maf_min','maf_mean','maf','model_loci','model_maf','params','indexed']
+
+def index_path_for(path):
+    """ The index of an archive lives in the archive folder, as archive_index.sqlite (path may be the index itself). """
+    if os.path.isdir(path):
+        return os.path.join(path,INDEX_NAME)
+    return path
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path,timeout=60)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+def name_params(name):
+    """ Parameters spelled out in a cell or model name (..._A_100_S_1600_L_2_H_0.4_F_0.2_K_0.3). """
+    params = {}
+    for key, value in re.findall(r'(?:^|_)([A-Z])_(-?\d+(?:\.\d+)?)(?=_|$)',name):
+        if key in NAME_FIELDS:
+            params[NAME_FIELDS[key]] = float(value) if '.' in value else int(value)
+    return params
+
+def primary_file(base):
+    """ The file holding a dataset's genotypes and its format: text (possibly compressed), packed or npy. """
+    text = find_dataset_file(base+'.txt')
+    if os.path.isfile(text):
+        return text, {'.gz':'gzip','.zst':'zstd'}.get(os.path.splitext(text)[1],'text')
+    if os.path.isfile(base+'.gt2'):
+        return base+'.gt2', 'packed'
+    return base+'.npy', 'npy'
+
+def text_blocks(path):
+    """ Attribute names, then (genotypes, class values) for blocks of rows of a GAMETES text file. Rows of single
+    digit genotypes are decoded in one NumPy operation per block; other rows fall back to parse_text_row. """
+    handle = open_dataset_file(path,'rb')
+    names = handle.readline().decode().split()
+    columns = len([name for name in names if name not in ('Class','Model')])
+    yield names[:columns]
+    block = max(1,BLOCK_VALUES//max(columns,1))
+    lines = []
+    for line in handle:
+        lines.append(line)
+        if len(lines) == block:
+            yield parse_block(lines,columns)
+            lines = []
+    if lines:
+        yield parse_block(lines,columns)
+    handle.close()
+
+def parse_block(lines,columns):
+    width = 2*columns
+    if all(len(line) > width for line in lines):
+        raw = np.frombuffer(b''.join(line[:width] for line in lines),dtype=np.uint8).reshape(len(lines),width)
+        genotypes = raw[:,0::2]-ord('0')
+        if (raw[:,1::2] == 9).all() and (genotypes <= 2).all():
+            return genotypes, [line[width:].split()[-1].decode() for line in lines]
+    rows = [parse_text_row(line,columns) for line in lines]
+    for genotypes, rest in rows:
+        if len(genotypes) != columns or not rest:
+            raise ValueError('truncated row ('+str(len(genotypes))+' of '+str(columns)+' genotypes'+('' if rest else ', no class')+')')
+    return np.array([genotypes for genotypes, rest in rows],dtype=np.uint8).reshape(len(rows),columns), [rest[-1] for genotypes, rest in rows]
+
+def binary_blocks(base,data_format):
+    """ Same as text_blocks for a packed or npy dataset (or a current .npy sidecar), reading its .json header. """
+    header = read_header(base)
+    columns = len(header['attributes'])
+    yield header['attributes']
+    if data_format == 'packed':
+        genotypes = np.memmap(base+'.gt2',dtype=np.uint8,mode='r',shape=(header['samples'],packed_width(columns)))
+    else:
+        genotypes = np.load(base+'.npy',mmap_mode='r')
+    block = max(1,BLOCK_VALUES//max(columns,1))
+    for start in range(0,header['samples'],block):
+        rows = genotypes[start:start+block]
+        yield (unpack_genotypes(rows,columns) if data_format == 'packed' else np.asarray(rows)), header['class'][start:start+block]
+
+def dataset_blocks(base):
+    """ (path, format, blocks) of a dataset: its primary file and the blocks of text_blocks or binary_blocks, reading a
+    current .npy sidecar in place of the text. """
+    path, data_format = primary_file(base)
+    if data_format in ('text','gzip','zstd') and not sidecar_current(base):
+        return path, data_format, text_blocks(path)
+    return path, data_format, binary_blocks(base,'packed' if data_format == 'packed' else 'npy')
+
+def scan_dataset(item):
+    """ Statistics of one dataset, as a row of the datasets table. item is (base, params recorded for it). """
+    base, params = item
+    path, data_format, blocks = dataset_blocks(base)
+    stat = os.stat(path)
+    names = next(blocks)
+    allele_counts = np.zeros(len(names),dtype=np.int64)
+    classes = []
+    rows = 0
+    for genotypes, endpoint in blocks:
+        allele_counts += genotypes.sum(axis=0,dtype=np.int64)
+        classes.extend(endpoint)
+        rows += len(genotypes)
+    frequency = allele_counts/(2.0*rows) if rows else np.zeros(len(names))
+    maf = np.minimum(frequency,1-frequency).astype(np.float32)
+    values = [float(value) for value in classes]
+    case_control = all(value in (0.0,1.0) for value in values)
+    loci = [i for i, name in enumerate(names) if MODEL_LOCUS.match(name)]
+    cell = os.path.basename(os.path.dirname(base))
+    generator = os.path.basename(os.path.dirname(os.path.dirname(base)))
+    match = DATASET_FILE.search(base+'.txt')
+    params = dict(name_params(cell[len(generator):]),**params)
+    params.update(quantile=int(match.group(1)),replicate=int(match.group(2)))
+    return {'base':base,'path':path,'generator':generator,'cell':cell,'quantile':params['quantile'],'replicate':params['replicate'],
+            'format':data_format,'size':stat.st_size,'mtime':stat.st_mtime,'rows':rows,'columns':len(names),
+            'cases':values.count(1.0) if case_control else None,'controls':values.count(0.0) if case_control else None,
+            'endpoint_mean':None if case_control or not values else sum(values)/len(values),
+            'maf_min':float(maf.min()) if len(maf) else None,'maf_mean':float(maf.mean()) if len(maf) else None,'maf':maf.tobytes(),
+            'model_loci':json.dumps([names[i] for i in loci]),'model_maf':json.dumps([round(float(maf[i]),6) for i in loci]),
+            'params':json.dumps(params,sort_keys=True),'indexed':time.time()}
+
+def scan_model(path):
+    """ One row of the models table: the name parameters and the summary of every quantile of a _Models.txt file. """
+    quantiles = []
+    while True:
+        summary = model_summary(path,len(quantiles)+1)
+        if summary is None:
+            break
+        quantiles.append(summary)
+    stat = os.stat(path)
+    name = os.path.basename(path)[:-len('_Models.txt')]
+    return (path,name,stat.st_size,stat.st_mtime,json.dumps(name_params(name),sort_keys=True),json.dumps(quantiles),time.time())
+
+def scan_errors(item):
+    """ scan_dataset for a worker process: (row, None) or (None, error message). """
+    try:
+        return scan_dataset(item), None
+    except (IOError,OSError,ValueError,KeyError,IndexError) as error:
+        return None, item[0]+': '+str(error)
+
+def archive_models(paths):
+    """ Every _Models.txt file in a models folder under the given archives or folders. """
+    models = []
+    for path in paths:
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [name for name in dirs if name != 'temporary' and not name.startswith('.')]
+            if os.path.basename(root) == 'models':
+                models.extend(os.path.join(root,name) for name in sorted(names) if name.endswith('_Models.txt'))
+    return models
+
+def build_index(paths,db_path,workers=None):
+    """ Index every dataset and model file under paths, rescanning only files that are new or whose modification time
+    or size changed, and dropping rows of files under paths that are gone. Returns the number of datasets that could not
+    be indexed. """
+    paths = [os.path.realpath(path) for path in paths]
+    connection = connect(db_path)
+    known = dict((row[0],(row[1],row[2],row[3])) for row in connection.execute('SELECT base, path, size, mtime FROM datasets'))
+    records = {}
+    for path in paths:
+        records.update(archive_records(path))
+    bases = [os.path.realpath(base) for base in archive_bases(paths)]
+    pending = []
+    for base in bases:
+        path = primary_file(base)[0]
+        stat = os.stat(path)
+        if known.get(base) != (path,stat.st_size,stat.st_mtime):
+            pending.append((base,records.get(base,{}).get('params',{})))
+    inside = lambda path: any(path == root or path.startswith(root+os.sep) for root in paths)
+    current = set(bases)
+    gone = [base for base in known if inside(base) and base not in current]
+    connection.executemany('DELETE FROM datasets WHERE base = ?',[(base,) for base in gone])
+
+    failed = 0
+    insert = 'INSERT OR REPLACE INTO datasets ('+','.join(DATASET_COLUMNS)+') VALUES ('+','.join('?'*len(DATASET_COLUMNS))+')'
+    executor = ProcessPoolExecutor(max_workers=workers or available_cores())
+    try:
+        for count, (row, error) in enumerate(executor.map(scan_errors,pending,chunksize=8)):
+            if error is not None:
+                print('FAILED '+error)
+                failed += 1
+                continue
+            connection.execute(insert,[row[column] for column in DATASET_COLUMNS])
+            if count % 500 == 499:
+                connection.commit()
+    finally:
+        executor.shutdown()
+
+    known_models = dict((row[0],(row[1],row[2])) for row in connection.execute('SELECT path, size, mtime FROM models'))
+    models = archive_models(paths)
+    changed = [path for path in models if known_models.get(path) != (os.path.getsize(path),os.path.getmtime(path))]
+    connection.executemany('INSERT OR REPLACE INTO models VALUES (?,?,?,?,?,?,?)',[scan_model(path) for path in changed])
+    current = set(models)
+    connection.executemany('DELETE FROM models WHERE path = ?',[(path,) for path in known_models if inside(path) and path not in current])
+    connection.commit()
+    connection.close()
+    print('Index '+db_path+': '+str(len(pending)-failed)+' of '+str(len(bases))+' dataset(s) and '+str(len(changed))+' of '+str(len(models))
+          +' model file(s) (re)scanned, '+str(len(gone))+' removed')
+    return failed
+
+CONDITION = re.compile(r'^(\w+)\s*(<=|>=|!=|=|<|>)\s*(.+)$')
+
+def query_index(path,conditions=(),**equal):
+    """ Rows of the datasets table (as dicts) matching every condition. Conditions are 'key=value' strings (also <,
+    <=, >, >=, !=) or keyword arguments for equality; keys are table columns or generating parameters (attributes,
+    samples, heritability, minorAF, K, weight, ...). """
+    clauses = []
+    arguments = []
+    for key, operator, value in [CONDITION.match(condition).groups() for condition in conditions]+[(key,'=',value) for key, value in equal.items()]:
+        if isinstance(value,str):
+            try:
+                value = float(value) if re.match(r'^-?\d+\.\d*$',value) else int(value)
+            except ValueError:
+                pass
+        column = key if key in DATASET_COLUMNS else "json_extract(params,'$."+key+"')"
+        clauses.append(column+' '+operator+' ?')
+        arguments.append(value)
+    connection = connect(index_path_for(path))
+    connection.row_factory = sqlite3.Row
+    query = 'SELECT * FROM datasets'+(' WHERE '+' AND '.join(clauses) if clauses else '')+' ORDER BY base'
+    rows = [dict(row) for row in connection.execute(query,arguments)]
+    connection.close()
+    return rows
+
+def attribute_mafs(row):
+    """ Observed minor allele frequency of every attribute of an indexed dataset, as a float32 array. """
+    return np.frombuffer(row['maf'],dtype=np.float32)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Index the datasets and models of a GAMETES archive in SQLite")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    build = subparsers.add_parser('build',help='index new and changed datasets and models')
+    build.add_argument('paths',nargs='+',help='archive or dataset folders')
+    build.add_argument('--db',dest='db',type=str,default=None,help='index file (default: archive_index.sqlite in the first folder)')
+    build.add_argument('--jobs',dest='jobs',type=int,default=None,help='number of worker processes (default: all available cores)')
+    query = subparsers.add_parser('query',help='list indexed datasets matching conditions')
+    query.add_argument('path',help='archive folder or index file')
+    query.add_argument('--where',dest='where',nargs='+',default=[],help='conditions such as attributes=100 heritability>=0.2 generator=gametes_univariate')
+    query.add_argument('--columns',dest='columns',nargs='+',default=['rows','columns','cases','controls','maf_mean','model_loci'],help='columns shown after the path')
+    options = parser.parse_args(argv[1:])
+
+    if options.command == 'build':
+        return 1 if build_index(options.paths,options.db or index_path_for(options.paths[0]),options.jobs) else 0
+    for condition in options.where:
+        if not CONDITION.match(condition):
+            parser.error('Not a condition: '+condition)
+    for row in query_index(options.path,options.where):
+        print('\t'.join([row['path']]+[str(row.get(column,json.loads(row['params']).get(column))) for column in options.columns]))
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
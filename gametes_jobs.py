@@ -0,0 +1,200 @@
+"""
+Description: Job bookkeeping shared by the archive generation scripts. Generator functions describe each GAMETES run as a Job,
+which the scheduler backends in gametes_schedulers.py either submit to a cluster or run on a bounded pool of local worker processes.
+"""
+
+import sys
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+GAMETES_COMMAND = 'java -jar '+THIS_DIR+'/gametes_2.2_dev.jar' #as written by the generator functions
+NATIVE_COMMAND = sys.executable+' '+THIS_DIR+'/gametes_native.py' #same command line, NumPy implementation
+BINARY_COMMAND = sys.executable+' '+THIS_DIR+'/gametes_binary.py' #text to binary dataset converter
+
+class Job:
+    """ A single GAMETES command line, named after the model or dataset cell it produces. The group is the generator
+    output it belongs to ('models' or the dataset folder name) and is used to bundle jobs into job arrays. Inputs and
+    outputs are the files the command reads and writes; they are used to work out which jobs must wait for which. Params
+    holds the generating parameters of the cell (heritability, MAFs, ...). """
+    def __init__(self,name,command,group,inputs=None,outputs=None,params=None):
+        self.name = name
+        self.command = command
+        self.group = group
+        self.inputs = inputs or []
+        self.outputs = outputs or []
+        self.params = params or {}
+        self.depends = [] #jobs producing one of our inputs (see resolve_dependencies)
+        self.returncode = None #filled in once the job has run locally
+        self.resources = None #per-job memory/walltime request (see gametes_resources.apply_resources)
+        self.placement = None #shard folder, cell folder, replicate offset and count of a replicate shard (see gametes_shards)
+        self.batch = None #name of the batch job running this job together with other small jobs (see gametes_batch)
+
+def dataset_files(genDataName,quantiles,replicates):
+    """ Files written by a GAMETES -D run with output path genDataName: a folder of that name holding one file per model
+    quantile (EDM-1 ... EDM-quantiles) and replicate, with the replicate number zero padded to the width of the
+    replicate count, e.g. <genDataName>/<name>_EDM-1_01.txt. """
+    base = os.path.basename(genDataName)
+    width = len(str(replicates))
+    files = []
+    for q in range(1,quantiles+1):
+        for r in range(1,replicates+1):
+            files.append(genDataName+'/'+base+'_EDM-'+str(q)+'_'+str(r).zfill(width)+'.txt')
+    return files
+
+def apply_engine(jobs,engine,model_engine='gametes',chunk_mb=None):
+    """ Switch dataset jobs to the selected engine and model searches to the selected model engine ('gametes' jar or
+    'native' NumPy). The native engine takes the same arguments as the jar, so only the program being invoked changes.
+    Natively searched models are tagged in their params so they are never mixed up with jar models in the model cache.
+    chunk_mb, if given, sets the memory budget of the native dataset writer. """
+    for job in jobs:
+        selected = model_engine if job.group == 'models' else engine
+        if selected == 'native' and job.command.startswith(GAMETES_COMMAND+' '):
+            job.command = NATIVE_COMMAND+job.command[len(GAMETES_COMMAND):]
+            if job.group == 'models':
+                job.params['engine'] = 'native'
+            elif chunk_mb is not None:
+                job.command = job.command+' --chunk-mb '+str(chunk_mb)
+    return jobs
+
+def binary_files(path,data_format):
+    """ Files storing the dataset <name>.txt in a binary format (see gametes_binary.py): the genotypes and a .json
+    header. """
+    base = path[:-len('.txt')] if path.endswith('.txt') else path
+    return [base+('.gt2' if data_format == 'packed' else '.npy'),base+'.json']
+
+def apply_format(jobs,data_format):
+    """ Store datasets in a binary format ('packed' or 'npy') instead of GAMETES text. The native engine writes it
+    directly; jar output is converted (and verified) as soon as the jar finishes, and the text removed. Expected outputs
+    are switched to the binary files so the manifest checks the right ones. """
+    if data_format == 'text':
+        return jobs
+    for job in jobs:
+        if job.group == 'models':
+            continue
+        if job.command.startswith(NATIVE_COMMAND+' '):
+            job.command = job.command+' --data-format '+data_format
+        else:
+            folders = sorted(set(os.path.dirname(output) for output in job.outputs))
+            job.command = job.command+' && '+BINARY_COMMAND+' convert '+' '.join(folders)+' --format '+data_format+' --remove-text --jobs 1'
+        outputs = []
+        for output in job.outputs:
+            outputs.extend(binary_files(output,data_format))
+        job.outputs = outputs
+    return jobs
+
+def str2bool(value):
+    """ Argparse type for boolean flags given as text (e.g. --run-parallel False). """
+    if isinstance(value,bool):
+        return value
+    if value.lower() in ('true','t','yes','y','1'):
+        return True
+    if value.lower() in ('false','f','no','n','0'):
+        return False
+    raise ValueError('Boolean value expected, got: '+str(value))
+
+def available_cores():
+    """ Number of cores this process may run on (respects CPU affinity/cgroup pinning where the OS exposes it). """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def resolve_dependencies(jobs):
+    """ Link each job to the jobs in this run that produce its input files (e.g. a dataset job to the job generating the
+    _Models.txt file it reads). Inputs not produced by any planned job are assumed to exist already. """
+    producers = {}
+    for job in jobs:
+        for output in job.outputs:
+            producers[output] = job
+    for job in jobs:
+        job.depends = []
+        for input_file in job.inputs:
+            producer = producers.get(input_file)
+            if producer is not None and producer is not job and producer not in job.depends:
+                job.depends.append(producer)
+    return jobs
+
+def order_jobs(jobs):
+    """ Return jobs in an order where every job comes after the jobs it depends on, otherwise keeping the planned order. """
+    ordered = []
+    placed = set()
+    visiting = set()
+    def place(job):
+        if id(job) in placed:
+            return
+        if id(job) in visiting:
+            raise ValueError('Circular job dependency involving '+job.name)
+        visiting.add(id(job))
+        for dependency in job.depends:
+            place(dependency)
+        visiting.discard(id(job))
+        placed.add(id(job))
+        ordered.append(job)
+    for job in jobs:
+        place(job)
+    return ordered
+
+def job_depth(job):
+    """ Number of dependency levels above a job (0 for jobs that can start immediately). """
+    if not job.depends:
+        return 0
+    return 1+max(job_depth(dependency) for dependency in job.depends)
+
+def run_local_job(job,log_dest):
+    """ Run one job to completion, sending its output to per-job log files, and record its exit code. """
+    out_file = open(log_dest+'/'+job.name+'.o','w')
+    err_file = open(log_dest+'/'+job.name+'.e','w')
+    try:
+        job.returncode = subprocess.call(job.command,shell=True,stdout=out_file,stderr=err_file)
+    finally:
+        out_file.close()
+        err_file.close()
+    return job
+
+def run_local_jobs(jobs,log_dest,n_jobs=None):
+    """ Run jobs on this machine with at most n_jobs running at any one time and return the jobs that failed.
+
+    Every job is its own java (or shell) child process, so the pool only needs lightweight threads to launch and wait
+    on them; the concurrency bound is what keeps the machine from being oversubscribed. A job is started as soon as all
+    the jobs it depends on have succeeded, and is skipped (counted as failed) if any of them failed.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = available_cores()
+    print('Running '+str(len(jobs))+' jobs locally on '+str(n_jobs)+' workers')
+    failed = []
+    finished = {} #id(job) -> True if the job succeeded
+    pending = list(jobs)
+    running = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        while pending or running:
+            #Start every job whose dependencies are done, up to the worker limit
+            progressed = False
+            for job in list(pending):
+                if len(running) >= n_jobs:
+                    break
+                if not all(id(dependency) in finished for dependency in job.depends):
+                    continue
+                pending.remove(job)
+                progressed = True
+                if not all(finished[id(dependency)] for dependency in job.depends):
+                    finished[id(job)] = False
+                    failed.append(job)
+                    print('SKIPPED (dependency failed): '+job.name)
+                    continue
+                running[pool.submit(run_local_job,job,log_dest)] = job
+            if not running:
+                if pending and not progressed:
+                    raise ValueError('Jobs depend on jobs that are not part of this run: '+', '.join(job.name for job in pending))
+                continue
+            done, not_done = wait(list(running),return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                future.result()
+                finished[id(job)] = job.returncode == 0
+                if job.returncode != 0:
+                    failed.append(job)
+                    print('FAILED ('+str(job.returncode)+'): '+job.name)
+    print(str(len(jobs)-len(failed))+' of '+str(len(jobs))+' jobs completed successfully')
+    return failed
@@ -0,0 +1,136 @@
+"""
+Description: Completion manifest that makes archive runs resumable. Every planned job gets a small JSON record under
+<output_path>/temporary/manifest holding its exact command, its inputs and its expected output files. A record step appended to
+the job command marks the job complete (with the size of every output) only if GAMETES succeeded and all outputs exist. On a rerun
+only missing, failed or stale jobs are scheduled, along with anything depending on them. Stale means the command changed, an
+output disappeared or changed size, or an input (e.g. a model file) is newer than the last completion. --force reruns everything.
+One file per job (rather than a single shared file) keeps concurrent cluster jobs from writing to the same file.
+
+Usage (record step, appended to jobs automatically):
+python gametes_manifest.py --manifest-dir <dir> --job <job name> --returncode <exit code of the GAMETES command>
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+from gametes_jobs import resolve_dependencies, order_jobs
+
+def add_manifest_arguments(parser):
+    """ Command line options for resumable runs. """
+    parser.add_argument('--force',dest='force',action='store_true',help='run every planned job, even those the completion manifest shows as complete')
+
+def manifest_dir_for(job_dest):
+    """ The manifest lives next to the job scripts, in <output_path>/temporary/manifest. """
+    return os.path.join(os.path.dirname(job_dest),'manifest')
+
+def record_path(manifest_dir,name):
+    return os.path.join(manifest_dir,name+'.json')
+
+def read_record(manifest_dir,name):
+    """ Return the manifest record of a job, or None if it was never planned (or the record is unreadable). """
+    path = record_path(manifest_dir,name)
+    if not os.path.isfile(path):
+        return None
+    try:
+        record_file = open(path)
+        record = json.load(record_file)
+        record_file.close()
+    except ValueError:
+        return None
+    return record
+
+def write_record(manifest_dir,record):
+    """ Write a record atomically so a killed job never leaves a half written file behind. """
+    os.makedirs(manifest_dir,exist_ok=True)
+    path = record_path(manifest_dir,record['name'])
+    temp_path = path+'.tmp'+str(os.getpid())
+    record_file = open(temp_path,'w')
+    json.dump(record,record_file,indent=1)
+    record_file.close()
+    os.replace(temp_path,path)
+
+def job_state(job,record):
+    """ Classify a planned job against its manifest record: complete, new, failed (includes killed jobs, which never got
+    past 'planned') or stale. """
+    if record is None:
+        return 'new'
+    if record.get('status') != 'complete':
+        return 'failed'
+    if record.get('command') != job.command:
+        return 'stale'
+    for path, size in record.get('outputs',{}).items():
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return 'stale'
+    for path in job.inputs:
+        if os.path.isfile(path) and os.path.getmtime(path) > record.get('finished',0):
+            return 'stale'
+    return 'complete'
+
+def select_jobs(jobs,manifest_dir,force=False):
+    """ Return the jobs that need to run: every job if force is set, otherwise those that are not complete plus any job
+    depending on a job that will rerun. """
+    jobs = order_jobs(resolve_dependencies(jobs))
+    counts = {}
+    selected = set()
+    for job in jobs:
+        state = job_state(job,read_record(manifest_dir,job.name))
+        if force or state != 'complete' or any(id(dependency) in selected for dependency in job.depends):
+            selected.add(id(job))
+            if state == 'complete':
+                state = 'stale'
+        counts[state] = counts.get(state,0)+1
+    summary = ', '.join(str(counts[state])+' '+state for state in ['complete','new','failed','stale'] if state in counts)
+    print('Manifest: '+summary+(' (--force: rerunning all)' if force else ''))
+    return [job for job in jobs if id(job) in selected]
+
+def record_planned(jobs,manifest_dir):
+    """ Record every job about to be scheduled. Must be called with the commands as planned by the generators, before
+    any other wrapping, since that is what reruns are compared against. """
+    for job in jobs:
+        record = {'name':job.name,'command':job.command,'inputs':job.inputs,'expected':job.outputs,'outputs':{},
+                  'params':job.params,'status':'planned','planned':time.time()}
+        write_record(manifest_dir,record)
+    return jobs
+
+def add_record_step(jobs,manifest_dir):
+    """ Make each job record its own completion (run after the model cache has added its store step). """
+    for job in jobs:
+        job.command = job.command+'; '+sys.executable+' '+os.path.realpath(__file__)+' --manifest-dir '+manifest_dir+' --job '+job.name+' --returncode $?'
+    return jobs
+
+def record_completion(manifest_dir,name,returncode):
+    """ Mark a job complete if it succeeded and produced every expected output; otherwise mark it failed. Returns the
+    exit status the job should report. """
+    record = read_record(manifest_dir,name)
+    if record is None:
+        print('No manifest record for job '+name)
+        return returncode or 1
+    missing = [path for path in record.get('expected',[]) if not os.path.isfile(path)]
+    record['returncode'] = returncode
+    record['finished'] = time.time()
+    if returncode == 0 and not missing:
+        record['status'] = 'complete'
+        record['outputs'] = dict((path,os.path.getsize(path)) for path in record.get('expected',[]))
+    else:
+        record['status'] = 'failed'
+        record['missing'] = missing
+        if missing:
+            print(str(len(missing))+' expected output file(s) missing, e.g. '+missing[0])
+    write_record(manifest_dir,record)
+    if record['status'] == 'complete':
+        return 0
+    return returncode or 1
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Record the completion of a planned GAMETES job in the archive manifest")
+    parser.add_argument('--manifest-dir',dest='manifest_dir',type=str,help='manifest directory (<output_path>/temporary/manifest)',required=True)
+    parser.add_argument('--job',dest='job',type=str,help='name of the finished job',required=True)
+    parser.add_argument('--returncode',dest='returncode',type=int,help='exit status of the GAMETES command',required=True)
+    options = parser.parse_args(argv[1:])
+    return record_completion(options.manifest_dir,options.job,options.returncode)
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,149 @@
+"""
+Description: Content-addressed cache of GAMETES penetrance models shared across archives. A model search is identified by a hash of
+its parameters (loci, heritability, MAFs, K, quantiles, population and try counts) and of the GAMETES jar itself. When a matching
+entry exists, its _Models.txt/_Scores.txt files are copied into the archive instead of running the -M search again (never hard linked,
+so rewriting an archive's model file in place cannot change the cache entry other archives use).
+Finished searches are added to the cache by a short command appended to the model job, so this works for every scheduler backend.
+Least recently used entries are evicted once the cache grows beyond its size cap.
+
+Usage (store step, appended to model jobs automatically):
+python gametes_model_cache.py --cache-dir <dir> --key <key> --max-size <bytes> <model files>
+"""
+
+import sys
+import os
+import json
+import shutil
+import hashlib
+import argparse
+
+DEFAULT_CACHE_DIR = os.environ.get('GAMETES_MODEL_CACHE',os.path.join(os.path.expanduser('~'),'.cache','gametes_archive_gen','models'))
+DEFAULT_CACHE_SIZE = 10 #GB
+GAMETES_JAR = os.path.join(os.path.dirname(os.path.realpath(__file__)),'gametes_2.2_dev.jar')
+
+_checksums = {}
+
+def add_cache_arguments(parser):
+    """ Command line options for the model cache. """
+    parser.add_argument('--model-cache',dest='model_cache',type=str,help='directory of the shared model cache (default: $GAMETES_MODEL_CACHE or ~/.cache/gametes_archive_gen/models)',default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--model-cache-size',dest='model_cache_size',type=float,help='size cap of the model cache in GB; least recently used models are evicted beyond it',default=DEFAULT_CACHE_SIZE)
+    parser.add_argument('--no-model-cache',dest='no_model_cache',action='store_true',help='always run model searches and do not add results to the cache')
+
+def file_checksum(path):
+    """ SHA-256 of a file, memoized for the life of the process. """
+    if path not in _checksums:
+        digest = hashlib.sha256()
+        f = open(path,'rb')
+        for block in iter(lambda: f.read(1 << 20),b''):
+            digest.update(block)
+        f.close()
+        _checksums[path] = digest.hexdigest()
+    return _checksums[path]
+
+def model_cache_key(params):
+    """ Cache key of a model search: hash of its parameters and the checksum of the GAMETES jar doing the search. """
+    keyed = dict(params)
+    keyed['gametes_jar'] = file_checksum(GAMETES_JAR)
+    return hashlib.sha256(json.dumps(keyed,sort_keys=True).encode()).hexdigest()
+
+def cache_file_name(output):
+    """ Name of a model output inside a cache entry (e.g. '..._K_0.3_Models.txt' -> 'Models.txt'). """
+    return os.path.basename(output).rsplit('_',1)[-1]
+
+def copy_cached(source,destination):
+    """ Copy a cached file into the archive. A fresh file is written even where destination is an earlier hard link to
+    the cache, so the cache entry itself is never modified. """
+    if os.path.exists(destination):
+        os.remove(destination)
+    shutil.copy2(source,destination)
+
+def lookup(cache_dir,key,outputs):
+    """ Return the cache entry directory for key if it holds every requested output, otherwise None. """
+    entry = os.path.join(cache_dir,key)
+    for output in outputs:
+        if not os.path.isfile(os.path.join(entry,cache_file_name(output))):
+            return None
+    return entry
+
+def store(cache_dir,key,files,max_bytes=None):
+    """ Add finished model files to the cache under key. Files are staged in a temporary directory and renamed into
+    place so concurrent jobs never see a partial entry. """
+    entry = os.path.join(cache_dir,key)
+    if os.path.isdir(entry):
+        os.utime(entry)
+        return entry
+    missing = [path for path in files if not os.path.isfile(path)]
+    if missing:
+        raise IOError('Model output(s) not found, nothing cached: '+', '.join(missing))
+    os.makedirs(cache_dir,exist_ok=True)
+    staging = entry+'.tmp'+str(os.getpid())
+    os.makedirs(staging)
+    for path in files:
+        shutil.copy2(path,os.path.join(staging,cache_file_name(path)))
+    try:
+        os.rename(staging,entry)
+    except OSError:
+        #Another job stored the same model first
+        shutil.rmtree(staging,ignore_errors=True)
+    if max_bytes is not None:
+        evict(cache_dir,max_bytes)
+    return entry
+
+def entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry,name)) for name in os.listdir(entry))
+
+def evict(cache_dir,max_bytes):
+    """ Remove least recently used entries (by entry directory mtime, refreshed on every hit) until the cache fits. """
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir,name)
+        if os.path.isdir(entry) and '.tmp' not in name:
+            entries.append((os.path.getmtime(entry),entry_size(entry),entry))
+    entries.sort()
+    total = sum(size for last_used, size, entry in entries)
+    for last_used, size, entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry,ignore_errors=True)
+        total -= size
+
+def apply_model_cache(jobs,options,dry_run=False):
+    """ Replace model jobs whose results are already cached by copies of the cached files, and make the remaining model
+    jobs add their results to the cache when they succeed. Returns the jobs that still need to run. """
+    if options.no_model_cache:
+        return jobs
+    max_bytes = int(options.model_cache_size*1024**3)
+    remaining = []
+    hits = 0
+    for job in jobs:
+        if job.group != 'models' or not job.params:
+            remaining.append(job)
+            continue
+        key = model_cache_key(job.params)
+        entry = lookup(options.model_cache,key,job.outputs)
+        if entry is not None:
+            hits += 1
+            if not dry_run:
+                for output in job.outputs:
+                    copy_cached(os.path.join(entry,cache_file_name(output)),output)
+                os.utime(entry)
+            continue
+        job.command = job.command+' && '+sys.executable+' '+os.path.realpath(__file__)+' --cache-dir '+options.model_cache+' --key '+key+' --max-size '+str(max_bytes)+' '+' '.join(job.outputs)
+        remaining.append(job)
+    if hits:
+        print('Model cache: reused '+str(hits)+' cached model(s) from '+options.model_cache)
+    return remaining
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Add finished GAMETES model files to the shared model cache")
+    parser.add_argument('--cache-dir',dest='cache_dir',type=str,help='model cache directory',default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--key',dest='key',type=str,help='cache key of the model search',required=True)
+    parser.add_argument('--max-size',dest='max_size',type=int,help='size cap of the cache in bytes',default=None)
+    parser.add_argument('files',nargs='+',help='model output files to store')
+    options = parser.parse_args(argv[1:])
+    store(options.cache_dir,options.key,options.files,options.max_size)
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
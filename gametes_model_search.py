@@ -0,0 +1,215 @@
+"""
+Description: Native (NumPy) replacement for the GAMETES -M penetrance model search. Instead of building and testing one candidate
+table at a time, candidates are generated in batches as arrays of shape (batch, 3, ..., 3):
+- random tables (deviations weighted by genotype frequency) are projected onto pure, strict epistasis (no marginal effect
+  of any subset of loci under Hardy-Weinberg genotype frequencies), scaled to the requested heritability around the prevalence K, and rejected if any penetrance falls
+  outside [0, 1];
+- every accepted model is scored with the ease of detection measure (EDM) and the customized odds ratio (COR);
+- the population of accepted models is sorted by EDM and one model is taken from the middle of each of -q equal slices,
+  EDM-1 being the easiest to detect.
+Batches are spread over a process pool, one independent random stream per task. Results are written as <output>_Models.txt and
+<output>_Scores.txt in the layout read by the dataset generators (see gametes_native.parse_model_file).
+
+Usage (through gametes_native.py, same command line as the jar):
+python gametes_native.py -M " -h <heritability> [-p <K>] -a <maf> [-a <maf> ...] -o <path>.txt" -q <quantiles> -p <population> -t <tries>
+"""
+
+import os
+import shlex
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gametes_jobs import available_cores
+
+GENOTYPES = 3
+BATCH_SIZE = 20000 #candidate tables per task
+
+def parse_model_options(option_string):
+    """ Parse the option string passed to -M, using the GAMETES flags. """
+    parser = argparse.ArgumentParser(prog='-M',add_help=False)
+    parser.add_argument('-h',dest='heritability',type=float,required=True)
+    parser.add_argument('-p',dest='K',type=float,default=None)
+    parser.add_argument('-a',dest='mafs',type=float,action='append',required=True)
+    parser.add_argument('-o',dest='output',type=str,required=True)
+    return parser.parse_args(shlex.split(option_string))
+
+def genotype_frequencies(mafs):
+    """ Joint Hardy-Weinberg genotype frequencies of independent loci, shape (3,)*loci. """
+    joint = np.ones(())
+    for maf in mafs:
+        joint = np.multiply.outer(joint,np.array([(1-maf)**2,2*maf*(1-maf),maf**2]))
+    return joint
+
+def pure_strict(tables,mafs):
+    """ Remove every main and lower order interaction effect from a batch of tables (shape (batch,)+(3,)*loci): applying
+    (I - E_i) for each locus i, where E_i averages over locus i with its genotype frequencies, leaves only the full
+    interaction, so the penetrance marginalised over any proper subset of loci is constant. """
+    for axis, maf in enumerate(mafs):
+        weights = np.array([(1-maf)**2,2*maf*(1-maf),maf**2])
+        shape = [1]*tables.ndim
+        shape[axis+1] = GENOTYPES
+        tables = tables-(tables*weights.reshape(shape)).sum(axis=axis+1,keepdims=True)
+    return tables
+
+def candidate_models(rng,count,mafs,heritability,K=None):
+    """ Draw count candidate penetrance tables with the given heritability (and prevalence K if set, otherwise drawn
+    uniformly). Returns (tables, K values) of the candidates with every penetrance in [0, 1]. """
+    loci = len(mafs)
+    frequencies = genotype_frequencies(mafs)
+    #Raw deviations are weighted by genotype frequency: rare cells would otherwise need large penetrance swings to balance
+    #the common ones and push most 3-locus candidates outside [0, 1]
+    deviations = pure_strict(rng.uniform(-1.0,1.0,size=(count,)+(GENOTYPES,)*loci)*frequencies,mafs)
+    axes = tuple(range(1,loci+1))
+    variance = (frequencies*deviations**2).sum(axis=axes)
+    if K is None:
+        prevalence = rng.uniform(0.01,0.99,size=count)
+    else:
+        prevalence = np.full(count,K)
+    #Heritability of a binary trait: Var(f(g)) / (K(1-K))
+    scale = np.sqrt(heritability*prevalence*(1-prevalence)/np.maximum(variance,1e-300))
+    shape = (count,)+(1,)*loci
+    tables = prevalence.reshape(shape)+scale.reshape(shape)*deviations
+    valid = (variance > 0) & (tables.min(axis=axes) >= 0) & (tables.max(axis=axes) <= 1)
+    return tables[valid], prevalence[valid]
+
+def score_models(tables,prevalence,mafs):
+    """ EDM and COR of a batch of models. With case and control genotype distributions P(g|case) = P(g)f(g)/K and
+    P(g|control) = P(g)(1-f(g))/(1-K), EDM is half the squared distance between them and COR is the odds ratio of the
+    classification calling every genotype with P(g|case) > P(g|control) high risk. """
+    loci = len(mafs)
+    frequencies = genotype_frequencies(mafs)
+    shape = (len(prevalence),)+(1,)*loci
+    cases = frequencies*tables/prevalence.reshape(shape)
+    controls = frequencies*(1-tables)/(1-prevalence.reshape(shape))
+    axes = tuple(range(1,loci+1))
+    edm = ((cases-controls)**2).sum(axis=axes)/2
+    high = cases > controls
+    true_positive = np.where(high,cases,0).sum(axis=axes)
+    false_positive = np.where(high,controls,0).sum(axis=axes)
+    false_negative = 1-true_positive
+    true_negative = 1-false_positive
+    with np.errstate(divide='ignore',invalid='ignore'):
+        cor = (true_positive*true_negative)/(false_positive*false_negative)
+    return edm, cor
+
+def search_task(seed,tries,wanted,mafs,heritability,K):
+    """ One process pool task: try up to tries candidates (in batches) and return at most wanted accepted models as
+    (tables, K values, number of candidates tried). """
+    rng = np.random.default_rng(seed)
+    tables = []
+    prevalence = []
+    accepted = 0
+    tried = 0
+    while tried < tries and accepted < wanted:
+        count = min(BATCH_SIZE,tries-tried)
+        batch_tables, batch_prevalence = candidate_models(rng,count,mafs,heritability,K)
+        tables.append(batch_tables)
+        prevalence.append(batch_prevalence)
+        accepted += len(batch_prevalence)
+        tried += count
+    return np.concatenate(tables)[:wanted], np.concatenate(prevalence)[:wanted], tried
+
+def search_models(mafs,heritability,K,population,tries,workers=None,seed=None,race_dir=None,part=None):
+    """ Collect up to population valid models, trying at most tries candidates, using a pool of worker processes.
+    Returns (tables, K values, EDM, COR, candidates tried). A search racing others (see gametes_race.py) publishes its
+    count of valid models in race_dir after every round and stops once the searches together hold population. """
+    workers = workers or available_cores()
+    seeds = np.random.SeedSequence(seed)
+    chunk = max(BATCH_SIZE,min(tries,population)//workers)
+    tables = []
+    prevalence = []
+    accepted = 0
+    tried = 0
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while accepted < population and tried < tries:
+            tasks = []
+            for child in seeds.spawn(workers):
+                task_tries = min(chunk,tries-tried-sum(task[1] for task in tasks))
+                if task_tries <= 0:
+                    break
+                tasks.append((executor.submit(search_task,child,task_tries,population-accepted,mafs,heritability,K),task_tries))
+            for future, task_tries in tasks:
+                task_tables, task_prevalence, task_tried = future.result()
+                tables.append(task_tables)
+                prevalence.append(task_prevalence)
+                accepted += len(task_prevalence)
+                tried += task_tried
+            if race_dir is not None:
+                publish_count(race_dir,part,accepted)
+                if pooled_count(race_dir) >= population:
+                    break
+    finally:
+        executor.shutdown()
+    tables = np.concatenate(tables)[:population]
+    prevalence = np.concatenate(prevalence)[:population]
+    edm, cor = score_models(tables,prevalence,mafs)
+    return tables, prevalence, edm, cor, tried
+
+def publish_count(race_dir,part,accepted):
+    temp_path = os.path.join(race_dir,'.'+str(part)+'.count.tmp')
+    count_file = open(temp_path,'w')
+    count_file.write(str(accepted))
+    count_file.close()
+    os.replace(temp_path,os.path.join(race_dir,str(part)+'.count'))
+
+def pooled_count(race_dir):
+    """ Valid models found so far by all searches racing in race_dir. """
+    total = 0
+    for name in os.listdir(race_dir):
+        if name.endswith('.count') and not name.startswith('.'):
+            count_file = open(os.path.join(race_dir,name))
+            total += int(count_file.read() or 0)
+            count_file.close()
+    return total
+
+def select_quantiles(edm,quantiles):
+    """ Indices of the models at the middle of each of quantiles equal slices of the population sorted by decreasing EDM. """
+    order = np.argsort(-edm,kind='stable')
+    size = len(order)
+    return [order[min(size-1,int((q+0.5)*size/quantiles))] for q in range(quantiles)]
+
+def format_table(table):
+    """ Penetrance table as printed by GAMETES: one row of three values per genotype combination of the other loci. """
+    rows = np.asarray(table).reshape(-1,GENOTYPES)
+    return '\n'.join(', '.join('%.3f' % value for value in row) for row in rows)
+
+def write_models(output,tables,prevalence,edm,cor,mafs,heritability,selected):
+    """ Write the selected models and their scores (<output>_Models.txt, <output>_Scores.txt). Returns the file names. """
+    base = output[:-len('.txt')] if output.endswith('.txt') else output
+    names = ['P'+str(i) for i in range(len(mafs))]
+    models_file = open(base+'_Models.txt','w')
+    scores_file = open(base+'_Scores.txt','w')
+    scores_file.write('Model\tHeritability\tK\tEDM\tCOR\n')
+    for q, index in enumerate(selected):
+        models_file.write('Attribute names:\t'+'\t'.join(names)+'\n')
+        models_file.write('Minor allele frequencies:\t'+'\t'.join('%.3f' % maf for maf in mafs)+'\n')
+        models_file.write('K: '+repr(round(float(prevalence[index]),6))+'\n')
+        models_file.write('Heritability: '+repr(float(heritability))+'\n')
+        models_file.write('EDM: '+repr(round(float(edm[index]),6))+'\n')
+        models_file.write('COR: '+repr(round(float(cor[index]),6))+'\n')
+        models_file.write('Table:\n\n'+format_table(tables[index])+'\n\n')
+        scores_file.write('EDM-'+str(q+1)+'\t'+str(heritability)+'\t'+str(round(float(prevalence[index]),6))+'\t'+str(round(float(edm[index]),6))+'\t'+str(round(float(cor[index]),6))+'\n')
+    models_file.close()
+    scores_file.close()
+    return [base+'_Models.txt',base+'_Scores.txt']
+
+def generate_models(option_string,quantiles,population,tries,workers=None,seed=None,race_dir=None,part=None):
+    """ Run one -M request end to end. Raises ValueError if no valid model was found within the try budget. A search
+    racing others writes its valid models to <race_dir>/<part>.npz instead, for gametes_race.py to merge. """
+    model = parse_model_options(option_string)
+    if race_dir is not None:
+        os.makedirs(race_dir,exist_ok=True)
+        tables, prevalence, edm, cor, tried = search_models(model.mafs,model.heritability,model.K,population,tries,workers,seed,race_dir,part)
+        print('Model search (racer '+str(part)+'): '+str(len(prevalence))+' valid model(s) in '+str(tried)+' tries')
+        temp_path = os.path.join(race_dir,'.'+str(part)+'.tmp.npz')
+        np.savez(temp_path,tables=tables,prevalence=prevalence)
+        os.replace(temp_path,os.path.join(race_dir,str(part)+'.npz'))
+        return [os.path.join(race_dir,str(part)+'.npz')]
+    tables, prevalence, edm, cor, tried = search_models(model.mafs,model.heritability,model.K,population,tries,workers,seed)
+    if len(prevalence) == 0:
+        raise ValueError('No valid model found in '+str(tried)+' tries (heritability '+str(model.heritability)+', K '+str(model.K)+')')
+    print('Model search: '+str(len(prevalence))+' valid model(s) in '+str(tried)+' tries')
+    if os.path.dirname(model.output):
+        os.makedirs(os.path.dirname(model.output),exist_ok=True)
+    return write_models(model.output,tables,prevalence,edm,cor,model.mafs,model.heritability,select_quantiles(edm,quantiles))
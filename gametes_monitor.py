@@ -0,0 +1,213 @@
+"""
+Description: Monitored submission. By default every planned job is handed to the scheduler at once and the script exits.
+With --max-in-flight N, run_jobs keeps the jobs under watch in an asyncio loop instead: at most N jobs are queued or
+running on the backend at any time, and a job is submitted only once the jobs it depends on have succeeded, so the
+cluster never holds thousands of pending jobs. The state of every job in flight is polled with one status command per
+poll (bjobs for LSF, sacct for SLURM; the local backend runs the jobs as child processes of this one, which makes it a
+stand-in for testing). A failed job is resubmitted after --retry-delay seconds, doubled for every further attempt, up to
+--retries times. A progress line with the throughput and an ETA (from the predicted walltime of the jobs where
+--resources estimate gives one) is printed whenever jobs finish.
+"""
+
+import time
+import asyncio
+import subprocess
+
+LOST_POLLS = 3 #consecutive polls a job may be missing from the status output before it is counted as failed
+SUBMIT_AT_ONCE = 8 #submission commands run concurrently
+
+def add_monitor_arguments(parser):
+    """ Command line options for monitored submission. """
+    parser.add_argument('--max-in-flight',dest='max_in_flight',type=int,help='keep at most N jobs queued or running, submitting more as they finish, and watch and retry them until the run is done (0: submit every job at once and exit)',default=0)
+    parser.add_argument('--retries',dest='retries',type=int,help='with --max-in-flight: times a failed job is resubmitted',default=2)
+    parser.add_argument('--retry-delay',dest='retry_delay',type=float,help='with --max-in-flight: seconds before a failed job is resubmitted, doubled for every further attempt',default=60.0)
+    parser.add_argument('--poll-seconds',dest='poll_seconds',type=float,help='with --max-in-flight: seconds between two status polls (default: 30 on a cluster, 1 locally)',default=None)
+
+def format_duration(seconds):
+    minutes = int(seconds//60)
+    if minutes >= 60:
+        return str(minutes//60)+'h'+str(minutes%60).zfill(2)+'m'
+    return str(minutes)+'m'+str(int(seconds%60)).zfill(2)+'s'
+
+class LocalBackend:
+    """ Runs every job as a child process of this one; its state is its exit status. """
+    poll_seconds = 1.0
+
+    def __init__(self,log_dest):
+        self.log_dest = log_dest
+        self.processes = {}
+
+    async def submit(self,job,attempt):
+        mode = 'w' if attempt == 1 else 'a'
+        out_file = open(self.log_dest+'/'+job.name+'.o',mode)
+        err_file = open(self.log_dest+'/'+job.name+'.e',mode)
+        try:
+            process = await asyncio.create_subprocess_shell(job.command,stdout=out_file,stderr=err_file)
+        finally:
+            out_file.close()
+            err_file.close()
+        self.processes[str(process.pid)] = process
+        return str(process.pid)
+
+    async def poll(self,job_ids):
+        states = {}
+        for job_id in job_ids:
+            returncode = self.processes[job_id].returncode
+            if returncode is None:
+                states[job_id] = 'running'
+            else:
+                states[job_id] = 'done' if returncode == 0 else 'failed'
+                del self.processes[job_id]
+        return states
+
+class ClusterBackend:
+    """ Submits one script per job through an LSF or SLURM scheduler (its directives and submission command) and polls
+    the states of all jobs in flight with its status command. """
+    poll_seconds = 30.0
+
+    def __init__(self,scheduler):
+        self.scheduler = scheduler
+
+    async def submit(self,job,attempt):
+        job_ref = job.name+'_'+self.scheduler.run_ref+('' if attempt == 1 else '_attempt'+str(attempt))
+        script = self.scheduler.directives(job_ref,self.scheduler.log_dest+'/'+job_ref,None,[],job.resources)
+        job_path_name = self.scheduler.write_script(job_ref,script+job.command+'\n')
+        return await asyncio.get_running_loop().run_in_executor(None,self.scheduler.submit,job_path_name)
+
+    async def poll(self,job_ids):
+        try:
+            process = await asyncio.create_subprocess_exec(*self.scheduler.status_command(job_ids),stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        except OSError as error:
+            print('Could not poll job states: '+str(error))
+            return {}
+        stdout, stderr = await process.communicate()
+        return self.scheduler.parse_status(stdout.decode())
+
+class Monitor:
+    """ Submits jobs as dependencies and the in-flight limit allow, polls them and retries failures. """
+    def __init__(self,backend,limit,retries=2,retry_delay=60.0,poll_seconds=None):
+        self.backend = backend
+        self.limit = max(1,limit)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.poll_seconds = poll_seconds or backend.poll_seconds
+
+    def weight(self,job):
+        """ Share of the run a job represents: its predicted walltime where known, else 1. """
+        if job.resources:
+            return max(job.resources['walltime_min'],0.01)
+        return 1.0
+
+    def progress(self):
+        elapsed = time.time()-self.started
+        done = len(self.finished)
+        line = 'Progress: '+str(done)+'/'+str(self.total)+' jobs finished ('+str(len(self.failed))+' failed), '+str(len(self.in_flight))+' in flight'
+        if done and elapsed > 0:
+            rate = self.done_weight/elapsed
+            remaining = self.total_weight-self.done_weight
+            line += ', '+str(round(done*60.0/elapsed,1))+' jobs/min, ETA '+format_duration(remaining/rate if rate > 0 else 0)
+        print(line)
+
+    async def submit(self,job,semaphore):
+        async with semaphore:
+            return await self.backend.submit(job,self.attempts[id(job)])
+
+    def settle(self,job,succeeded):
+        """ Record the outcome of one attempt, queueing a retry while attempts remain. """
+        if succeeded:
+            self.finished[id(job)] = True
+            self.done_weight += self.weight(job)
+            return
+        if self.attempts[id(job)] <= self.retries:
+            delay = self.retry_delay*2**(self.attempts[id(job)]-1)
+            print('RETRY '+job.name+' (attempt '+str(self.attempts[id(job)]+1)+' of '+str(self.retries+1)+') in '+str(round(delay,1))+' s')
+            self.not_before[id(job)] = time.time()+delay
+            self.pending.insert(0,job)
+            return
+        print('FAILED after '+str(self.attempts[id(job)])+' attempt(s): '+job.name)
+        self.finished[id(job)] = False
+        self.failed.append(job)
+        self.done_weight += self.weight(job)
+
+    async def run(self,jobs):
+        self.started = time.time()
+        self.total = len(jobs)
+        self.total_weight = sum(self.weight(job) for job in jobs)
+        self.done_weight = 0.0
+        self.pending = list(jobs)
+        self.attempts = dict((id(job),0) for job in jobs)
+        self.not_before = {}
+        self.finished = {} #id(job) -> True if the job succeeded, once it will not run again
+        self.failed = []
+        self.in_flight = {} #backend job id -> [job, consecutive polls it was missing]
+        semaphore = asyncio.Semaphore(SUBMIT_AT_ONCE)
+        print('Monitoring '+str(self.total)+' jobs, at most '+str(self.limit)+' in flight')
+        changed = False
+        while self.pending or self.in_flight:
+            now = time.time()
+            ready = []
+            for job in list(self.pending):
+                if len(self.in_flight)+len(ready) >= self.limit:
+                    break
+                if not all(id(dependency) in self.finished for dependency in job.depends):
+                    continue
+                if not all(self.finished[id(dependency)] for dependency in job.depends):
+                    self.pending.remove(job)
+                    self.finished[id(job)] = False
+                    self.failed.append(job)
+                    self.done_weight += self.weight(job)
+                    print('SKIPPED (dependency failed): '+job.name)
+                    continue
+                if self.not_before.get(id(job),0) > now:
+                    continue
+                self.pending.remove(job)
+                self.attempts[id(job)] += 1
+                ready.append(job)
+            job_ids = await asyncio.gather(*[self.submit(job,semaphore) for job in ready])
+            for job, job_id in zip(ready,job_ids):
+                if job_id is None:
+                    self.settle(job,False)
+                else:
+                    self.in_flight[job_id] = [job,0]
+            if changed:
+                self.progress() #once the finished jobs have been replaced
+                changed = False
+            if not self.in_flight:
+                waiting = [self.not_before[id(job)] for job in self.pending if id(job) in self.not_before]
+                if waiting:
+                    await asyncio.sleep(max(0.0,min(waiting)-time.time()))
+                elif self.pending and not ready:
+                    raise ValueError('Jobs depend on jobs that are not part of this run: '+', '.join(job.name for job in self.pending))
+                continue
+            await asyncio.sleep(self.poll_seconds)
+            states = await self.backend.poll(list(self.in_flight))
+            for job_id, entry in list(self.in_flight.items()):
+                job = entry[0]
+                state = states.get(job_id)
+                if state is None:
+                    entry[1] += 1
+                    if entry[1] < LOST_POLLS:
+                        continue
+                    print('LOST '+job.name+' (job '+job_id+' no longer reported by the scheduler)')
+                    state = 'failed'
+                entry[1] = 0
+                if state in ('done','failed'):
+                    del self.in_flight[job_id]
+                    self.settle(job,state == 'done')
+                    changed = True
+        if changed:
+            self.progress()
+        print(str(self.total-len(self.failed))+' of '+str(self.total)+' jobs completed successfully in '+format_duration(time.time()-self.started))
+        return len(self.failed)
+
+def monitor_jobs(jobs,scheduler,options):
+    """ Run jobs (ordered, dependencies resolved) under a Monitor on the scheduler's backend: its cluster, or local
+    child processes. Returns the number of jobs that failed. """
+    if hasattr(scheduler,'status_command'):
+        backend = ClusterBackend(scheduler)
+        if options.array != 'none':
+            print('Job arrays are not used with --max-in-flight: every job is submitted on its own')
+    else:
+        backend = LocalBackend(scheduler.log_dest)
+    monitor = Monitor(backend,options.max_in_flight,options.retries,options.retry_delay,options.poll_seconds)
+    return asyncio.run(monitor.run(jobs))
@@ -0,0 +1,400 @@
+"""
+Description: Native (NumPy) engine generating case/control and continuous-endpoint SNP datasets from existing GAMETES model files.
+It accepts the same command line as the GAMETES jar for dataset generation (-i model files, -w model weights and a -D option string
+with -n/-x, -a, -s/-w, -t, -r, -o, -h, -b, -c, -d), so the archive scripts can switch engines with --engine native without
+changing any generator. Instead of paying JVM startup per dataset, genotypes are drawn in vectorized form:
+- predictive loci are sampled jointly from their genotype distribution conditional on class, P(g|case) ~ P(g)f(g) and
+  P(g|control) ~ P(g)(1-f(g)), where P(g) assumes Hardy-Weinberg equilibrium at the model MAFs and f is the penetrance table;
+- non-predictive attributes get a MAF drawn uniformly from [-n, -x] and genotypes drawn Binomial(2, MAF).
+Files are streamed in blocks of samples (--chunk-mb), so peak memory does not grow with the number of attributes.
+Files are written tab-separated in the GAMETES layout: N0..Nk for non-predictive attributes, M<model>P<locus> for predictive ones,
+then Class (1 = case, 0 = control), one file per model quantile and replicate (see gametes_jobs.dataset_files).
+
+Usage:
+python gametes_native.py -i <model file> [-w <weight> -i <model file> ...] -D "<GAMETES dataset options>" [-z|-r <seed>]
+python gametes_native.py -M "<GAMETES model options>" -q <quantiles> -p <population> -t <tries> [-z <seed>]   (see gametes_model_search.py)
+python gametes_native.py --compare <dataset folder A> <dataset folder B>   (statistical comparison of two engines' output)
+"""
+
+import sys
+import os
+import re
+import glob
+import shlex
+import time
+import itertools
+import argparse
+import numpy as np
+from gametes_jobs import dataset_files
+from gametes_model_search import generate_models
+from gametes_binary import BinaryWriter
+from gametes_compress import open_dataset_file
+
+GENOTYPES = 3 #0 = homozygous major, 1 = heterozygous, 2 = homozygous minor
+DEFAULT_CHUNK_MB = 64 #memory budget of one block of samples being generated and written
+HEADER_BLOCK = 10000 #column names written at a time
+
+#Seconds spent drawing non-predictive genotypes and writing files, printed on exit for gametes_benchmark.py
+TIMINGS = {'noise_s':0.0,'write_s':0.0}
+
+def parse_model_file(path):
+    """ Read every penetrance model (one per quantile) from a GAMETES _Models.txt file. Returns a list of dicts with the
+    attribute names, minor allele frequencies, K, heritability and the penetrance table as an array of shape (3,)*loci,
+    indexed by the genotype of each locus in order (the first locus varies slowest, as the table is printed). """
+    model_file = open(path)
+    lines = model_file.read().splitlines()
+    model_file.close()
+    models = []
+    model = None
+    in_table = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('Attribute names:'):
+            model = {'names':stripped.split(':',1)[1].split(),'table':[]}
+            models.append(model)
+            in_table = False
+        elif model is None:
+            continue
+        elif stripped.startswith('Minor allele frequencies:'):
+            model['mafs'] = [float(value) for value in re.split(r'[\s,]+',stripped.split(':',1)[1].strip())]
+        elif stripped.startswith('K:'):
+            model['K'] = float(stripped.split(':',1)[1])
+        elif stripped.startswith('Heritability:'):
+            model['heritability'] = float(stripped.split(':',1)[1])
+        elif stripped.startswith('Table:'):
+            in_table = True
+        elif in_table:
+            values = [value for value in re.split(r'[\s,]+',stripped) if value]
+            try:
+                model['table'].extend(float(value) for value in values)
+            except ValueError:
+                in_table = False
+    for model in models:
+        loci = len(model['mafs'])
+        if len(model['table']) != GENOTYPES**loci:
+            raise ValueError('Model file '+path+': expected '+str(GENOTYPES**loci)+' penetrance values, found '+str(len(model['table'])))
+        model['table'] = np.array(model['table']).reshape((GENOTYPES,)*loci)
+        model['mafs'] = np.array(model['mafs'])
+    if not models:
+        raise ValueError('No models found in '+path)
+    return models
+
+def hwe_frequencies(maf):
+    """ Genotype frequencies (major homozygote, heterozygote, minor homozygote) under Hardy-Weinberg equilibrium. """
+    return np.array([(1-maf)**2,2*maf*(1-maf),maf**2])
+
+def genotype_distribution(mafs):
+    """ Joint genotype frequencies of independent loci, shape (3,)*loci. """
+    joint = np.ones(())
+    for maf in mafs:
+        joint = np.multiply.outer(joint,hwe_frequencies(maf))
+    return joint
+
+def joint_penetrance(models,weights):
+    """ Penetrance over the concatenated loci of several models combined hierarchically (weighted mean of each model's
+    penetrance), shape (3,)*total loci. """
+    total = np.zeros(())
+    offset = 0
+    loci = sum(len(model['mafs']) for model in models)
+    for model, weight in zip(models,weights):
+        count = len(model['mafs'])
+        shape = [1]*loci
+        shape[offset:offset+count] = [GENOTYPES]*count
+        total = total+weight*model['table'].reshape(shape)
+        offset += count
+    return np.broadcast_to(total,(GENOTYPES,)*loci)
+
+def sample_cells(rng,probabilities,count):
+    """ Draw count genotype combinations from a joint distribution; returns a (count, loci) uint8 array. """
+    flat = probabilities.ravel()
+    cells = rng.choice(flat.size,size=count,p=flat/flat.sum())
+    return np.stack(np.unravel_index(cells,probabilities.shape),axis=1).astype(np.uint8)
+
+def sample_class_conditional(rng,mafs,penetrance,cases,controls):
+    """ Predictive genotypes for the requested number of cases and controls, conditional on class. """
+    frequencies = genotype_distribution(mafs)
+    case_genotypes = sample_cells(rng,frequencies*penetrance,cases)
+    control_genotypes = sample_cells(rng,frequencies*(1-penetrance),controls)
+    return np.concatenate([case_genotypes,control_genotypes])
+
+def split_counts(total,fractions):
+    """ Split total into integer counts proportional to fractions (remainder goes to the last group). """
+    counts = [int(round(total*fraction)) for fraction in fractions[:-1]]
+    counts.append(total-sum(counts))
+    return counts
+
+def predictive_block(rng,models,weights,mixture,cases,controls,continuous=False,total=None,sd=0.02):
+    """ Predictive attribute genotypes and endpoint for one dataset. Returns (genotypes, endpoint, labels) where labels
+    gives the generating model of each row for heterogeneous data (None otherwise). """
+    fractions = np.array(weights,dtype=float)/sum(weights)
+    mafs = np.concatenate([model['mafs'] for model in models])
+    if continuous:
+        genotypes = sample_cells(rng,genotype_distribution(mafs),total)
+        if mixture == 'heterogeneous' and len(models) > 1:
+            labels = np.repeat(np.arange(len(models)),split_counts(total,fractions))
+            onehot = np.eye(len(models))[labels]
+            penetrance = np.zeros(total)
+            offset = 0
+            for k, model in enumerate(models):
+                count = len(model['mafs'])
+                penetrance += onehot[:,k]*model['table'][tuple(genotypes[:,offset:offset+count].T)]
+                offset += count
+        else:
+            labels = None
+            penetrance = joint_penetrance(models,fractions)[tuple(genotypes.T)]
+        endpoint = penetrance+rng.normal(0.0,sd,size=total)
+        return genotypes, endpoint, labels
+    endpoint = np.concatenate([np.ones(cases,dtype=np.uint8),np.zeros(controls,dtype=np.uint8)])
+    if mixture == 'heterogeneous' and len(models) > 1:
+        #Each model explains its own fraction of the cases and controls; the other models' loci are just noise there
+        case_counts = split_counts(cases,fractions)
+        control_counts = split_counts(controls,fractions)
+        case_rows = []
+        control_rows = []
+        labels = np.concatenate([np.repeat(np.arange(len(models)),case_counts),np.repeat(np.arange(len(models)),control_counts)])
+        for k in range(len(models)):
+            block = []
+            for j, model in enumerate(models):
+                if j == k:
+                    block.append(sample_class_conditional(rng,model['mafs'],model['table'],case_counts[k],control_counts[k]))
+                else:
+                    block.append(sample_cells(rng,genotype_distribution(model['mafs']),case_counts[k]+control_counts[k]))
+            block = np.concatenate(block,axis=1)
+            case_rows.append(block[:case_counts[k]])
+            control_rows.append(block[case_counts[k]:])
+        genotypes = np.concatenate(case_rows+control_rows)
+        return genotypes, endpoint, labels
+    #Single model, or hierarchical (additive) combination: each model contributes to the penetrance by its -w weight
+    genotypes = sample_class_conditional(rng,mafs,joint_penetrance(models,fractions),cases,controls)
+    return genotypes, endpoint, None
+
+def noise_mafs(rng,attributes,maf_min,maf_max):
+    """ MAF of each non-predictive attribute, ~ Uniform(maf_min, maf_max). """
+    return rng.uniform(maf_min,maf_max,size=attributes)
+
+def noise_rows(rng,mafs,count):
+    """ Non-predictive genotypes of count samples, ~ Binomial(2, MAF) per attribute. """
+    started = time.perf_counter()
+    rows = rng.binomial(2,mafs,size=(count,len(mafs))).astype(np.uint8)
+    TIMINGS['noise_s'] += time.perf_counter()-started
+    return rows
+
+def chunk_rows(columns,chunk_mb):
+    """ Samples per written block so that a block stays within chunk_mb, however many attributes there are. A value
+    costs about 14 bytes while a block is live: the int64 binomial draw, its uint8 copy, the two text bytes and the
+    assembled row. """
+    return max(1,int(chunk_mb*1024**2)//(14*(columns+2)))
+
+def attribute_names(models,noise_count):
+    """ Column names, generated lazily so the header of a very wide dataset is never held in memory at once. """
+    for i in range(noise_count):
+        yield 'N'+str(i)
+    for k, model in enumerate(models):
+        for i in range(len(model['mafs'])):
+            yield 'M'+str(k)+'P'+str(i)
+
+def genotype_text(genotypes):
+    """ Render a (rows, columns) genotype array as tab separated digit rows without a Python loop per value. Returns a
+    (rows, 2*columns) byte array: each digit followed by a tab. """
+    text = np.full((genotypes.shape[0],2*genotypes.shape[1]),ord('\t'),dtype=np.uint8)
+    text[:,0::2] = genotypes+ord('0')
+    return text
+
+def write_dataset(path,names,rng,mafs,predictive,endpoint,labels=None,chunk_mb=DEFAULT_CHUNK_MB,data_format='text',params=None):
+    """ Write one dataset file in GAMETES layout (header, genotypes, optional model label, Class), or in a binary format
+    of gametes_binary.py ('packed' or 'npy') with params stored in its header. Non-predictive genotypes are drawn and
+    written one block of samples at a time, so memory use is bounded by chunk_mb rather than by the dataset size. The
+    blocks consume rng in the same order as one full size draw, so the data does not depend on chunk_mb. """
+    step = chunk_rows(len(mafs)+predictive.shape[1],chunk_mb)
+    if data_format != 'text':
+        writer = BinaryWriter(path[:-len('.txt')],names,len(endpoint),data_format)
+        for start in range(0,len(endpoint),step):
+            stop = min(start+step,len(endpoint))
+            block = np.concatenate([noise_rows(rng,mafs,stop-start),predictive[start:stop]],axis=1)
+            started = time.perf_counter()
+            writer.write(block)
+            TIMINGS['write_s'] += time.perf_counter()-started
+        label_names = ['Model_'+str(label) for label in labels] if labels is not None else None
+        writer.close([format_endpoint(value) for value in endpoint],label_names,params)
+        return
+    out = open(path,'wb')
+    header = itertools.chain(names,['Model'] if labels is not None else [],['Class'])
+    separator = ''
+    while True:
+        block = list(itertools.islice(header,HEADER_BLOCK))
+        if not block:
+            break
+        out.write((separator+'\t'.join(block)).encode())
+        separator = '\t'
+    out.write(b'\n')
+    for start in range(0,len(endpoint),step):
+        stop = min(start+step,len(endpoint))
+        block = np.concatenate([noise_rows(rng,mafs,stop-start),predictive[start:stop]],axis=1)
+        started = time.perf_counter()
+        text = genotype_text(block)
+        del block
+        if labels is None and endpoint.dtype == np.uint8:
+            rows = np.concatenate([text,(endpoint[start:stop]+ord('0'))[:,None],np.full((stop-start,1),ord('\n'),dtype=np.uint8)],axis=1)
+            out.write(rows.tobytes())
+        else:
+            for i in range(start,stop):
+                out.write(text[i-start].tobytes())
+                if labels is not None:
+                    out.write(('Model_'+str(labels[i])+'\t').encode())
+                out.write((format_endpoint(endpoint[i])+'\n').encode())
+        del text
+        TIMINGS['write_s'] += time.perf_counter()-started
+    out.close()
+
+def format_endpoint(value):
+    if isinstance(value,(np.integer,int)):
+        return str(int(value))
+    return repr(float(value))
+
+def parse_dataset_options(option_string):
+    """ Parse the option string passed to -D, using the GAMETES flags and defaults. """
+    parser = argparse.ArgumentParser(prog='-D',add_help=False)
+    parser.add_argument('-n',dest='maf_min',type=float,default=0.01)
+    parser.add_argument('-x',dest='maf_max',type=float,default=0.05)
+    parser.add_argument('-a',dest='attributes',type=int,default=100)
+    parser.add_argument('-s',dest='cases',type=int,default=400)
+    parser.add_argument('-w',dest='controls',type=int,default=400)
+    parser.add_argument('-t',dest='total',type=int,default=800)
+    parser.add_argument('-r',dest='replicates',type=int,default=100)
+    parser.add_argument('-o',dest='output',type=str,required=True)
+    parser.add_argument('-h',dest='mixture',type=str,default='hierarchical',choices=['heterogeneous','hierarchical'])
+    parser.add_argument('-b',dest='label',action='store_true')
+    parser.add_argument('-c',dest='continuous',action='store_true')
+    parser.add_argument('-d',dest='sd',type=float,default=0.02)
+    return parser.parse_args(shlex.split(option_string))
+
+def generate_datasets(model_paths,weights,dataset,seed=None,chunk_mb=DEFAULT_CHUNK_MB,data_format='text',params=None):
+    """ Generate every replicate of every model quantile for one -D request, streaming each file in blocks of at most
+    chunk_mb. Binary formats record params (plus quantile, replicate and model summary) in each file's header. """
+    model_sets = [parse_model_file(path) for path in model_paths]
+    quantiles = len(model_sets[0])
+    if any(len(models) != quantiles for models in model_sets):
+        raise ValueError('The model files must all hold the same number of quantiles')
+    if not weights:
+        weights = [1.0]*len(model_paths)
+    if len(weights) != len(model_paths):
+        raise ValueError('# of models and # of model weights do not match')
+    rng = np.random.default_rng(seed)
+    files = dataset_files(dataset.output,quantiles,dataset.replicates)
+    os.makedirs(dataset.output,exist_ok=True)
+    index = 0
+    for q in range(quantiles):
+        models = [models[q] for models in model_sets]
+        loci = sum(len(model['mafs']) for model in models)
+        noise_count = dataset.attributes-loci
+        if noise_count < 0:
+            raise ValueError('Fewer attributes (-a '+str(dataset.attributes)+') than predictive loci ('+str(loci)+')')
+        for r in range(dataset.replicates):
+            predictive, endpoint, labels = predictive_block(rng,models,weights,dataset.mixture,dataset.cases,dataset.controls,
+                                                            dataset.continuous,dataset.total,dataset.sd)
+            mafs = noise_mafs(rng,noise_count,dataset.maf_min,dataset.maf_max)
+            file_params = dict(params or {},quantile=q+1,replicate=r+1,model_summary=[{'heritability':model.get('heritability'),
+                               'K':model.get('K'),'mafs':[float(maf) for maf in model['mafs']]} for model in models])
+            write_dataset(files[index],attribute_names(models,noise_count),rng,mafs,predictive,endpoint,labels if dataset.label else None,
+                          chunk_mb,data_format,file_params)
+            index += 1
+    return files
+
+def read_dataset(path):
+    """ Read a GAMETES dataset file (possibly .gz/.zst compressed) into (header, values) with values as a float array. """
+    data_file = open_dataset_file(path)
+    header = data_file.readline().rstrip('\n').split('\t')
+    columns = [i for i, name in enumerate(header) if name != 'Model']
+    values = np.loadtxt(data_file,delimiter='\t',usecols=columns,ndmin=2)
+    data_file.close()
+    return [header[i] for i in columns], values
+
+def chi_square_2df(counts_a,counts_b):
+    """ Chi-square test of homogeneity between two 3-category genotype count vectors. With 2 degrees of freedom the
+    p-value is exp(-statistic/2), so no SciPy is needed. """
+    table = np.array([counts_a,counts_b],dtype=float)
+    expected = table.sum(axis=1,keepdims=True)*table.sum(axis=0,keepdims=True)/table.sum()
+    keep = expected.sum(axis=0) > 0
+    statistic = (((table-expected)**2)[:,keep]/expected[:,keep]).sum()
+    return statistic, float(np.exp(-statistic/2))
+
+def pooled_counts(paths):
+    """ Genotype counts of every predictive attribute in cases and controls, pooled over dataset files, plus the mean MAF
+    of the non-predictive attributes. """
+    counts = {}
+    noise_mafs = []
+    for path in paths:
+        header, values = read_dataset(path)
+        endpoint = values[:,-1]
+        for i, name in enumerate(header[:-1]):
+            if name.startswith('M'):
+                for label, rows in (('case',endpoint == 1),('control',endpoint == 0)):
+                    key = (name,label)
+                    counts[key] = counts.get(key,np.zeros(GENOTYPES))+np.bincount(values[rows,i].astype(int),minlength=GENOTYPES)
+            else:
+                noise_mafs.append(values[:,i].mean()/2)
+    return counts, float(np.mean(noise_mafs)) if noise_mafs else None
+
+def compare_datasets(folder_a,folder_b,alpha=0.001):
+    """ Compare two engines' output for the same dataset cell: predictive genotype distributions within cases and
+    controls (chi-square, 2 df) and the mean non-predictive MAF. Returns True if no test rejects at alpha. """
+    counts_a, maf_a = pooled_counts(sorted(glob.glob(os.path.join(folder_a,'*_EDM-*.txt*'))))
+    counts_b, maf_b = pooled_counts(sorted(glob.glob(os.path.join(folder_b,'*_EDM-*.txt*'))))
+    agree = True
+    for key in sorted(set(counts_a) & set(counts_b)):
+        statistic, p = chi_square_2df(counts_a[key],counts_b[key])
+        verdict = 'ok' if p >= alpha else 'DIFFERENT'
+        agree = agree and p >= alpha
+        print(key[0]+' '+key[1]+': chi2='+str(round(statistic,3))+' p='+str(round(p,4))+' '+verdict)
+    if maf_a is not None and maf_b is not None:
+        print('mean non-predictive MAF: '+str(round(maf_a,4))+' vs '+str(round(maf_b,4)))
+    return agree
+
+def attach_option_strings(args):
+    """ Join -D/-M with their quoted option string (-D=...) so argparse never mistakes a string such as
+    "-h heterogeneous ..." for flags of its own. """
+    joined = []
+    i = 0
+    while i < len(args):
+        if args[i] in ('-D','-M') and i+1 < len(args):
+            joined.append(args[i]+'='+args[i+1])
+            i += 2
+        else:
+            joined.append(args[i])
+            i += 1
+    return joined
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Native NumPy engine for GAMETES model search and dataset generation")
+    parser.add_argument('-i',dest='model_files',action='append',default=[],help='input model file (repeat for mixed models)')
+    parser.add_argument('-w',dest='weights',action='append',type=float,default=[],help='relative weight of each input model')
+    parser.add_argument('-D',dest='dataset',type=str,help='GAMETES dataset options',default=None)
+    parser.add_argument('-M',dest='model',type=str,help='GAMETES model search options (see gametes_model_search.py)',default=None)
+    parser.add_argument('-q',dest='quantiles',type=int,help='number of models to select from the model population',default=1)
+    parser.add_argument('-p',dest='population',type=int,help='number of valid models to collect before selecting',default=1000)
+    parser.add_argument('-t',dest='tries',type=int,help='maximum number of candidate models to try',default=100000)
+    parser.add_argument('--workers',dest='workers',type=int,help='processes used by the model search (default: all available cores)',default=None)
+    parser.add_argument('-z','-r',dest='seed',type=int,help='random seed (identical seeds give identical datasets)',default=None)
+    parser.add_argument('--race-dir',dest='race_dir',type=str,help='model search racing others (see gametes_race.py): folder shared by the racers',default=None)
+    parser.add_argument('--race-part',dest='race_part',type=int,help='model search racing others: index of this racer',default=1)
+    parser.add_argument('--data-format',dest='data_format',type=str,help='write GAMETES text or a binary format of gametes_binary.py',default='text',choices=['text','packed','npy'])
+    parser.add_argument('--chunk-mb',dest='chunk_mb',type=float,help='memory budget (MB) of each block of samples written; peak memory does not grow with the attribute count',default=DEFAULT_CHUNK_MB)
+    parser.add_argument('--compare',dest='compare',nargs=2,help='compare the datasets in two folders (e.g. jar vs native output for one cell)',default=None)
+    options = parser.parse_args(attach_option_strings(argv[1:]))
+    if options.compare:
+        return 0 if compare_datasets(options.compare[0],options.compare[1]) else 1
+    if options.model is not None:
+        generate_models(options.model,options.quantiles,options.population,options.tries,options.workers,options.seed,options.race_dir,
+                        options.race_part if options.race_dir else None)
+        return 0
+    if options.dataset is None or not options.model_files:
+        parser.error('dataset generation needs -i <model file> and -D "<options>"')
+    params = {'models':options.model_files,'weights':options.weights,'dataset':options.dataset,'seed':options.seed,'engine':'native'}
+    generate_datasets(options.model_files,options.weights,parse_dataset_options(options.dataset),options.seed,options.chunk_mb,
+                      options.data_format,params)
+    print('Timing: noise_s=%.4f write_s=%.4f' % (TIMINGS['noise_s'],TIMINGS['write_s']))
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,177 @@
+"""
+Description: Archive-wide planning. The generator functions of both archive scripts expand their parameter grids into
+jobs; this module treats those jobs as one plan. Exact duplicates are planned once: a model search or dataset cell whose
+GAMETES run is identical to an earlier one (same arguments and, for datasets, the same model, differing at most in the
+output name) is replaced by a job hard-linking the earlier job's files under its own names, and a job writing the same
+files as an earlier one is dropped. Jobs are then ordered longest first: every job is ranked by its predicted run time
+(the cost model in gametes_resources.py) plus that of the longest chain of jobs waiting on it, so the slowest cells, and
+the models they need, start first and the makespan of the archive shrinks. The command line plans the grids of several
+archive scripts as a single run.
+
+Usage (one run for the grids of both archive scripts, with the run options of the archive scripts):
+python gametes_planner.py --output-path <path> --archive-name <name> --archives full 2way --use all [run options]
+Usage (link step, added to duplicate jobs automatically):
+python gametes_planner.py link <kept job's file prefix> <duplicate's file prefix>
+"""
+
+import sys
+import os
+import re
+import glob
+import shutil
+import argparse
+from gametes_jobs import Job
+from gametes_resources import read_history, calibrate, estimate
+
+MODEL_OUTPUT = re.compile(r'(-M "[^"]* -o )(\S+)\.txt"')
+DATA_OUTPUT = re.compile(r'(-D "[^"]* -o )(\S+)"')
+MODEL_INPUT = re.compile(r'-i (\S+)')
+
+def add_planner_arguments(parser):
+    """ Command line options for ordering the planned jobs. """
+    parser.add_argument('--order',dest='order',type=str,help='start the jobs with the longest predicted chain of work first (longest) or keep the order of the archive scripts (planned)',default='longest',choices=['longest','planned'])
+
+def file_prefix(job):
+    """ Path prefix shared by every file a job writes (model search: <model>_Models.txt, ...; dataset cell:
+    <folder>/<folder name>_EDM-...), or None for other commands. """
+    match = MODEL_OUTPUT.search(job.command)
+    if match:
+        return match.group(2)
+    match = DATA_OUTPUT.search(job.command)
+    if match:
+        return match.group(2)+'/'+os.path.basename(match.group(2))
+    return None
+
+def dedupe_jobs(jobs):
+    """ Drop exact duplicates from the planned jobs. Returns (jobs, duplicates), duplicates being (kept job name, kept
+    prefix, duplicate job, duplicate prefix) for every duplicate writing its files under other names, which
+    add_duplicate_links turns into link jobs once the kept jobs' commands are complete. Must run on the jobs as planned
+    by the generator functions, before any other step. """
+    kept = {} #run key -> (job, file prefix)
+    aliases = {} #model file of a duplicate model search -> model file of the kept search
+    planned = []
+    duplicates = []
+    for job in jobs:
+        prefix = file_prefix(job)
+        if prefix is None:
+            planned.append(job)
+            continue
+        command = MODEL_INPUT.sub(lambda match: '-i '+aliases.get(match.group(1),match.group(1)),job.command)
+        key = (job.group == 'models',DATA_OUTPUT.sub(r'\1<output>"',MODEL_OUTPUT.sub(r'\1<output>.txt"',command)))
+        if key not in kept:
+            kept[key] = (job,prefix)
+            planned.append(job)
+            continue
+        original, original_prefix = kept[key]
+        if prefix == original_prefix:
+            continue
+        if job.group == 'models':
+            for output in job.outputs:
+                aliases[output] = original_prefix+output[len(prefix):]
+        duplicates.append((original.name,original_prefix,job,prefix))
+    if duplicates or len(planned) < len(jobs):
+        print('Planner: '+str(len(jobs)-len(planned))+' duplicate job(s) removed, '+str(len(duplicates))+' linked to the job they duplicate')
+    return planned, duplicates
+
+def add_duplicate_links(jobs,duplicates):
+    """ Add a job for every duplicate that hard-links the files of the job it duplicates (or of that job's shards) under
+    the duplicate's names. Call once the engine, format, compression and placement steps have set the final outputs. """
+    for name, prefix, duplicate, duplicate_prefix in duplicates:
+        sources = [job for job in jobs if job.name == name or job.name.startswith(name+'_shard-')]
+        if not sources:
+            continue
+        inputs = [output for source in sources for output in source.outputs]
+        outputs = [duplicate_prefix+output[len(prefix):] for output in inputs]
+        command = sys.executable+' '+os.path.realpath(__file__)+' link '+prefix+' '+duplicate_prefix
+        jobs.append(Job(duplicate.name,command,duplicate.group,inputs=inputs,outputs=outputs))
+    return jobs
+
+def link_files(prefix,target_prefix):
+    """ Hard-link (or copy, across file systems) every file starting with prefix+'_' to the same name under
+    target_prefix. Returns the number of files linked. """
+    linked = 0
+    for path in sorted(glob.glob(glob.escape(prefix)+'_*')):
+        if not os.path.isfile(path):
+            continue
+        target = target_prefix+path[len(prefix):]
+        os.makedirs(os.path.dirname(target),exist_ok=True)
+        if os.path.exists(target):
+            if os.path.samefile(path,target):
+                linked += 1
+                continue
+            os.remove(target)
+        try:
+            os.link(path,target)
+        except OSError:
+            shutil.copy2(path,target)
+        linked += 1
+    return linked
+
+def job_minutes(job,coefficients,data_format='text'):
+    """ Predicted run time of a job in minutes: the cost model's estimate, else its walltime request, else 0. """
+    predicted = estimate(job,coefficients,data_format)
+    if predicted is not None:
+        return predicted['walltime_min']
+    if job.resources:
+        return job.resources['walltime_min']
+    return 0.0
+
+def prioritize(jobs,options):
+    """ Sort jobs (with dependencies resolved) longest first: by predicted minutes of the job plus the longest chain of
+    jobs depending on it. order_jobs keeps this order wherever dependencies allow. """
+    if getattr(options,'order','longest') != 'longest':
+        return jobs
+    coefficients = calibrate(read_history(options.resource_history))
+    dependents = {}
+    for job in jobs:
+        for dependency in job.depends:
+            dependents.setdefault(id(dependency),[]).append(job)
+    ranks = {}
+    def rank(job):
+        if id(job) not in ranks:
+            ranks[id(job)] = job_minutes(job,coefficients,getattr(options,'data_format','text'))+max([rank(dependent) for dependent in dependents.get(id(job),[])] or [0.0])
+        return ranks[id(job)]
+    return sorted(jobs,key=lambda job: -rank(job))
+
+def main(argv):
+    if argv[1:2] == ['link']:
+        parser = argparse.ArgumentParser(description="Hard-link the files of a job under the names of its duplicate")
+        parser.add_argument('command',choices=['link'])
+        parser.add_argument('prefix',help='file prefix of the kept job')
+        parser.add_argument('target_prefix',help='file prefix of the duplicate job')
+        options = parser.parse_args(argv[1:])
+        if not link_files(options.prefix,options.target_prefix):
+            print('No files found under '+options.prefix)
+            return 1
+        return 0
+
+    from gametes_schedulers import add_run_arguments, run_jobs
+    import gametes_full_archive_gen
+    import gametes_2way_epistasis_archive_gen
+    archives = {'full':gametes_full_archive_gen.plan_archive,'2way':gametes_2way_epistasis_archive_gen.plan_archive}
+    parser = argparse.ArgumentParser(description="Plan the grids of several archive scripts as one run")
+    parser.add_argument('--output-path',dest='output_path',type=str,help='path to output directory')
+    parser.add_argument('--archive-name',dest='archive_name',type=str,help='name of archive output folder (no spaces)')
+    parser.add_argument('--archives',dest='archives',nargs='+',help='archive scripts whose grids are planned',default=['full','2way'],choices=sorted(archives.keys()))
+    parser.add_argument('--use',dest='use',help='model, data, or all (default: model, or all with --plan-only)',type=str,default=None,choices=['model','data','all'])
+    add_run_arguments(parser)
+    options = parser.parse_args(argv[1:])
+    if options.use is None:
+        options.use = 'all' if options.plan_only else 'model'
+
+    job_dest = options.output_path+'/temporary'+'/jobs'
+    log_dest = options.output_path+'/temporary'+'/logs'
+    if not options.plan_only:
+        for folder in (job_dest,log_dest):
+            os.makedirs(folder,exist_ok=True)
+    jobs = []
+    for archive in options.archives:
+        jobs.extend(archives[archive](options.output_path,options.archive_name,options.use,not options.plan_only))
+    failed = run_jobs(jobs,options,job_dest,log_dest)
+    if failed:
+        return 1
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
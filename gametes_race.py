@@ -0,0 +1,170 @@
+"""
+Description: Racing model searches. A penetrance model search is one long run (for 3 loci, one serial search). With
+--race K (native searches, --model-engine native), every model search is run as K independent searches, each with its own
+deterministic seed (derived from the model name like the seeds of replicate shards, passed as -r) and try_count/K tries.
+The searches publish their count of valid models in a shared race folder (<output_path>/temporary/races/<job name>) and
+all stop as soon as they hold the population (-p) together. Their valid models are then merged, scored and the -q
+quantile models selected as usual, giving the same _Models.txt and _Scores.txt layout. The K searches run on the cores of
+the model job, or with --race-tasks as K scheduler jobs followed by a merge job, so they spread over the cluster. GAMETES
+jar searches cannot share their candidate models, and searches run by --adaptive-tries grow their own budget, so --race
+is refused with either.
+
+Usage (added to model jobs automatically):
+python gametes_race.py pool --race-dir <folder> --model-options=<-M options> -q Q -p P <racer command> [...]
+python gametes_race.py merge --race-dir <folder> --model-options=<-M options> -q Q -p P
+"""
+
+import sys
+import os
+import glob
+import shlex
+import shutil
+import signal
+import argparse
+import subprocess
+import numpy as np
+from gametes_jobs import Job, NATIVE_COMMAND, available_cores
+from gametes_shards import shard_seed
+from gametes_planner import MODEL_OUTPUT
+from gametes_adaptive import TRY_OPTION
+from gametes_manifest import record_planned
+from gametes_model_search import parse_model_options, score_models, select_quantiles, write_models
+
+def add_race_arguments(parser):
+    """ Command line options for racing model searches. """
+    parser.add_argument('--race',dest='race',type=int,help='run every native model search as this many searches with their own seeds and a share of the tries, pooling their models until the population is found',default=1)
+    parser.add_argument('--race-tasks',dest='race_tasks',action='store_true',help='with --race: submit the searches racing for a native model search as separate jobs instead of running them on the cores of one job')
+
+def race_dir_for(job_dest,name):
+    """ Folder shared by the searches racing for one model job, under <output_path>/temporary/races. """
+    return os.path.join(os.path.dirname(job_dest),'races',name)
+
+def runner(mode):
+    return sys.executable+' '+os.path.realpath(__file__)+' '+mode
+
+def model_options_of(search):
+    """ The -M option string of a search command. """
+    return search.split('-M "',1)[1].split('"',1)[0]
+
+def check_race_options(options):
+    """ Refuse --race where it cannot pool: GAMETES jar searches cannot share their candidate models, and searches run by
+    --adaptive-tries grow their own budget. """
+    if options.race < 2:
+        return
+    if options.model_engine != 'native':
+        raise ValueError('--race needs --model-engine native: GAMETES jar searches cannot pool their candidate models')
+    if options.adaptive_tries:
+        raise ValueError('--race cannot be combined with --adaptive-tries')
+
+def apply_race(jobs,options,job_dest,manifest_dir,dry_run=False):
+    """ Replace every native model search by --race searches with their own seeds and share of the tries, pooled within
+    the model job, or with --race-tasks run as separate jobs the model job then merges. Steps appended to the search
+    (model cache, ...) run once, after the race. See check_race_options for the searches that cannot be raced. """
+    if options.race < 2:
+        return jobs
+    check_race_options(options)
+    count = options.race
+    raced = []
+    tasks = []
+    for job in jobs:
+        search, separator, rest = job.command.partition(' && ')
+        head, quote, tail = search.rpartition('"') #-q, -p and -t follow the quoted -M option string
+        match = TRY_OPTION.search(tail)
+        if job.group != 'models' or match is None or MODEL_OUTPUT.search(search) is None or not search.startswith(NATIVE_COMMAND+' '):
+            raced.append(job)
+            continue
+        race_dir = race_dir_for(job_dest,job.name)
+        if not dry_run:
+            shutil.rmtree(race_dir,ignore_errors=True) #counts left by an earlier race would end this one early
+            os.makedirs(race_dir)
+        share = str(max(1,int(match.group(2))//count))
+        commands = [head+quote+tail[:match.start(2)]+share+tail[match.end(2):]+' -r '+str(shard_seed(job.name,k))+' --race-dir '+race_dir+' --race-part '+str(k+1)
+                    for k in range(count)]
+        model_options = ' --model-options='+shlex.quote(model_options_of(search))+' -q '+str(job.params.get('quantiles',1))+' -p '+str(job.params.get('pop_count',1000))
+        if options.race_tasks:
+            racers = [Job(job.name+'_race-'+str(k+1),command,job.group,outputs=[os.path.join(race_dir,str(k+1)+'.npz')]) for k, command in enumerate(commands)]
+            for racer in racers:
+                racer.resources = job.resources
+            job.command = runner('merge')+' --race-dir '+race_dir+model_options+separator+rest
+            job.inputs = job.inputs+[racer.outputs[0] for racer in racers]
+            tasks.extend(racers)
+            raced.extend(racers)
+        else:
+            job.command = runner('pool')+' --race-dir '+race_dir+model_options+' '+' '.join(shlex.quote(command) for command in commands)+separator+rest
+            if job.resources:
+                job.resources = dict(job.resources,memory_mb=job.resources['memory_mb']*count,memory_limit_mb=job.resources['memory_limit_mb']*count)
+        raced.append(job)
+    if tasks and not dry_run:
+        record_planned(tasks,manifest_dir)
+    return raced
+
+def start(command):
+    return subprocess.Popen(command,shell=True,start_new_session=True)
+
+def stop(process):
+    """ Stop a racer and everything it started (a shell, worker processes). """
+    if process.poll() is None:
+        try:
+            os.killpg(process.pid,signal.SIGTERM)
+        except OSError:
+            pass
+        process.wait()
+
+def merge_race(race_dir,model_options,quantiles,population):
+    """ Pool the valid models of every racer (up to population, in racer order), score them and write the selected
+    quantile models. Returns the files written. """
+    model = parse_model_options(model_options)
+    tables = []
+    prevalence = []
+    parts = sorted(glob.glob(os.path.join(race_dir,'*.npz')),key=lambda path: int(os.path.basename(path).split('.')[0]))
+    for path in parts:
+        part = np.load(path)
+        tables.append(part['tables'])
+        prevalence.append(part['prevalence'])
+    if not parts or sum(len(values) for values in prevalence) == 0:
+        raise ValueError('No valid model found by the searches racing in '+race_dir)
+    tables = np.concatenate(tables)[:population]
+    prevalence = np.concatenate(prevalence)[:population]
+    edm, cor = score_models(tables,prevalence,model.mafs)
+    print('Race: '+str(len(prevalence))+' valid model(s) pooled from '+str(len(parts))+' search(es)')
+    if len(prevalence) < population:
+        print('Race: only '+str(len(prevalence))+' of the '+str(population)+' models asked for were found')
+    if os.path.dirname(model.output):
+        os.makedirs(os.path.dirname(model.output),exist_ok=True)
+    return write_models(model.output,tables,prevalence,edm,cor,model.mafs,model.heritability,select_quantiles(edm,quantiles))
+
+def race_pool(commands,race_dir,model_options,quantiles,population):
+    """ Run native racers side by side on this machine's cores, then merge them. """
+    workers = max(1,available_cores()//len(commands))
+    processes = [start(command+' --workers '+str(workers)) for command in commands]
+    try:
+        returncodes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            stop(process)
+    if all(returncodes):
+        print('Race: every search failed')
+        return returncodes[0]
+    merge_race(race_dir,model_options,quantiles,population)
+    return 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Race independent seeded GAMETES model searches")
+    parser.add_argument('mode',choices=['pool','merge'],help='run native racers and merge them (pool), or merge racers run as separate jobs (merge)')
+    parser.add_argument('--race-dir',dest='race_dir',type=str,required=True,help='folder shared by the racers')
+    parser.add_argument('--model-options',dest='model_options',type=str,required=True,help='the -M options of the search')
+    parser.add_argument('-q','--quantiles',dest='quantiles',type=int,default=1,help='models selected')
+    parser.add_argument('-p',dest='population',type=int,default=1000,help='valid models pooled before selecting')
+    parser.add_argument('commands',nargs='*',help='racer commands (pool)')
+    options = parser.parse_intermixed_args(argv[1:]) #mode first, racer commands after the options
+
+    if options.mode == 'pool':
+        if not options.commands:
+            parser.error('pool needs racer commands')
+        return race_pool(options.commands,options.race_dir,options.model_options,options.quantiles,options.population)
+    merge_race(options.race_dir,options.model_options,options.quantiles,options.population)
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,165 @@
+"""
+Description: Zero-copy reader over a generated archive. Every dataset (one model quantile and replicate of a cell) is
+exposed as a (samples, attributes) uint8 NumPy array memory mapped from a binary sidecar, <name>.npy, with its .json
+header (see gametes_binary.py). The sidecar is built once, on first access or for a whole archive with the index
+command, from the GAMETES text file (compressed or not) or a 2-bit packed copy. After that, opening a dataset parses
+nothing: slicing attributes or samples only touches the pages needed, and any number of worker processes share those
+pages through the OS page cache instead of each holding a parsed copy.
+
+Usage (in Python):
+    from gametes_reader import open_dataset, open_cell
+    data = open_dataset('.../gametes_2way_epistasis_A_100_S_1600_L_2_H_0.4_F_0.2_K_0.3/..._EDM-1_01.txt')
+    X, y = data.genotypes, data.endpoint          #memory mapped genotypes, Class column
+    X[:, data.model_loci]                          #predictive attributes only
+    for (quantile, replicate), data in open_cell('.../gametes_2way_epistasis_A_100_S_1600_...').items(): ...
+Usage (index command, builds every missing or outdated sidecar):
+python gametes_reader.py index <archive or dataset folder> [...] [--jobs N]
+"""
+
+import sys
+import os
+import glob
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gametes_jobs import available_cores
+from gametes_binary import DATASET_FILE, read_header, write_header, convert_file, packed_width, unpack_genotypes
+from gametes_compress import find_dataset_file, strip_compression
+
+class Dataset:
+    """ One archive dataset backed by its memory mapped sidecar. genotypes is a read-only (samples, attributes) uint8
+    np.memmap, endpoint the Class column (int for case/control, float for continuous endpoints), labels the Model
+    column of heterogeneous data (or None), attributes the column names and model_loci the columns of the predictive
+    loci. params holds the generating parameters recorded in the header. """
+    def __init__(self,base):
+        self.base = base
+        self.header = read_header(base)
+        self.genotypes = np.load(base+'.npy',mmap_mode='r')
+        self.attributes = self.header['attributes']
+        self.model_loci = self.header['model_loci']
+        self.endpoint = np.array(self.header['class'],dtype=float if any(isinstance(value,str) for value in self.header['class']) else np.uint8)
+        self.labels = self.header.get('model')
+        self.params = self.header.get('params',{})
+
+    def columns(self,names):
+        """ Genotypes of the named attributes, in the order given. """
+        index = dict((name,i) for i, name in enumerate(self.attributes))
+        return self.genotypes[:,[index[name] for name in names]]
+
+def dataset_base(path):
+    """ Dataset path without extension, whichever file of the dataset (.txt, .txt.gz, .txt.zst, .gt2, .npy or .json)
+    is given. """
+    path = strip_compression(path)
+    for extension in ('.txt','.gt2','.npy','.json'):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+def sidecar_current(base):
+    """ True if base.npy and its header exist and are at least as new as the text or packed file they came from. """
+    if not os.path.isfile(base+'.npy') or not os.path.isfile(base+'.json'):
+        return False
+    built = os.path.getmtime(base+'.npy')
+    for source in (find_dataset_file(base+'.txt'),base+'.gt2'):
+        if os.path.isfile(source) and os.path.getmtime(source) > built:
+            return False
+    return True
+
+def build_sidecar(base):
+    """ Build base.npy (and base.json if missing) from the text or packed dataset. The sidecar is written under a
+    temporary name and renamed into place, the header last, so concurrent readers never map a partial file. Returns
+    base. """
+    temp_base = os.path.join(os.path.dirname(base),'.'+os.path.basename(base)+'.tmp'+str(os.getpid()))
+    text = find_dataset_file(base+'.txt')
+    if os.path.isfile(base+'.gt2') and os.path.isfile(base+'.json') and not os.path.isfile(text):
+        header = read_header(base)
+        columns = len(header['attributes'])
+        packed = np.memmap(base+'.gt2',dtype=np.uint8,mode='r',shape=(header['samples'],packed_width(columns)))
+        out = np.lib.format.open_memmap(temp_base+'.npy',mode='w+',dtype=np.uint8,shape=(header['samples'],columns))
+        for start in range(0,header['samples'],256):
+            out[start:start+256] = unpack_genotypes(packed[start:start+256],columns)
+        out.flush()
+        del out
+        os.replace(temp_base+'.npy',base+'.npy')
+        return base
+    if not os.path.isfile(text):
+        raise IOError('No dataset found at '+base+' (.txt, .gt2 or .npy)')
+    params = read_header(base).get('params',{}) if os.path.isfile(base+'.json') else {}
+    path, error = convert_file(text,'npy',params,base=temp_base)
+    if error is not None:
+        for extension in ('.npy','.json'):
+            if os.path.exists(temp_base+extension):
+                os.remove(temp_base+extension)
+        raise IOError('Could not index '+path+': '+error)
+    header = read_header(temp_base)
+    os.replace(temp_base+'.npy',base+'.npy')
+    write_header(base,header)
+    os.remove(temp_base+'.json')
+    return base
+
+def open_dataset(path,build=True):
+    """ Open one dataset (any of its files, or its path without extension) as a memory mapped Dataset, building the
+    sidecar first if it is missing or outdated and build is set. """
+    base = dataset_base(path)
+    if not sidecar_current(base):
+        if not build:
+            raise IOError('No current sidecar for '+base+' (run: python gametes_reader.py index <folder>)')
+        build_sidecar(base)
+    return Dataset(base)
+
+def cell_bases(folder):
+    """ Every dataset of a cell folder, whatever its storage, as {(quantile, replicate): base path}. """
+    bases = {}
+    for path in glob.glob(os.path.join(folder,'*_EDM-*_*.*')):
+        base = dataset_base(path)
+        match = DATASET_FILE.search(base+'.txt')
+        if match and not os.path.basename(base).startswith('.'):
+            bases[(int(match.group(1)),int(match.group(2)))] = base
+    return dict(sorted(bases.items()))
+
+def open_cell(folder,build=True):
+    """ Every dataset of one cell folder (e.g. gametes_2way_epistasis_A_100_S_1600_L_2_H_0.4_F_0.2_K_0.3), as
+    {(quantile, replicate): Dataset}. """
+    return dict((key,open_dataset(base,build)) for key, base in cell_bases(folder).items())
+
+def archive_bases(paths):
+    """ Base paths of every dataset under the given archives or folders. """
+    bases = []
+    for path in paths:
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [name for name in dirs if name != 'temporary' and not name.startswith('.')]
+            if any(DATASET_FILE.search(dataset_base(name)+'.txt') for name in names):
+                bases.extend(cell_bases(root).values())
+    return bases
+
+def index_archive(paths,workers=None):
+    """ Build every missing or outdated sidecar under paths, one dataset per worker process. Returns the number of
+    datasets that could not be indexed. """
+    pending = [base for base in archive_bases(paths) if not sidecar_current(base)]
+    failed = 0
+    executor = ProcessPoolExecutor(max_workers=workers or available_cores())
+    try:
+        futures = [(base,executor.submit(build_sidecar,base)) for base in pending]
+        for base, future in futures:
+            try:
+                future.result()
+            except (IOError,ValueError) as error:
+                print('FAILED '+base+': '+str(error))
+                failed += 1
+    finally:
+        executor.shutdown()
+    print('Indexed '+str(len(pending)-failed)+' dataset(s)')
+    return failed
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Build the memory mapped sidecars of a GAMETES archive")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    index = subparsers.add_parser('index',help='build every missing or outdated .npy sidecar')
+    index.add_argument('paths',nargs='+',help='archive or dataset folders')
+    index.add_argument('--jobs',dest='jobs',type=int,default=None,help='number of worker processes (default: all available cores)')
+    options = parser.parse_args(argv[1:])
+    return 1 if index_archive(options.paths,options.jobs) else 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
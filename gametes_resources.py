@@ -0,0 +1,226 @@
+"""
+Description: Per-job resource estimates for cluster submission. Instead of reserving the same memory and walltime for
+every job, memory, walltime and output size are predicted from the job parameters:
+- dataset jobs: attributes x samples (values held per dataset) drives memory; values x replicates x quantiles, scaled
+  by the number of mixed models, drives walltime; the storage format gives the output bytes;
+- model jobs: population x 3^loci drives memory and tries x 3^loci drives walltime.
+Each quantity is a + b*x. The built-in coefficients are rough priors; they are calibrated by least squares from
+recorded runs (or scaled by the median observed/predicted ratio while there are too few). With --resources estimate,
+batch schedulers request the predicted memory and walltime (with headroom) per job or job array, GAMETES jar commands
+get a matching -Xmx, and the telemetry runner every job goes through (gametes_telemetry.py) also appends its elapsed
+time and peak memory to a shared history file (default ~/.cache/gametes_archive_gen/resource_history.jsonl, or
+$GAMETES_RESOURCE_HISTORY), so estimates improve with every archive generated. Small calibration runs recorded by
+gametes_benchmark.py run --record-history feed the same fit. With --plan-only, the grids are expanded and the estimated
+job counts, CPU hours, peak memory and output bytes of every generator are printed instead of submitting anything.
+"""
+
+import os
+import json
+import time
+import subprocess
+
+DEFAULT_HISTORY = os.environ.get('GAMETES_RESOURCE_HISTORY',os.path.join(os.path.expanduser('~'),'.cache','gametes_archive_gen','resource_history.jsonl'))
+MIN_FIT_RUNS = 5 #recorded runs (at two or more sizes) needed before the coefficients are refitted
+JVM_OVERHEAD_MB = 256 #non-heap memory of the JVM, kept out of -Xmx
+
+#Prior coefficients (a, b) of a + b*x for each (job kind, engine, quantity); memory in MB, walltime in minutes
+PRIORS = {
+    ('data','gametes','memory'): (512.0,24e-6),       #JVM plus ~24 bytes per value of the dataset being built
+    ('data','gametes','walltime'): (1.0,1e-7),        #~10M values written per minute
+    ('data','native','memory'): (128.0,1e-6),         #bounded by the streaming block size
+    ('data','native','walltime'): (0.2,2e-8),
+    ('models','gametes','memory'): (1024.0,16e-6),    #candidate population held in memory
+    ('models','gametes','walltime'): (1.0,2e-7),
+    ('models','native','memory'): (256.0,8e-6),
+    ('models','native','walltime'): (0.2,2e-9),
+}
+
+def add_resource_arguments(parser):
+    """ Command line options for per-job resource requests. """
+    parser.add_argument('--resources',dest='resources',type=str,help='cluster memory/walltime requests: the fixed scheduler settings, or estimated per job from the job parameters and recorded runs',default='fixed',choices=['fixed','estimate'])
+    parser.add_argument('--resource-history',dest='resource_history',type=str,help='file recording the measured memory and walltime of every job (used to calibrate estimates)',default=DEFAULT_HISTORY)
+    parser.add_argument('--plan-only',dest='plan_only',action='store_true',help='expand the grids and print the job count, CPU hours, peak memory and output size estimated for every generator, submitting nothing (costs models and datasets unless --use is given)')
+
+def job_engine(job):
+    return 'native' if 'gametes_native.py' in job.command.split(' && ')[0] else 'gametes'
+
+def job_kind(job):
+    return 'models' if job.group == 'models' else 'data'
+
+def job_features(job):
+    """ Size measures of a job: x for memory and for walltime, as used by the linear cost model. Returns None for jobs
+    without the parameters needed. """
+    params = job.params
+    if job.group == 'models':
+        if 'pop_count' not in params:
+            return None
+        cells = 3**params.get('locus',1)
+        return {'memory':params['pop_count']*cells,'walltime':params['try_count']*cells}
+    if 'attributes' not in params:
+        return None
+    values = params['attributes']*params['samples']
+    total = values*params['replicates']*params.get('quantiles',1)
+    return {'memory':values*params.get('models',1),'walltime':total*(1+0.25*(params.get('models',1)-1))}
+
+def output_bytes(job,data_format='text'):
+    """ Expected size of a dataset job's output: 2 bytes per text value (digit and tab), a quarter byte packed, one byte
+    as npy. """
+    params = job.params
+    if job.group == 'models' or 'attributes' not in params:
+        return 0
+    per_value = {'text':2.0,'packed':0.25,'npy':1.0}.get(data_format,2.0)
+    files = params['replicates']*params.get('quantiles',1)
+    header = 8*params['attributes']
+    return int(files*(per_value*(params['attributes']+1)*params['samples']+header))
+
+def read_history(path):
+    """ Recorded runs, as a list of dicts (kind, engine, features, elapsed_min, max_rss_mb). """
+    runs = []
+    if not os.path.isfile(path):
+        return runs
+    history_file = open(path)
+    for line in history_file:
+        try:
+            runs.append(json.loads(line))
+        except ValueError:
+            continue
+    history_file.close()
+    return runs
+
+def fit_line(points):
+    """ Least squares a + b*x through (x, y) points, with a and b kept non-negative. None if x does not vary. """
+    n = float(len(points))
+    mean_x = sum(x for x, y in points)/n
+    mean_y = sum(y for x, y in points)/n
+    spread = sum((x-mean_x)**2 for x, y in points)
+    if spread == 0:
+        return None
+    b = max(0.0,sum((x-mean_x)*(y-mean_y) for x, y in points)/spread)
+    a = max(0.0,mean_y-b*mean_x)
+    return a, b
+
+def calibrate(runs):
+    """ Coefficients for every (kind, engine, quantity): refitted from the recorded runs when there are enough of them,
+    otherwise the prior scaled by the median ratio of observed to predicted values (the prior itself without runs). """
+    coefficients = {}
+    for key, prior in PRIORS.items():
+        kind, engine, quantity = key
+        observed = 'max_rss_mb' if quantity == 'memory' else 'elapsed_min'
+        points = [(run['features'][quantity],run[observed]) for run in runs
+                  if run.get('kind') == kind and run.get('engine') == engine and run.get('returncode',0) == 0]
+        fitted = fit_line(points) if len(points) >= MIN_FIT_RUNS else None
+        if fitted is not None:
+            coefficients[key] = fitted
+        elif points:
+            ratios = sorted(y/(prior[0]+prior[1]*x) for x, y in points)
+            scale = ratios[len(ratios)//2]
+            coefficients[key] = (prior[0]*scale,prior[1]*scale)
+        else:
+            coefficients[key] = prior
+    return coefficients
+
+def estimate(job,coefficients,data_format='text'):
+    """ Predicted memory (MB), walltime (minutes) and output bytes of one job, or None without job parameters. """
+    features = job_features(job)
+    if features is None:
+        return None
+    kind = job_kind(job)
+    engine = job_engine(job)
+    memory = coefficients[(kind,engine,'memory')]
+    walltime = coefficients[(kind,engine,'walltime')]
+    return {'memory_mb':memory[0]+memory[1]*features['memory'],'walltime_min':walltime[0]+walltime[1]*features['walltime'],
+            'output_bytes':output_bytes(job,data_format),'kind':kind,'engine':engine,'features':features}
+
+def apply_resources(jobs,options,settings):
+    """ Attach a resource request to every job (job.resources: reserved memory and hard limit in MB, walltime in
+    minutes) and give GAMETES jar commands a matching -Xmx. Requests include the headroom set in the scheduler
+    settings. Jobs without parameters keep the fixed settings. """
+    coefficients = calibrate(read_history(options.resource_history))
+    total_minutes = 0.0
+    total_bytes = 0
+    for job in jobs:
+        predicted = estimate(job,coefficients,getattr(options,'data_format','text'))
+        if predicted is None:
+            continue
+        memory = int(predicted['memory_mb']*settings['memory_headroom'])+1
+        job.resources = {'memory_mb':memory,'memory_limit_mb':int(memory*settings['memory_headroom'])+1,
+                         'walltime_min':int(predicted['walltime_min']*settings['walltime_headroom'])+1}
+        if job.command.startswith('java -jar '):
+            job.command = 'java -Xmx'+str(max(memory-JVM_OVERHEAD_MB,JVM_OVERHEAD_MB))+'m -jar '+job.command[len('java -jar '):]
+        total_minutes += predicted['walltime_min']
+        total_bytes += predicted['output_bytes']
+    print('Resource estimates: '+str(round(total_minutes/60,1))+' CPU hours, '+str(round(total_bytes/1024.0**3,1))+' GB of output')
+    return jobs
+
+def format_bytes(size):
+    for unit in ('B','KB','MB','GB','TB'):
+        if size < 1024 or unit == 'TB':
+            return ('%.0f ' if unit == 'B' else '%.1f ')%size+unit
+        size /= 1024.0
+
+def plan_label(job):
+    """ Generator a job belongs to: its dataset folder, or models_L_<loci> for model searches. """
+    if job.group == 'models' and 'locus' in job.params:
+        return 'models_L_'+str(job.params['locus'])
+    return job.group
+
+def plan_costs(jobs,options):
+    """ Print the planned jobs of every generator with their estimated CPU hours, peak memory of a single job and
+    output bytes, and the totals, from the cost model calibrated on the resource history. Nothing is submitted. """
+    runs = read_history(options.resource_history)
+    coefficients = calibrate(runs)
+    data_format = getattr(options,'data_format','text')
+    rows = {} #generator -> [jobs, minutes, peak MB, bytes, jobs without estimate]
+    for job in jobs:
+        row = rows.setdefault(plan_label(job),[0,0.0,0.0,0,0])
+        row[0] += 1
+        predicted = estimate(job,coefficients,data_format)
+        if predicted is None:
+            row[4] += 1
+            continue
+        row[1] += predicted['walltime_min']
+        row[2] = max(row[2],predicted['memory_mb'])
+        row[3] += predicted['output_bytes']
+    fitted = []
+    for kind, engine in sorted(set((job_kind(job),job_engine(job)) for job in jobs if job_features(job) is not None)):
+        count = len([run for run in runs if run.get('kind') == kind and run.get('engine') == engine and run.get('returncode',0) == 0])
+        fitted.append(kind+'/'+engine+': '+(str(count)+' run(s)' if count else 'prior only'))
+    print('Cost model calibrated from '+options.resource_history+' ('+', '.join(fitted)+')')
+    if not runs:
+        print('No calibration runs recorded: python gametes_benchmark.py run --record-history '+options.resource_history+' records some')
+    width = max([len(label) for label in rows]+[9])
+    print('%-*s %8s %11s %12s %12s' % (width,'generator','jobs','CPU hours','peak memory','on disk'))
+    total = [0,0.0,0.0,0,0]
+    for label, row in rows.items():
+        print('%-*s %8d %11.1f %12s %12s' % (width,label,row[0],row[1]/60,format_bytes(row[2]*1024.0**2),format_bytes(row[3]))
+              +(' ('+str(row[4])+' job(s) not estimated)' if row[4] else ''))
+        total = [total[0]+row[0],total[1]+row[1],max(total[2],row[2]),total[3]+row[3],total[4]+row[4]]
+    print('%-*s %8d %11.1f %12s %12s' % (width,'total',total[0],total[1]/60,format_bytes(total[2]*1024.0**2),format_bytes(total[3])))
+    if total[4]:
+        print(str(total[4])+' job(s) without parameters (links to duplicates, ...) are counted but not estimated')
+    if getattr(options,'compress','none') != 'none':
+        print('Output sizes are before '+options.compress+' compression')
+    print('Plan only: nothing submitted')
+    return 0
+
+def run_measured(command,stdout=None,stderr=None):
+    """ Run command through the shell and return (exit status, usage) with usage holding the elapsed and CPU seconds and
+    the peak memory (MB) of the largest process it ran. The rusage os.wait4 returns for the shell includes every process
+    the shell waited for (java, python), so nothing needs to be polled while the command runs. """
+    started = time.time()
+    process = subprocess.Popen(command,shell=True,stdout=stdout,stderr=stderr)
+    pid, status, usage = os.wait4(process.pid,0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, {'wall_s':time.time()-started,'cpu_s':usage.ru_utime+usage.ru_stime,'max_rss_mb':usage.ru_maxrss/1024.0}
+
+def record_usage(history,kind,engine,features,returncode,usage,started):
+    """ Append one measured run (see run_measured) to the resource history used by calibrate. """
+    run = {'kind':kind,'engine':engine,'features':features,'elapsed_min':usage['wall_s']/60.0,'max_rss_mb':usage['max_rss_mb'],
+           'returncode':returncode,'recorded':started}
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(history)),exist_ok=True)
+        history_file = open(history,'a')
+        history_file.write(json.dumps(run,sort_keys=True)+'\n')
+        history_file.close()
+    except OSError as error:
+        print('Could not record resource usage in '+history+': '+str(error))
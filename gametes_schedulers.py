@@ -0,0 +1,392 @@
+"""
+Description: Scheduler backends used to execute the jobs planned by the archive generation scripts. Each backend (local pool,
+LSF, SLURM, dry-run) takes the same list of Jobs, and all queue, memory and walltime settings live in SCHEDULER_SETTINGS
+(optionally overridden by a JSON config file) instead of being written into every generator. With --resources estimate,
+memory and walltime are instead requested per job from the cost model in gametes_resources.py.
+"""
+
+import os
+import re
+import json
+import time
+import subprocess
+from gametes_jobs import str2bool, run_local_jobs, resolve_dependencies, order_jobs, job_depth, apply_engine, apply_format
+from gametes_model_cache import add_cache_arguments, apply_model_cache
+from gametes_compress import add_compress_arguments, apply_compression
+from gametes_shards import add_shard_arguments, apply_sharding, add_placement_step
+from gametes_virtual import add_virtual_arguments, plan_units, write_index, virtual_index_path_for
+from gametes_planner import add_planner_arguments, dedupe_jobs, add_duplicate_links, prioritize
+from gametes_batch import add_batch_arguments, plan_batches, apply_batches, batch_dir_for
+from gametes_monitor import add_monitor_arguments, monitor_jobs
+from gametes_resources import add_resource_arguments, apply_resources, plan_costs
+from gametes_adaptive import add_adaptive_arguments, apply_adaptive_tries
+from gametes_race import add_race_arguments, check_race_options, apply_race
+from gametes_telemetry import telemetry_path_for, add_telemetry_step
+from gametes_manifest import add_manifest_arguments, manifest_dir_for, select_jobs, record_planned, record_completion, add_record_step
+
+#Default cluster resources for every GAMETES job. Override with --scheduler-config (JSON with any of these keys).
+SCHEDULER_SETTINGS = {
+    'scheduler': None,          #local, lsf, slurm or dry-run (None falls back to --run-parallel)
+    'queue': 'i2c2_normal',     #LSF queue / SLURM partition
+    'memory': '4G',             #memory reserved per job
+    'memory_limit': '15GB',     #hard memory limit per job (LSF -M)
+    'walltime': None,           #walltime limit per job in minutes (None = queue default)
+    'array_limit': None,        #maximum number of array tasks running at once
+    'submit_delay': 0,          #seconds to wait between submissions
+    'memory_headroom': 1.5,     #with --resources estimate: memory requested per predicted MB (the hard limit adds as much again)
+    'walltime_headroom': 2.0,   #with --resources estimate: walltime requested per predicted minute
+}
+
+#Scheduler job states as seen by the monitor (see gametes_monitor.py); anything else counts as running (LSF) or failed (SLURM)
+LSF_STATES = {'PEND':'pending','PSUSP':'pending','WAIT':'pending','DONE':'done','EXIT':'failed'}
+SLURM_STATES = {'PENDING':'pending','REQUEUED':'pending','RUNNING':'running','CONFIGURING':'running','COMPLETING':'running',
+                'SUSPENDED':'running','RESIZING':'running','COMPLETED':'done'}
+
+def add_run_arguments(parser):
+    """ Command line options controlling how generated jobs are executed. Shared by both archive scripts. """
+    parser.add_argument('--run-parallel',dest='run_parallel',type=str2bool,help='submit jobs to the LSF cluster (True) or run them on this machine (False); superseded by --scheduler',default=True)
+    parser.add_argument('--scheduler',dest='scheduler',type=str,help='backend used to run jobs',default=None,choices=sorted(SCHEDULERS.keys()))
+    parser.add_argument('--scheduler-config',dest='scheduler_config',type=str,help='JSON file overriding the default scheduler settings (queue, memory, walltime, ...)',default=None)
+    parser.add_argument('--jobs',dest='jobs',type=int,help='number of GAMETES jobs to run at once when running locally (defaults to the number of available cores)',default=None)
+    parser.add_argument('--array','--lsf-array',dest='array',type=str,help='submit one job array per generator (generator), one for the whole run (archive), or one job per dataset cell (none)',default='none',choices=['none','generator','archive'])
+    parser.add_argument('--array-limit',dest='array_limit',type=int,help='maximum number of array tasks the cluster may run at once',default=None)
+    parser.add_argument('--engine',dest='engine',type=str,help='dataset generation engine: the GAMETES jar or the native NumPy implementation (gametes_native.py)',default='gametes',choices=['gametes','native'])
+    parser.add_argument('--model-engine',dest='model_engine',type=str,help='model search engine: the GAMETES jar or the native NumPy search (gametes_model_search.py)',default='gametes',choices=['gametes','native'])
+    parser.add_argument('--chunk-mb',dest='chunk_mb',type=float,help='with --engine native: memory budget (MB) of each block of samples written, so wide datasets need no extra memory',default=None)
+    parser.add_argument('--data-format',dest='data_format',type=str,help='dataset storage: GAMETES text, 2-bit packed genotypes or uint8 .npy arrays, each binary file with a .json header (see gametes_binary.py)',default='text',choices=['text','packed','npy'])
+    add_planner_arguments(parser)
+    add_shard_arguments(parser)
+    add_virtual_arguments(parser)
+    add_compress_arguments(parser)
+    add_resource_arguments(parser)
+    add_adaptive_arguments(parser)
+    add_race_arguments(parser)
+    add_batch_arguments(parser)
+    add_monitor_arguments(parser)
+    add_cache_arguments(parser)
+    add_manifest_arguments(parser)
+
+def load_settings(options):
+    """ Combine the default settings, the optional JSON config file and command line overrides. """
+    settings = dict(SCHEDULER_SETTINGS)
+    if options.scheduler_config:
+        config_file = open(options.scheduler_config)
+        config = json.load(config_file)
+        config_file.close()
+        unknown = set(config) - set(SCHEDULER_SETTINGS)
+        if unknown:
+            raise ValueError('Unknown scheduler setting(s): '+', '.join(sorted(unknown)))
+        settings.update(config)
+    if options.scheduler is not None:
+        settings['scheduler'] = options.scheduler
+    if settings['scheduler'] is None:
+        settings['scheduler'] = 'lsf' if options.run_parallel else 'local'
+    if options.array_limit is not None:
+        settings['array_limit'] = options.array_limit
+    return settings
+
+def get_scheduler(options,job_dest,log_dest):
+    """ Build the scheduler backend selected by the run options. """
+    settings = load_settings(options)
+    return SCHEDULERS[settings['scheduler']](settings,options,job_dest,log_dest)
+
+def run_jobs(jobs,options,job_dest,log_dest):
+    """ Take planned jobs through the planning steps below (each documented in its module) and dispatch them to the
+    selected scheduler, or watch them with --max-in-flight (see gametes_monitor.py). With --plan-only, only their estimated
+    cost is printed. Returns the number of jobs that failed (or failed to submit). """
+    check_race_options(options)
+    scheduler = get_scheduler(options,job_dest,log_dest)
+    dry_run = isinstance(scheduler,DryRunScheduler)
+    manifest_dir = manifest_dir_for(job_dest)
+    jobs, duplicates = dedupe_jobs(jobs)
+    if options.virtual:
+        jobs = plan_units(jobs)
+    else:
+        jobs = apply_sharding(jobs,options.shards,options.shard_min_values)
+    jobs = apply_engine(jobs,options.engine,options.model_engine,options.chunk_mb)
+    jobs = apply_format(jobs,options.data_format)
+    jobs = apply_compression(jobs,options.compress,options.compress_jobs)
+    jobs = add_placement_step(jobs)
+    jobs = add_duplicate_links(jobs,duplicates)
+    if options.plan_only:
+        return plan_costs(jobs,options)
+    if options.virtual:
+        jobs = write_index(jobs,virtual_index_path_for(job_dest),dry_run)
+    jobs = select_jobs(jobs,manifest_dir,options.force)
+    if not dry_run:
+        record_planned(jobs,manifest_dir)
+    remaining = apply_model_cache(jobs,options,dry_run)
+    if options.resources == 'estimate':
+        remaining = apply_resources(remaining,options,scheduler.settings)
+    remaining = apply_adaptive_tries(remaining,options)
+    remaining = apply_race(remaining,options,job_dest,manifest_dir,dry_run)
+    remaining = plan_batches(remaining,options)
+    if not dry_run:
+        for job in jobs:
+            if job not in remaining:
+                record_completion(manifest_dir,job.name,0)
+        history = options.resource_history if options.resources == 'estimate' else None
+        add_telemetry_step(remaining,telemetry_path_for(job_dest),manifest_dir,scheduler.run_ref,history)
+        add_record_step(remaining,manifest_dir)
+    remaining = apply_batches(remaining,batch_dir_for(job_dest),dry_run)
+    jobs = order_jobs(prioritize(resolve_dependencies(remaining),options))
+    if options.max_in_flight and not dry_run:
+        return monitor_jobs(jobs,scheduler,options)
+    return scheduler.run(jobs)
+
+def group_jobs(jobs,mode):
+    """ Bundle jobs for array submission, either by generator output (mode 'generator') or all together ('archive').
+    A whole-archive array is split by dependency level so that no array has to wait on one of its own tasks. Groups are
+    returned in an order where every group comes after the groups it depends on. """
+    groups = {}
+    for job in jobs:
+        if mode == 'archive':
+            depth = job_depth(job)
+            key = 'gametes_archive' if depth == 0 else 'gametes_archive_'+str(depth+1)
+        else:
+            key = job.group
+        groups.setdefault(key,[]).append(job)
+    return dict(sorted(groups.items(),key=lambda item: max(job_depth(job) for job in item[1])))
+
+def batch_resources(jobs):
+    """ Per-job resource request covering every job of a batch (the largest of each quantity), or None if any job has
+    no estimate, in which case the fixed settings apply. """
+    requests = [job.resources for job in jobs]
+    if not requests or None in requests:
+        return None
+    return dict((key,max(request[key] for request in requests)) for key in requests[0])
+
+class Scheduler:
+    """ Base class for all backends. Subclasses implement run(jobs) and return the number of failed jobs. """
+    def __init__(self,settings,options,job_dest,log_dest):
+        self.settings = settings
+        self.options = options
+        self.job_dest = job_dest
+        self.log_dest = log_dest
+        self.run_ref = time.strftime('%Y%m%d_%H%M%S')+'_'+str(os.getpid())
+
+    def run(self,jobs):
+        raise NotImplementedError
+
+class LocalScheduler(Scheduler):
+    """ Runs jobs on this machine with a bounded pool of worker processes. """
+    def run(self,jobs):
+        failed = run_local_jobs(jobs,self.log_dest,self.options.jobs)
+        return len(failed)
+
+class DryRunScheduler(Scheduler):
+    """ Prints what would be run without writing job scripts or executing anything. """
+    def run(self,jobs):
+        if self.options.array == 'none':
+            for job in jobs:
+                print(job.name+': '+job.command+self.describe_dependencies(job))
+        else:
+            for array_name, array_jobs in group_jobs(jobs,self.options.array).items():
+                print(array_name+' ('+str(len(array_jobs))+' tasks)')
+                for job in array_jobs:
+                    print('    '+job.name+': '+job.command+self.describe_dependencies(job))
+        print(str(len(jobs))+' jobs planned (dry run, nothing submitted)')
+        return 0
+
+    def describe_dependencies(self,job):
+        described = ''
+        if job.depends:
+            described = ' [after '+', '.join(dependency.name for dependency in job.depends)+']'
+        if job.resources:
+            described += ' [mem '+str(job.resources['memory_mb'])+'MB, '+str(job.resources['walltime_min'])+' min]'
+        return described
+
+class BatchScheduler(Scheduler):
+    """ Shared logic for cluster schedulers: write a script for every job (or job array) and submit it. Subclasses supply
+    the script directives, the submission command and the environment variable holding the array task index. """
+    submit_command = None
+    task_index_variable = None
+
+    def run(self,jobs):
+        """ Submit jobs in dependency order. Jobs waiting on other jobs are held by the scheduler (bsub -w, sbatch
+        --dependency) so they start as soon as their model files exist. Job arrays wait on every job any of their
+        tasks depend on. """
+        failed = 0
+        job_ids = {} #id(job) -> scheduler job id (None if it could not be submitted)
+        if self.options.array == 'none':
+            batches = [(job.name,[job]) for job in jobs]
+        else:
+            batches = list(group_jobs(jobs,self.options.array).items())
+        for batch_name, batch_jobs in batches:
+            dependency_ids = []
+            for job in batch_jobs:
+                for dependency in job.depends:
+                    if dependency in batch_jobs:
+                        continue
+                    dependency_id = job_ids[id(dependency)]
+                    if dependency_id not in dependency_ids:
+                        dependency_ids.append(dependency_id)
+            job_ref = batch_name+'_'+self.run_ref
+            if None in dependency_ids:
+                print('Not submitting '+job_ref+': a job it depends on could not be submitted')
+                job_id = None
+            elif self.options.array == 'none':
+                script = self.directives(job_ref,self.log_dest+'/'+job_ref,None,dependency_ids,batch_resources(batch_jobs))
+                job_id = self.submit(self.write_script(job_ref,script+batch_jobs[0].command+'\n'))
+            else:
+                manifest_path = self.write_manifest(job_ref,batch_jobs)
+                script = self.directives(job_ref,self.log_dest+'/'+job_ref,len(batch_jobs),dependency_ids,batch_resources(batch_jobs))
+                script += 'command=$(sed -n "${'+self.task_index_variable+'}p" '+manifest_path+')\n'
+                script += 'eval "$command"\n'
+                print('Submitting job array '+job_ref+' ('+str(len(batch_jobs))+' tasks)')
+                job_id = self.submit(self.write_script(job_ref,script))
+            for job in batch_jobs:
+                job_ids[id(job)] = job_id
+            if job_id is None:
+                failed += len(batch_jobs)
+        return failed
+
+    def directives(self,job_ref,log_base,array_size,dependency_ids,resources=None):
+        raise NotImplementedError
+
+    def write_manifest(self,job_ref,jobs):
+        """ Task manifest for a job array: one command per line, task i runs line i. """
+        manifest_path = self.job_dest+'/'+job_ref+'_tasks.txt'
+        manifest = open(manifest_path,'w')
+        for job in jobs:
+            manifest.write(job.command.replace('\n',' ')+'\n')
+        manifest.close()
+        return manifest_path
+
+    def write_script(self,job_ref,script):
+        job_path_name = self.job_dest+'/'+job_ref+'_run.sh'
+        sh_file = open(job_path_name,'w')
+        sh_file.write('#!/bin/bash\n')
+        sh_file.write(script)
+        sh_file.close()
+        return job_path_name
+
+    def submit(self,job_path_name):
+        """ Submit a job script and return the scheduler's job id (None if submission failed or no job id could be read
+        from the scheduler's output, so jobs depending on it are not submitted). """
+        sh_file = open(job_path_name)
+        try:
+            result = subprocess.run(self.submit_command,stdin=sh_file,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+        except OSError as error:
+            print('Could not run '+self.submit_command[0]+': '+str(error))
+            return None
+        finally:
+            sh_file.close()
+        if self.settings['submit_delay']:
+            time.sleep(self.settings['submit_delay'])
+        if result.returncode != 0:
+            print('Submission failed for '+job_path_name+': '+result.stderr.strip())
+            return None
+        job_id = self.parse_job_id(result.stdout)
+        if job_id is None:
+            print('Submission of '+job_path_name+' returned no job id: '+result.stdout.strip())
+            return None
+        print(result.stdout.strip())
+        return job_id
+
+    def parse_job_id(self,output):
+        raise NotImplementedError
+
+class LSFScheduler(BatchScheduler):
+    submit_command = ['bsub']
+    task_index_variable = 'LSB_JOBINDEX'
+
+    def directives(self,job_ref,log_base,array_size,dependency_ids,resources=None):
+        settings = self.settings
+        memory, memory_limit, walltime = settings['memory'], settings['memory_limit'], settings['walltime']
+        if resources:
+            memory = str(resources['memory_mb'])+'MB'
+            memory_limit = str(resources['memory_limit_mb'])+'MB'
+            walltime = resources['walltime_min']
+        name = job_ref
+        task = ''
+        if array_size is not None:
+            name = job_ref+'[1-'+str(array_size)+']'
+            if settings['array_limit']:
+                name = name+'%'+str(settings['array_limit'])
+            task = '_%I'
+        lines = ['#BSUB -q '+settings['queue'],
+                 '#BSUB -J "'+name+'"',
+                 '#BSUB -R "rusage[mem='+memory+']"']
+        if memory_limit:
+            lines.append('#BSUB -M '+memory_limit)
+        if walltime:
+            lines.append('#BSUB -W '+str(walltime))
+        if dependency_ids:
+            lines.append('#BSUB -w "'+' && '.join('done('+job_id+')' for job_id in dependency_ids)+'"')
+        lines.append('#BSUB -o '+log_base+task+'.o')
+        lines.append('#BSUB -e '+log_base+task+'.e')
+        return '\n'.join(lines)+'\n'
+
+    def parse_job_id(self,output):
+        match = re.search(r'Job <(\d+)>',output)
+        if match:
+            return match.group(1)
+        return None
+
+    def status_command(self,job_ids):
+        return ['bjobs','-noheader','-o','jobid stat']+list(job_ids)
+
+    def parse_status(self,output):
+        """ State (pending, running, done or failed) of every job listed by bjobs. """
+        states = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[0].isdigit():
+                states[fields[0]] = LSF_STATES.get(fields[1],'running')
+        return states
+
+class SlurmScheduler(BatchScheduler):
+    submit_command = ['sbatch','--parsable']
+    task_index_variable = 'SLURM_ARRAY_TASK_ID'
+
+    def directives(self,job_ref,log_base,array_size,dependency_ids,resources=None):
+        settings = self.settings
+        memory, walltime = settings['memory'], settings['walltime']
+        if resources:
+            memory = str(resources['memory_mb'])+'M'
+            walltime = resources['walltime_min']
+        task = ''
+        lines = ['#SBATCH --partition='+settings['queue'],
+                 '#SBATCH --job-name='+job_ref,
+                 '#SBATCH --mem='+memory]
+        if walltime:
+            lines.append('#SBATCH --time='+str(walltime))
+        if dependency_ids:
+            lines.append('#SBATCH --dependency=afterok:'+':'.join(dependency_ids))
+        if array_size is not None:
+            array_spec = '1-'+str(array_size)
+            if settings['array_limit']:
+                array_spec = array_spec+'%'+str(settings['array_limit'])
+            lines.append('#SBATCH --array='+array_spec)
+            task = '_%a'
+        lines.append('#SBATCH --output='+log_base+task+'.o')
+        lines.append('#SBATCH --error='+log_base+task+'.e')
+        return '\n'.join(lines)+'\n'
+
+    def parse_job_id(self,output):
+        #--parsable prints "jobid" or "jobid;cluster"
+        job_id = output.strip().split(';')[0]
+        if job_id.isdigit():
+            return job_id
+        return None
+
+    def status_command(self,job_ids):
+        #sacct, unlike squeue, still lists jobs once they have finished
+        return ['sacct','--noheader','--allocations','--parsable2','--format=JobID,State','--jobs='+','.join(job_ids)]
+
+    def parse_status(self,output):
+        """ State (pending, running, done or failed) of every job listed by sacct. """
+        states = {}
+        for line in output.splitlines():
+            fields = line.split('|')
+            if len(fields) == 2 and fields[1]:
+                states[fields[0]] = SLURM_STATES.get(fields[1].split()[0],'failed')
+        return states
+
+SCHEDULERS = {
+    'local': LocalScheduler,
+    'lsf': LSFScheduler,
+    'slurm': SlurmScheduler,
+    'dry-run': DryRunScheduler,
+}
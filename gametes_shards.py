@@ -0,0 +1,124 @@
+"""
+Description: Replicate sharding. With --shards K, every dataset cell is split into K jobs, each generating a contiguous
+range of the cell's replicates, so a large cell (e.g. 100000 attributes, or 3-way epistasis) no longer runs all its
+replicates serially in one JVM. Each shard gets a random seed derived from the cell (job name) and the shard index
+(GAMETES -r, also accepted by gametes_native.py), so rerunning a shard reproduces it exactly. A shard writes into its own
+hidden folder next to the cell folder; a placement step appended to the shard job then moves every file into the cell
+folder, renumbered to the replicate numbers (and zero padding) an unsharded run would have used, and removes the shard
+folder. Downstream consumers see the same file names as without sharding. Storage format conversion and compression run
+inside each shard before placement.
+
+Usage (placement step, appended to shard jobs automatically):
+python gametes_shards.py place <shard folder> <cell folder> --offset <replicates of earlier shards> --replicates <cell replicates>
+"""
+
+import sys
+import os
+import re
+import shutil
+import hashlib
+import argparse
+from gametes_jobs import Job, dataset_files
+from gametes_binary import read_header, write_header
+
+SHARD_FILE = re.compile(r'_EDM-(\d+)_(\d+)(\..+)$')
+
+def add_shard_arguments(parser):
+    """ Command line options for splitting dataset cells into replicate shards. """
+    parser.add_argument('--shards',dest='shards',type=int,help='split the replicates of every dataset cell into this many jobs, each with its own deterministic seed',default=1)
+    parser.add_argument('--shard-min-values',dest='shard_min_values',type=float,help='only shard cells generating at least this many genotypes (attributes x samples x replicates x quantiles)',default=0)
+
+def shard_seed(cell_key,shard):
+    """ Deterministic seed of one shard, a positive 31-bit integer (GAMETES reads it as a Java Integer). """
+    return int(hashlib.sha256((cell_key+'/'+str(shard)).encode()).hexdigest(),16) % 2**31
+
+def shard_sizes(replicates,shards):
+    """ Replicates generated by each shard, as even as possible. """
+    return [replicates//shards+(1 if k < replicates % shards else 0) for k in range(shards)]
+
+def shard_folder(cell_folder,shard,shards):
+    """ Hidden folder a shard writes to, next to the cell folder (archive walkers skip hidden folders). """
+    return os.path.join(os.path.dirname(cell_folder),'.'+os.path.basename(cell_folder)+'.shard-'+str(shard+1)+'of'+str(shards))
+
+def placed_path(path,cell_folder,offset,replicates):
+    """ Final path of a shard's file: in the cell folder, named after the cell, with its replicate number shifted by
+    offset and padded to the width of the cell's replicate count (see gametes_jobs.dataset_files). """
+    match = SHARD_FILE.search(os.path.basename(path))
+    replicate = str(int(match.group(2))+offset).zfill(len(str(replicates)))
+    return os.path.join(cell_folder,os.path.basename(cell_folder)+'_EDM-'+match.group(1)+'_'+replicate+match.group(3))
+
+def apply_sharding(jobs,shards,min_values=0,min_replicates=2):
+    """ Replace every dataset job with at least min_replicates replicates by up to shards jobs, each writing its
+    replicate range to a shard folder. Must run before the engine, format and compression steps, which then work on the
+    shard folder; add_placement_step moves the results into the cell folder afterwards. """
+    if shards <= 1:
+        return jobs
+    sharded = []
+    for job in jobs:
+        params = job.params
+        match = re.search(r'-D "[^"]* -o (\S+)"',job.command)
+        values = params.get('attributes',0)*params.get('samples',0)*params.get('replicates',0)*params.get('quantiles',1)
+        if job.group == 'models' or match is None or params.get('replicates',1) < min_replicates or values < min_values:
+            sharded.append(job)
+            continue
+        cell_folder = match.group(1)
+        count = min(shards,params['replicates'])
+        offset = 0
+        for k, size in enumerate(shard_sizes(params['replicates'],count)):
+            folder = shard_folder(cell_folder,k,count)
+            seed = shard_seed(job.name,k)
+            options = re.sub(r' -r \d+',' -r '+str(size),match.group(0)).replace(' -o '+cell_folder+'"',' -o '+folder+'"')
+            command = job.command.replace(match.group(0),options)+' -r '+str(seed)
+            shard_params = dict(params,replicates=size,shard=k+1,shards=count,replicate_offset=offset,seed=seed)
+            shard_job = Job(job.name+'_shard-'+str(k+1)+'of'+str(count),command,job.group,inputs=list(job.inputs),
+                            outputs=dataset_files(folder,params.get('quantiles',1),size),params=shard_params)
+            shard_job.placement = (folder,cell_folder,offset,params['replicates'])
+            sharded.append(shard_job)
+            offset += size
+    return sharded
+
+def add_placement_step(jobs):
+    """ Make every shard job move its files into the cell folder once everything else in the job has succeeded, and
+    expect the final names there. """
+    for job in jobs:
+        if job.placement is None:
+            continue
+        folder, cell_folder, offset, replicates = job.placement
+        job.command = job.command+' && '+sys.executable+' '+os.path.realpath(__file__)+' place '+folder+' '+cell_folder+' --offset '+str(offset)+' --replicates '+str(replicates)
+        job.outputs = [placed_path(output,cell_folder,offset,replicates) for output in job.outputs]
+    return jobs
+
+def place_shard(folder,cell_folder,offset,replicates):
+    """ Move every file of a shard folder into the cell folder under its final name (binary headers get the final
+    replicate number), then remove the shard folder. Returns the number of files moved. """
+    os.makedirs(cell_folder,exist_ok=True)
+    moved = 0
+    for name in sorted(os.listdir(folder)):
+        if not SHARD_FILE.search(name):
+            continue
+        target = placed_path(name,cell_folder,offset,replicates)
+        if name.endswith('.json'):
+            header = read_header(os.path.join(folder,name))
+            if 'replicate' in header.get('params',{}):
+                header['params']['replicate'] += offset
+            write_header(os.path.join(folder,name)[:-len('.json')],header)
+        os.replace(os.path.join(folder,name),target)
+        moved += 1
+    shutil.rmtree(folder)
+    return moved
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Move the datasets of a replicate shard into their cell folder")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    place = subparsers.add_parser('place',help='move a shard folder into its cell folder, renumbering replicates')
+    place.add_argument('folder',help='shard folder')
+    place.add_argument('cell_folder',help='cell folder')
+    place.add_argument('--offset',dest='offset',type=int,required=True,help='replicates generated by earlier shards')
+    place.add_argument('--replicates',dest='replicates',type=int,required=True,help='replicates of the whole cell')
+    options = parser.parse_args(argv[1:])
+    place_shard(options.folder,options.cell_folder,options.offset,options.replicates)
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
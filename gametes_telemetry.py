@@ -0,0 +1,167 @@
+"""
+Description: Per-job telemetry. Every scheduled job (local or cluster) runs through a small runner that measures the
+GAMETES command (start and end time, CPU time, peak memory of the largest process, exit status) and, once it has
+finished, the size of every expected output. One row per attempt is stored, together with the generator, the full
+parameter tuple of the cell and the run it belongs to, in a SQLite database at <output_path>/temporary/telemetry.sqlite.
+The expected outputs and parameters come from the job's completion manifest record, so the runner needs only the job
+name. The report command lists failed and slowest cells and the throughput of every generator.
+
+Usage (runner, added to jobs automatically):
+python gametes_telemetry.py run --db <file> --manifest-dir <dir> --job <job name> --group <generator> --run <run> -- <command>
+Usage (report):
+python gametes_telemetry.py report <output_path or telemetry.sqlite> [--top N] [--run <run>] [--all-attempts]
+"""
+
+import sys
+import os
+import json
+import time
+import shlex
+import socket
+import sqlite3
+import argparse
+from gametes_manifest import read_record
+from gametes_resources import run_measured, record_usage, job_kind, job_engine, job_features
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run TEXT, job TEXT, generator TEXT, host TEXT,
+    started REAL, finished REAL, wall_s REAL, cpu_s REAL, max_rss_mb REAL,
+    returncode INTEGER, output_bytes INTEGER, outputs_missing INTEGER,
+    params TEXT, command TEXT)"""
+
+def telemetry_path_for(job_dest):
+    """ The telemetry database lives next to the job scripts, in <output_path>/temporary/telemetry.sqlite. """
+    return os.path.join(os.path.dirname(job_dest),'telemetry.sqlite')
+
+def connect(db_path):
+    """ Open (and create if needed) the telemetry database. Concurrent jobs wait up to a minute for the write lock. """
+    connection = sqlite3.connect(db_path,timeout=60)
+    connection.execute(SCHEMA)
+    return connection
+
+def add_telemetry_step(jobs,db_path,manifest_dir,run_ref,history=None):
+    """ Run every job through the telemetry runner. With history set (--resources estimate), the runner also appends the
+    job's usage to the resource history used to calibrate estimates (batched jobs excepted, see gametes_batch.py). Must
+    come after record_planned, which the runner reads the expected outputs and parameters from, and before
+    add_record_step. """
+    connect(db_path).close()
+    for job in jobs:
+        wrapper = sys.executable+' '+os.path.realpath(__file__)+' run --db '+shlex.quote(db_path)+' --manifest-dir '+shlex.quote(manifest_dir)+' --job '+job.name+' --group '+job.group+' --run '+run_ref
+        features = job_features(job)
+        if history is not None and features is not None and job.batch is None:
+            wrapper += ' --history '+shlex.quote(history)+' --kind '+job_kind(job)+' --engine '+job_engine(job)+' --features '+shlex.quote(json.dumps(features,sort_keys=True))
+        job.command = wrapper+' -- '+shlex.quote(job.command)
+    return jobs
+
+def run_job(command,db_path,manifest_dir,name,group,run_ref):
+    """ Run one job command, record the attempt and return (exit status, usage, start time). """
+    started = time.time()
+    returncode, usage = run_measured(command)
+    record = read_record(manifest_dir,name) or {}
+    expected = record.get('expected',[])
+    present = [path for path in expected if os.path.isfile(path)]
+    row = (run_ref,name,group,socket.gethostname(),started,time.time(),usage['wall_s'],usage['cpu_s'],usage['max_rss_mb'],
+           returncode,sum(os.path.getsize(path) for path in present),len(expected)-len(present),
+           json.dumps(record.get('params',{}),sort_keys=True),command)
+    try:
+        connection = connect(db_path)
+        connection.execute('INSERT INTO runs (run,job,generator,host,started,finished,wall_s,cpu_s,max_rss_mb,returncode,'
+                           'output_bytes,outputs_missing,params,command) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)',row)
+        connection.commit()
+        connection.close()
+    except sqlite3.Error as error:
+        print('Could not record telemetry in '+db_path+': '+str(error))
+    return returncode, usage, started
+
+def find_database(path):
+    """ The telemetry database of an output path (or the database file itself). """
+    if os.path.isdir(path):
+        path = os.path.join(path,'temporary','telemetry.sqlite')
+    if not os.path.isfile(path):
+        raise IOError('No telemetry database at '+path)
+    return path
+
+def load_runs(db_path,run_ref=None,all_attempts=False):
+    """ Recorded attempts as dicts, by default only the latest attempt of every job. """
+    connection = connect(db_path)
+    connection.row_factory = sqlite3.Row
+    query = 'SELECT * FROM runs'
+    arguments = ()
+    if run_ref:
+        query += ' WHERE run = ?'
+        arguments = (run_ref,)
+    rows = [dict(row) for row in connection.execute(query+' ORDER BY id',arguments)]
+    connection.close()
+    if not all_attempts:
+        latest = {}
+        for row in rows:
+            latest[row['job']] = row
+        rows = sorted(latest.values(),key=lambda row: row['id'])
+    return rows
+
+def format_params(params):
+    params = json.loads(params)
+    return ' '.join(key+'='+(','.join(str(item) for item in value) if isinstance(value,list) else str(value)) for key, value in sorted(params.items()))
+
+def report(db_path,top=10,run_ref=None,all_attempts=False):
+    """ Print the failed cells, the slowest cells and the throughput of every generator. Returns the number of failed
+    cells. """
+    rows = load_runs(db_path,run_ref,all_attempts)
+    failed = [row for row in rows if row['returncode'] != 0 or row['outputs_missing']]
+    print('Telemetry: '+str(len(rows))+' job attempt(s) from '+str(len(set(row['run'] for row in rows)))+' run(s), '+str(len(failed))+' failed')
+    if failed:
+        print('\nFailed cells:')
+        for row in failed:
+            print('  '+row['job']+' ['+row['generator']+']: exit '+str(row['returncode'])+', '+str(row['outputs_missing'])+' output(s) missing, '
+                  +time.strftime('%Y-%m-%d %H:%M',time.localtime(row['started']))+' on '+row['host']+'\n    '+format_params(row['params']))
+    print('\nSlowest cells:')
+    for row in sorted(rows,key=lambda row: -row['wall_s'])[:top]:
+        print('  %10.1fs %8.0f MB  %s [%s]\n    %s' % (row['wall_s'],row['max_rss_mb'],row['job'],row['generator'],format_params(row['params'])))
+    print('\nThroughput per generator:')
+    print('  %-36s %5s %10s %10s %10s %8s %9s' % ('generator','jobs','wall h','CPU h','MB out','MB/s','peak MB'))
+    generators = {}
+    for row in rows:
+        generators.setdefault(row['generator'],[]).append(row)
+    for generator, generator_rows in sorted(generators.items()):
+        wall = sum(row['wall_s'] for row in generator_rows)
+        megabytes = sum(row['output_bytes'] for row in generator_rows)/1024.0**2
+        print('  %-36s %5d %10.2f %10.2f %10.1f %8.2f %9.0f' % (generator,len(generator_rows),wall/3600,sum(row['cpu_s'] for row in generator_rows)/3600,
+              megabytes,megabytes/wall if wall else 0.0,max(row['max_rss_mb'] for row in generator_rows)))
+    return len(failed)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Record and report per-job telemetry of GAMETES archive runs")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    run = subparsers.add_parser('run',help='run a job command and record its telemetry')
+    run.add_argument('--db',dest='db',type=str,required=True,help='telemetry database')
+    run.add_argument('--manifest-dir',dest='manifest_dir',type=str,required=True,help='manifest directory holding the job record')
+    run.add_argument('--job',dest='job',type=str,required=True,help='job name')
+    run.add_argument('--group',dest='group',type=str,required=True,help='generator output the job belongs to')
+    run.add_argument('--run',dest='run_ref',type=str,default='',help='run the job was scheduled by')
+    run.add_argument('--history',dest='history',type=str,default=None,help='resource history to append the usage to')
+    run.add_argument('--kind',dest='kind',type=str,default='data',choices=['data','models'])
+    run.add_argument('--engine',dest='engine',type=str,default='gametes',choices=['gametes','native'])
+    run.add_argument('--features',dest='features',type=str,default=None,help='JSON size measures of the job (with --history)')
+    run.add_argument('job_command',nargs=argparse.REMAINDER,help='-- followed by the command to run')
+    report_parser = subparsers.add_parser('report',help='show failed and slowest cells and throughput per generator')
+    report_parser.add_argument('path',help='output path of the archive run, or the telemetry database')
+    report_parser.add_argument('--top',dest='top',type=int,default=10,help='number of slowest cells shown')
+    report_parser.add_argument('--run',dest='run_ref',type=str,default=None,help='only this run')
+    report_parser.add_argument('--all-attempts',dest='all_attempts',action='store_true',help='every attempt, not just the latest of each job')
+    options = parser.parse_args(argv[1:])
+
+    if options.command == 'report':
+        report(find_database(options.path),options.top,options.run_ref,options.all_attempts)
+        return 0
+    job_command = options.job_command[1:] if options.job_command[:1] == ['--'] else options.job_command
+    returncode, usage, started = run_job(' '.join(job_command),options.db,options.manifest_dir,options.job,options.group,options.run_ref)
+    if options.history and options.features:
+        record_usage(options.history,options.kind,options.engine,json.loads(options.features),returncode,usage,started)
+    if returncode < 0: #killed by a signal: report it the way the shell would
+        return 128-returncode
+    return returncode
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,262 @@
+"""
+Description: Post-generation validation. Checks every dataset cell of an archive against what was planned for it and
+against its generating model, reading the datasets on one worker process per dataset:
+- shape: every planned dataset exists, none is unplanned, each has the planned number of attributes (-a), rows (-s plus
+  -w, or -t for continuous endpoints), cases (-s) and controls (-w), and the predictive loci of its model; every
+  quantile has the same replicates;
+- model: for cells generated from a single model, the genotype counts of the predictive loci, pooled over the replicates
+  of each quantile, are tested against the penetrance table of the _Models.txt file (chi-square of cases and controls
+  against P(g|case) ~ P(g)f(g) and P(g|control) ~ P(g)(1-f(g)); of the endpoint means for continuous data), and the
+  penetrance of each locus and the heritability are estimated from the data for the report.
+The plan comes from the completion manifest (commands, expected files, parameters and job status). Cells without a
+manifest record are checked against the attributes and samples in their folder name only. One JSON line per cell, with
+its status (pass or fail) and every problem found, is written to the report; the command exits with status 1 if any
+cell fails.
+
+Usage:
+python gametes_validate.py <archive or folder> [...] [--jobs N] [--alpha 0.001] [--report <file>]
+"""
+
+import sys
+import os
+import json
+import math
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gametes_jobs import available_cores
+from gametes_binary import DATASET_FILE, model_loci, command_params, archive_records
+from gametes_native import GENOTYPES, parse_model_file, parse_dataset_options, genotype_distribution
+from gametes_reader import archive_bases
+from gametes_index import dataset_blocks, name_params
+
+DEFAULT_ALPHA = 0.001
+MIN_EXPECTED = 5.0 #genotype cells expected to hold fewer samples are pooled before the chi-square test
+
+def cell_plans(paths):
+    """ What the completion manifest planned for every dataset cell under paths: {cell folder: plan} with the command
+    options, model files, replicates, expected datasets (by path without extension) and failed jobs of the cell. """
+    roots = [os.path.realpath(path) for path in paths]
+    plans = {}
+    for path in roots:
+        for base, record in archive_records(path).items():
+            if not DATASET_FILE.search(base+'.txt') or not any(base.startswith(root+os.sep) for root in roots):
+                continue
+            folder = os.path.dirname(base)
+            if folder not in plans:
+                params = command_params(record.get('command',''))
+                plans[folder] = {'models':params['models'],'options':parse_dataset_options(params.get('dataset','-o none')),
+                                 'replicates':record.get('params',{}).get('replicates'),'expected':set(),'failed':set()}
+            plans[folder]['expected'].add(base)
+            if record.get('status') == 'failed':
+                plans[folder]['failed'].add(record['name'])
+    return plans
+
+def expectation(folder,plan,loci):
+    """ Shape a dataset of the cell must have: attributes, rows, cases and controls (None where unknown). """
+    if plan is None:
+        params = name_params(os.path.basename(folder))
+        return {'attributes':params.get('attributes'),'rows':params.get('samples'),'cases':None,'controls':None,'continuous':None,'loci':None}
+    options = plan['options']
+    if options.continuous:
+        return {'attributes':options.attributes,'rows':options.total,'cases':None,'controls':None,'continuous':True,'loci':loci}
+    return {'attributes':options.attributes,'rows':options.cases+options.controls,'cases':options.cases,
+            'controls':options.controls,'continuous':False,'loci':loci}
+
+def check_dataset(item):
+    """ Shape of one dataset against its expectation, plus the counts of its predictive genotype combinations: per class
+    for case/control data, or their number and endpoint sums for continuous data. item is (base, expectation). """
+    base, expect = item
+    match = DATASET_FILE.search(base+'.txt')
+    result = {'base':base,'quantile':int(match.group(1)),'replicate':int(match.group(2)),'problems':[]}
+    try:
+        path, data_format, blocks = dataset_blocks(base)
+        names = next(blocks)
+        loci = model_loci(names)
+        cells = GENOTYPES**len(loci)
+        counts = np.zeros((2,cells))
+        rows = 0
+        for genotypes, endpoint in blocks:
+            values = np.array(endpoint,dtype=float)
+            index = np.ravel_multi_index(tuple(genotypes[:,loci].T.astype(np.intp)),(GENOTYPES,)*len(loci)) if loci else np.zeros(len(values),dtype=np.intp)
+            if expect['continuous']:
+                counts[0] += np.bincount(index,minlength=cells)
+                counts[1] += np.bincount(index,weights=values,minlength=cells)
+            else:
+                counts[0] += np.bincount(index[values == 0],minlength=cells)
+                counts[1] += np.bincount(index[values == 1],minlength=cells)
+            rows += len(values)
+    except (IOError,OSError,ValueError,KeyError,IndexError) as error:
+        result['problems'].append('unreadable ('+str(error)+')')
+        return result
+    result.update(path=path,rows=rows,columns=len(names),loci=len(loci),counts=counts.tolist())
+    observed = {'attributes':len(names),'rows':rows,'loci':len(loci)}
+    if expect['continuous'] is False:
+        observed.update(controls=int(counts[0].sum()),cases=int(counts[1].sum()))
+        if observed['controls']+observed['cases'] != rows:
+            result['problems'].append(str(rows-observed['controls']-observed['cases'])+' rows with a class other than 0 or 1')
+    for key in ('attributes','rows','cases','controls','loci'):
+        if expect.get(key) is not None and observed.get(key) != expect[key]:
+            result['problems'].append(key+' '+str(observed.get(key))+', planned '+str(expect[key]))
+    return result
+
+def chi_square_p(statistic,df):
+    """ Upper tail of the chi-square distribution (Wilson-Hilferty approximation, so no SciPy is needed). """
+    if df <= 0:
+        return 1.0
+    z = ((statistic/df)**(1.0/3)-(1-2.0/(9*df)))/math.sqrt(2.0/(9*df))
+    return 0.5*math.erfc(z/math.sqrt(2))
+
+def chi_square(observed,expected):
+    """ Pearson statistic and degrees of freedom, pooling cells expected to hold fewer than MIN_EXPECTED samples. """
+    small = expected < MIN_EXPECTED
+    if small.any():
+        observed = np.append(observed[~small],observed[small].sum())
+        expected = np.append(expected[~small],expected[small].sum())
+    keep = expected > 0
+    statistic = float((((observed-expected)**2)[keep]/expected[keep]).sum())
+    return statistic, max(int(keep.sum())-1,0)
+
+def locus_penetrance(frequencies,penetrance):
+    """ Marginal penetrance of each genotype of each locus, given the joint genotype frequencies and penetrance. """
+    marginal = []
+    for axis in range(penetrance.ndim):
+        others = tuple(i for i in range(penetrance.ndim) if i != axis)
+        weight = frequencies.sum(axis=others)
+        marginal.append([round(float(value),4) for value in np.where(weight > 0,(frequencies*penetrance).sum(axis=others)/np.maximum(weight,1e-300),0.0)])
+    return marginal
+
+def check_model(model,counts,continuous,sd,alpha):
+    """ Test the pooled counts of one quantile against its model; returns the entry of the report. """
+    frequencies = genotype_distribution(model['mafs'])
+    table = model['table']
+    entry = {'heritability':model.get('heritability'),'K':model.get('K'),'locus_penetrance':locus_penetrance(frequencies,table)}
+    if continuous:
+        samples = counts[0].reshape(table.shape)
+        means = np.where(samples > 0,counts[1].reshape(table.shape)/np.maximum(samples,1),table)
+        statistic = float((((means-table)**2)*samples/(sd**2)).sum())
+        df = int((samples > 0).sum())
+        estimated = means
+    else:
+        controls, cases = counts[0].reshape(table.shape), counts[1].reshape(table.shape)
+        case_expected = frequencies*table/(frequencies*table).sum()*cases.sum()
+        control_expected = frequencies*(1-table)/(frequencies*(1-table)).sum()*controls.sum()
+        case_statistic, case_df = chi_square(cases.ravel(),case_expected.ravel())
+        control_statistic, control_df = chi_square(controls.ravel(),control_expected.ravel())
+        statistic, df = case_statistic+control_statistic, case_df+control_df
+        #Undo the case/control sampling with the model's prevalence K: P(g) = K P(g|case) + (1-K) P(g|control)
+        K = model.get('K',float((frequencies*table).sum()))
+        case_share = K*cases/max(cases.sum(),1)
+        population = case_share+(1-K)*controls/max(controls.sum(),1)
+        estimated = np.where(population > 0,case_share/np.maximum(population,1e-300),0.0)
+        entry['heritability_estimate'] = round(float((population*(estimated-K)**2).sum()/(K*(1-K))),4)
+        frequencies = population
+    p = chi_square_p(statistic,df)
+    entry.update(locus_penetrance_estimate=locus_penetrance(frequencies,estimated),
+                 penetrance_error=round(float((frequencies*abs(estimated-table)).sum()/max(frequencies.sum(),1e-300)),4),
+                 chi2=round(statistic,3),df=df,p=round(p,6),fit='pass' if p >= alpha else 'fail')
+    return entry
+
+def validate_cell(folder,plan,results,alpha):
+    """ Report entry of one cell from the results of its datasets. """
+    entry = {'cell':folder,'datasets':len(results),'problems':[]}
+    on_disk = set(result['base'] for result in results)
+    if plan is not None:
+        entry['planned'] = len(plan['expected'])
+        missing = sorted(plan['expected']-on_disk)
+        unplanned = sorted(on_disk-plan['expected'])
+        if missing:
+            entry['problems'].append(str(len(missing))+' planned dataset(s) missing, e.g. '+os.path.basename(missing[0]))
+        if unplanned:
+            entry['problems'].append(str(len(unplanned))+' unplanned dataset(s), e.g. '+os.path.basename(unplanned[0]))
+        for name in sorted(plan['failed']):
+            entry['problems'].append('job '+name+' failed')
+    for result in results:
+        for problem in result['problems']:
+            entry['problems'].append(os.path.basename(result['base'])+': '+problem)
+    replicates = {}
+    for result in results:
+        replicates.setdefault(result['quantile'],set()).add(result['replicate'])
+    if len(set(len(found) for found in replicates.values())) > 1:
+        entry['problems'].append('quantiles hold different numbers of replicates: '+', '.join(str(q)+': '+str(len(found)) for q, found in sorted(replicates.items())))
+    elif plan is not None and plan['replicates'] and replicates and len(list(replicates.values())[0]) != plan['replicates']:
+        entry['problems'].append(str(len(list(replicates.values())[0]))+' replicate(s) per quantile, planned '+str(plan['replicates']))
+
+    if plan is None:
+        entry['model_check'] = 'skipped (no manifest record)'
+    elif len(plan['models']) != 1:
+        entry['model_check'] = 'skipped (mixed models)'
+    elif not os.path.isfile(plan['models'][0]):
+        entry['problems'].append('model file '+plan['models'][0]+' missing')
+    else:
+        models = parse_model_file(plan['models'][0])
+        entry['quantiles'] = []
+        for quantile in sorted(replicates):
+            pooled = [result['counts'] for result in results if result['quantile'] == quantile and 'counts' in result and not result['problems']]
+            if quantile > len(models) or not pooled:
+                continue
+            model = models[quantile-1]
+            if len(pooled[0][0]) != model['table'].size:
+                continue #loci count already reported as a problem
+            check = check_model(model,np.sum(pooled,axis=0),plan['options'].continuous,plan['options'].sd,alpha)
+            entry['quantiles'].append(dict(quantile=quantile,**check))
+            if check['fit'] == 'fail':
+                entry['problems'].append('quantile '+str(quantile)+' does not fit its model (chi2 '+str(check['chi2'])+', '+str(check['df'])+' df, p '+str(check['p'])+')')
+    entry['status'] = 'fail' if entry['problems'] else 'pass'
+    return entry
+
+def validate_archive(paths,report_path,workers=None,alpha=DEFAULT_ALPHA):
+    """ Validate every dataset cell under paths (and every cell planned there) and write the report. Returns the number
+    of cells that failed. """
+    plans = cell_plans(paths)
+    loci = {}
+    for plan in plans.values():
+        if plan['models'] and all(os.path.isfile(path) for path in plan['models']):
+            loci[plan['models'][0]] = sum(len(parse_model_file(path)[0]['mafs']) for path in plan['models'])
+    cells = {}
+    for base in archive_bases(paths):
+        cells.setdefault(os.path.dirname(os.path.realpath(base)),[]).append(os.path.realpath(base))
+    for folder in plans:
+        cells.setdefault(folder,[])
+    items = []
+    for folder, bases in sorted(cells.items()):
+        plan = plans.get(folder)
+        expect = expectation(folder,plan,loci.get(plan['models'][0]) if plan and plan['models'] else None)
+        items.extend((base,expect) for base in bases)
+
+    results = {}
+    executor = ProcessPoolExecutor(max_workers=workers or available_cores())
+    try:
+        for result in executor.map(check_dataset,items,chunksize=8):
+            results.setdefault(os.path.dirname(result['base']),[]).append(result)
+    finally:
+        executor.shutdown()
+
+    failed = 0
+    report_file = open(report_path,'w')
+    for folder in sorted(cells):
+        entry = validate_cell(folder,plans.get(folder),results.get(folder,[]),alpha)
+        report_file.write(json.dumps(entry,sort_keys=True)+'\n')
+        if entry['status'] == 'fail':
+            failed += 1
+            print('FAIL '+folder+': '+'; '.join(entry['problems'][:3])+(' (+'+str(len(entry['problems'])-3)+' more)' if len(entry['problems']) > 3 else ''))
+    report_file.close()
+    print('Validated '+str(len(items))+' dataset(s) in '+str(len(cells))+' cell(s): '+str(len(cells)-failed)+' passed, '+str(failed)+' failed; report in '+report_path)
+    return failed
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check the datasets of a GAMETES archive against their plan and generating models")
+    parser.add_argument('paths',nargs='+',help='archive or dataset folders')
+    parser.add_argument('--jobs',dest='jobs',type=int,default=None,help='number of worker processes (default: all available cores)')
+    parser.add_argument('--alpha',dest='alpha',type=float,default=DEFAULT_ALPHA,help='significance level of the model fit test')
+    parser.add_argument('--report',dest='report',type=str,default=None,help='report file, one JSON line per cell (default: validation_report.jsonl in the first folder)')
+    options = parser.parse_args(argv[1:])
+
+    report = options.report or os.path.join(options.paths[0],'validation_report.jsonl')
+    if validate_archive(options.paths,report,options.jobs,options.alpha):
+        return 1
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
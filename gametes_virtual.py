@@ -0,0 +1,237 @@
+"""
+Description: Virtual archive: datasets generated on first use instead of up front. With --virtual, dataset jobs are
+not run. Every replicate of every dataset cell becomes a unit (a one-replicate shard of the cell with its deterministic
+seed, see gametes_shards.py) recorded in <output_path>/temporary/virtual_index.json with its command, model files,
+dataset files and parameters; model jobs still run as usual. VirtualArchive materializes a unit the first time one of
+its datasets is requested by running the recorded command, which writes the files to their normal archive paths (in
+the selected engine, storage format and compression). Materialized units are tracked by last use in
+<output_path>/temporary/virtual_cache.sqlite, and once the materialized datasets (with any reader sidecars) exceed the
+disk budget the least recently used units are deleted. The first materialization records a SHA-256 of every file (of
+the decompressed text for .gz/.zst files), and every regenerated copy is checked against it.
+
+Usage (in Python):
+    from gametes_virtual import VirtualArchive
+    archive = VirtualArchive('/path/to/output',budget_gb=50)
+    for path, params in archive.datasets(): ...
+    data = archive.open('.../gametes_2way_epistasis_A_100_S_1600_..._EDM-1_01.txt')    #a gametes_reader.Dataset
+Usage (command line):
+python gametes_virtual.py list <output_path> [--materialized]
+python gametes_virtual.py materialize <output_path> <dataset path> [...] [--budget-gb G]
+python gametes_virtual.py evict <output_path> --budget-gb G
+"""
+
+import sys
+import os
+import glob
+import json
+import time
+import fcntl
+import sqlite3
+import argparse
+import subprocess
+from gametes_shards import apply_sharding
+from gametes_binary import DATASET_FILE
+from gametes_compress import open_dataset_file, file_digest
+from gametes_reader import dataset_base, open_dataset
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS units (
+    name TEXT PRIMARY KEY, last_used REAL, bytes INTEGER, materialized INTEGER, digests TEXT)"""
+
+def add_virtual_arguments(parser):
+    """ Command line options for virtual archives. """
+    parser.add_argument('--virtual',dest='virtual',action='store_true',help='index the datasets instead of generating them; each is generated on first use (see gametes_virtual.py)')
+
+def virtual_index_path_for(job_dest):
+    """ The index lives next to the job scripts, in <output_path>/temporary/virtual_index.json. """
+    return os.path.join(os.path.dirname(job_dest),'virtual_index.json')
+
+def plan_units(jobs):
+    """ Split every dataset cell into one seeded job per replicate (models are left alone). """
+    replicates = max([job.params.get('replicates',1) for job in jobs if job.group != 'models'] or [1])
+    return apply_sharding(jobs,replicates,min_replicates=1)
+
+def write_index(jobs,index_path,dry_run=False):
+    """ Record every dataset unit in the virtual index and return the jobs still to run (model searches). Call once the
+    engine, format, compression and placement steps have been added, so the recorded commands are complete. """
+    units = [job for job in jobs if job.group != 'models']
+    datasets = sum(len([output for output in job.outputs if not output.endswith('.json')]) for job in units)
+    if not dry_run:
+        index = {'created':time.time(),'units':[{'name':job.name,'command':job.command,'inputs':job.inputs,
+                                                 'outputs':job.outputs,'params':job.params} for job in units]}
+        os.makedirs(os.path.dirname(index_path),exist_ok=True)
+        temp_path = index_path+'.tmp'+str(os.getpid())
+        index_file = open(temp_path,'w')
+        json.dump(index,index_file)
+        index_file.close()
+        os.replace(temp_path,index_path)
+    print('Virtual archive: '+str(datasets)+' dataset(s) in '+str(len(units))+' unit(s) indexed in '+index_path+(' (dry run, not written)' if dry_run else '')+'; they are generated on first use')
+    return [job for job in jobs if job.group == 'models']
+
+def output_digest(path):
+    """ SHA-256 of a dataset file, of its decompressed content for .gz/.zst files (gzip headers hold a timestamp). """
+    return file_digest(open_dataset_file(path,'rb'))[0]
+
+class VirtualArchive:
+    """ Datasets of a virtual archive (an output path planned with --virtual), generated on first access and evicted
+    least recently used first once the materialized datasets exceed budget_gb (None: no limit). """
+    def __init__(self,output_path,budget_gb=None):
+        self.output_path = output_path
+        self.temporary = os.path.join(output_path,'temporary')
+        index_path = os.path.join(self.temporary,'virtual_index.json')
+        if not os.path.isfile(index_path):
+            raise IOError('No virtual archive index at '+index_path+' (plan the archive with --virtual)')
+        index_file = open(index_path)
+        self.units = dict((unit['name'],unit) for unit in json.load(index_file)['units'])
+        index_file.close()
+        self.budget = None if budget_gb is None else int(budget_gb*1024**3)
+        self.bases = {}
+        for unit in self.units.values():
+            for output in unit['outputs']:
+                self.bases[dataset_base(os.path.realpath(output))] = unit['name']
+
+    def connect(self):
+        connection = sqlite3.connect(os.path.join(self.temporary,'virtual_cache.sqlite'),timeout=60)
+        connection.execute(SCHEMA)
+        return connection
+
+    def datasets(self):
+        """ Every dataset of the archive as (path, params), materialized or not. """
+        listed = []
+        for unit in self.units.values():
+            for output in unit['outputs']:
+                match = DATASET_FILE.search(dataset_base(output)+'.txt')
+                if output.endswith('.json') or match is None:
+                    continue
+                listed.append((output,dict(unit['params'],quantile=int(match.group(1)),replicate=int(match.group(2)))))
+        return listed
+
+    def unit_for(self,path):
+        name = self.bases.get(dataset_base(os.path.realpath(path)))
+        if name is None:
+            raise KeyError('Not a dataset of this virtual archive: '+path)
+        return self.units[name]
+
+    def unit_files(self,unit):
+        """ Every file of a unit on disk, including sidecars built by the reader. """
+        files = set()
+        for output in unit['outputs']:
+            files.update(glob.glob(glob.escape(dataset_base(output))+'.*'))
+        return sorted(files)
+
+    def materialized(self,unit):
+        return all(os.path.isfile(output) for output in unit['outputs'])
+
+    def lock(self,unit):
+        lock_dir = os.path.join(self.temporary,'virtual_locks')
+        os.makedirs(lock_dir,exist_ok=True)
+        lock_file = open(os.path.join(lock_dir,unit['name']+'.lock'),'w')
+        fcntl.flock(lock_file,fcntl.LOCK_EX)
+        return lock_file
+
+    def generate(self,unit):
+        """ Run the unit's recorded command and check the files against the digests of the first materialization. """
+        for path in unit['inputs']:
+            if not os.path.isfile(path) and dataset_base(os.path.realpath(path)) in self.bases:
+                self.materialize(path) #a duplicate cell linking the datasets of the cell it duplicates
+        missing = [path for path in unit['inputs'] if not os.path.isfile(path)]
+        if missing:
+            raise IOError('Model file '+missing[0]+' missing (run the model jobs first, e.g. --use model)')
+        result = subprocess.run(unit['command'],shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+        if result.returncode != 0 or not self.materialized(unit):
+            raise IOError('Could not generate '+unit['name']+' (exit '+str(result.returncode)+'): '+result.stderr.strip()[-500:])
+        digests = dict((output,output_digest(output)) for output in unit['outputs'])
+        connection = self.connect()
+        row = connection.execute('SELECT digests FROM units WHERE name = ?',(unit['name'],)).fetchone()
+        if row is not None and row[0]:
+            changed = [path for path, digest in json.loads(row[0]).items() if digests.get(path) != digest]
+            if changed:
+                connection.close()
+                raise IOError('Regenerated '+changed[0]+' differs from the copy generated first')
+        connection.execute('INSERT OR REPLACE INTO units (name,last_used,bytes,materialized,digests) VALUES (?,?,?,?,?)',
+                           (unit['name'],time.time(),0,1,json.dumps(digests,sort_keys=True)))
+        connection.commit()
+        connection.close()
+
+    def touch(self,unit):
+        """ Mark a unit used now and record its size on disk. """
+        size = sum(os.path.getsize(path) for path in self.unit_files(unit) if os.path.isfile(path))
+        connection = self.connect()
+        connection.execute('UPDATE units SET last_used = ?, bytes = ?, materialized = 1 WHERE name = ?',(time.time(),size,unit['name']))
+        connection.commit()
+        connection.close()
+
+    def evict(self,keep=None,budget=None):
+        """ Delete least recently used units until the materialized units fit the budget. Returns the bytes freed. """
+        budget = self.budget if budget is None else budget
+        if budget is None:
+            return 0
+        connection = self.connect()
+        rows = connection.execute('SELECT name, bytes FROM units WHERE materialized = 1 ORDER BY last_used').fetchall()
+        total = sum(size for name, size in rows)
+        freed = 0
+        for name, size in rows:
+            if total <= budget:
+                break
+            if name == keep or name not in self.units:
+                continue
+            for path in self.unit_files(self.units[name]):
+                os.remove(path)
+            connection.execute('UPDATE units SET materialized = 0, bytes = 0 WHERE name = ?',(name,))
+            total -= size
+            freed += size
+        connection.commit()
+        connection.close()
+        return freed
+
+    def materialize(self,path):
+        """ Make sure the dataset at path (any of its file names, or its path without extension) exists, generating its
+        unit if needed, and return the path of its data file. """
+        unit = self.unit_for(path)
+        lock_file = self.lock(unit)
+        try:
+            if not self.materialized(unit):
+                self.generate(unit)
+            self.touch(unit)
+        finally:
+            lock_file.close()
+        self.evict(keep=unit['name'])
+        base = dataset_base(os.path.realpath(path))
+        outputs = [output for output in unit['outputs'] if dataset_base(os.path.realpath(output)) == base]
+        return sorted(outputs,key=lambda output: output.endswith('.json'))[0]
+
+    def open(self,path):
+        """ The dataset at path as a memory mapped gametes_reader.Dataset, materializing it first if needed. """
+        dataset = open_dataset(self.materialize(path))
+        self.touch(self.unit_for(path))
+        return dataset
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate datasets of a virtual archive on demand")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    list_parser = subparsers.add_parser('list',help='list the datasets of the archive')
+    list_parser.add_argument('output_path',help='output path the archive was planned in')
+    list_parser.add_argument('--materialized',dest='materialized',action='store_true',help='only datasets currently on disk')
+    materialize = subparsers.add_parser('materialize',help='generate datasets (if not on disk) and print their paths')
+    materialize.add_argument('output_path',help='output path the archive was planned in')
+    materialize.add_argument('paths',nargs='+',help='dataset paths')
+    materialize.add_argument('--budget-gb',dest='budget_gb',type=float,default=None,help='disk budget of materialized datasets')
+    evict = subparsers.add_parser('evict',help='delete least recently used datasets down to a disk budget')
+    evict.add_argument('output_path',help='output path the archive was planned in')
+    evict.add_argument('--budget-gb',dest='budget_gb',type=float,required=True,help='disk budget of materialized datasets')
+    options = parser.parse_args(argv[1:])
+
+    archive = VirtualArchive(options.output_path,getattr(options,'budget_gb',None))
+    if options.command == 'list':
+        for path, params in archive.datasets():
+            if not options.materialized or os.path.isfile(path):
+                print(path)
+    elif options.command == 'materialize':
+        for path in options.paths:
+            print(archive.materialize(path))
+    else:
+        print('Freed '+str(round(archive.evict()/1024.0**2,1))+' MB')
+    return 0
+
+######################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
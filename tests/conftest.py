@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The gametes_* modules live at the top of the repository and are imported as top level modules
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
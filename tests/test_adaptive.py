@@ -0,0 +1,40 @@
+""" The adaptive driver keeps raising the try budget while a search reports too small a population, whether the native
+engine or the jar (which warns but exits 0) reports it. """
+
+import sys
+import json
+from gametes_adaptive import run_search, TRIES_PLACEHOLDER
+
+#Stand-in search: writes 2 models whatever its budget, and finds 1 valid model per 1000 tries
+FAKE_SEARCH = """import sys
+tries, population, models_file, engine = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3], sys.argv[4]
+found = min(population,tries//1000)
+open(models_file,'w').write('Attribute names:\\tP0\\n'*2)
+if engine == 'native':
+    print('Model search: '+str(found)+' valid model(s) in '+str(tries)+' tries')
+elif found < population:
+    print('You asked for a population of '+str(population)+' models, but I only found '+str(found))
+"""
+
+def search(tmp_path,engine,population=100):
+    script = tmp_path/'search.py'
+    script.write_text(FAKE_SEARCH)
+    models_file = str(tmp_path/'L_2_Models.txt')
+    history = str(tmp_path/'history.jsonl')
+    command = sys.executable+' '+str(script)+' '+TRIES_PLACEHOLDER+' '+str(population)+' '+models_file+' '+engine
+    returncode = run_search(command,'key',models_file,2,population,start=1000,factor=10,cap=10000000,history=history)
+    attempts = [json.loads(line) for line in open(history)]
+    return returncode, attempts
+
+def test_jar_warning_raises_the_budget(tmp_path):
+    returncode, attempts = search(tmp_path,'jar')
+    assert returncode == 0
+    assert [attempt['tries'] for attempt in attempts] == [1000,10000,100000]
+    assert [attempt['valid_found'] for attempt in attempts] == [1,10,None]
+    assert attempts[-1]['succeeded'] and not attempts[0]['succeeded']
+
+def test_native_count_raises_the_budget(tmp_path):
+    returncode, attempts = search(tmp_path,'native')
+    assert returncode == 0
+    assert [attempt['tries'] for attempt in attempts] == [1000,10000,100000]
+    assert attempts[-1]['valid_found'] == 100
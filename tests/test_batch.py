@@ -0,0 +1,60 @@
+""" Batches run their commands cold (one JVM per call) unless --batch-jvm warm is asked for, and a warm batch writes the
+same files as a cold one. The comparison needs java and javac and is skipped without them. """
+
+import os
+import json
+import shutil
+import argparse
+import subprocess
+import pytest
+from gametes_jobs import GAMETES_COMMAND
+from gametes_batch import add_batch_arguments, warm_command, run_batch
+
+JAR = GAMETES_COMMAND.split()[-1]
+
+def test_cold_is_the_default():
+    parser = argparse.ArgumentParser()
+    add_batch_arguments(parser)
+    assert parser.parse_args([]).batch_jvm == 'cold'
+
+def test_warm_command_keeps_the_arguments():
+    command = 'java -Xmx900m -jar '+JAR+' -i m_Models.txt -D "-a 10 -o out" -r 5 && echo done'
+    warm = warm_command(command)
+    assert ' call --jar '+JAR+' --jvm-option=-Xmx900m -- -i m_Models.txt -D "-a 10 -o out" -r 5 && echo done' in warm
+    assert warm_command('echo not a jar call') == 'echo not a jar call'
+
+def run_cells(folder,warm,model_file):
+    """ Run the same two seeded dataset cells, plus a repeat of the first, as one batch. Returns the files written. """
+    os.makedirs(folder)
+    commands = []
+    for k, seed in enumerate([11,22,11]):
+        command = 'java -jar '+JAR+' -i '+model_file+' -D "-n 0.01 -x 0.5 -a 20 -s 100 -w 100 -r 2 -o '+os.path.join(folder,'cell_'+str(k))+'" -r '+str(seed)
+        commands.append({'name':'cell_'+str(k),'command':warm_command(command) if warm else command})
+    batch = {'name':'batch','jar':JAR if warm else None,'jvm_options':[],'launcher_dir':os.path.join(folder,'launcher'),'commands':commands}
+    batch_path = os.path.join(folder,'batch.json')
+    batch_file = open(batch_path,'w')
+    json.dump(batch,batch_file)
+    batch_file.close()
+    assert run_batch(batch_path) == 0
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = [name for name in dirs if name != 'launcher']
+        for name in names:
+            if name.endswith('.txt'):
+                path = os.path.join(root,name)
+                files[os.path.relpath(path,folder)] = open(path,'rb').read()
+    return files
+
+@pytest.mark.skipif(shutil.which('java') is None or shutil.which('javac') is None,reason='java and javac are not installed')
+def test_warm_batch_matches_cold_batch(tmp_path):
+    model = str(tmp_path/'L_2')
+    subprocess.run(['java','-jar',JAR,'-M',' -h 0.1 -p 0.3 -a 0.2 -a 0.2 -o '+model+'.txt','-q','1','-p','10','-t','100000','-r','1'],check=True)
+    cold = run_cells(str(tmp_path/'cold'),False,model+'_Models.txt')
+    warm = run_cells(str(tmp_path/'warm'),True,model+'_Models.txt')
+    assert cold and sorted(cold) == sorted(warm)
+    for name in cold:
+        assert warm[name] == cold[name], name
+    #the repeated call sees no state left by the calls before it
+    for name in cold:
+        if name.startswith('cell_0'):
+            assert warm[name] == warm[name.replace('cell_0','cell_2')]
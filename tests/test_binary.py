@@ -0,0 +1,60 @@
+""" Packed and npy storage reproduce GAMETES text datasets byte for byte. """
+
+import shutil
+import numpy as np
+import pytest
+from gametes_binary import convert_file, convert_archive, write_text, command_params
+
+def text_dataset(path,attributes,samples,seed,labels=False,continuous=False):
+    """ A dataset in GAMETES text layout: noise and model columns, optional Model label, then Class. """
+    rng = np.random.default_rng(seed)
+    names = ['N'+str(i) for i in range(attributes-2)]+['M0P0','M0P1']
+    lines = ['\t'.join(names+(['Model'] if labels else [])+['Class'])+'\n']
+    for row in range(samples):
+        fields = [str(value) for value in rng.integers(0,3,size=attributes)]
+        if labels:
+            fields.append('Model_'+str(row%2))
+        fields.append(repr(float(rng.normal(0.5,0.1))) if continuous else str(row%2))
+        lines.append('\t'.join(fields)+'\n')
+    path.write_text(''.join(lines))
+    return path
+
+@pytest.mark.parametrize('data_format',['packed','npy'])
+@pytest.mark.parametrize('attributes',[2,3,5,7,9,101])
+def test_round_trip_is_byte_identical(tmp_path,data_format,attributes):
+    original = text_dataset(tmp_path/'cell_EDM-1_1.txt',attributes,samples=37,seed=attributes)
+    kept = tmp_path/'original.txt'
+    shutil.copy(str(original),str(kept))
+    path, error = convert_file(str(original),data_format,{'seed':1},remove_text=True)
+    assert error is None
+    assert not original.exists()
+    assert open(write_text(str(tmp_path/'cell_EDM-1_1')),'rb').read() == kept.read_bytes()
+
+@pytest.mark.parametrize('labels,continuous',[(True,False),(False,True)])
+def test_round_trip_with_labels_and_continuous_endpoint(tmp_path,labels,continuous):
+    original = text_dataset(tmp_path/'cell_EDM-1_1.txt',13,samples=20,seed=3,labels=labels,continuous=continuous)
+    kept = original.read_bytes()
+    path, error = convert_file(str(original),'packed',remove_text=True)
+    assert error is None
+    assert open(write_text(str(tmp_path/'cell_EDM-1_1')),'rb').read() == kept
+
+def test_seed_of_jar_and_native_commands():
+    assert command_params('java -jar g.jar -i m_Models.txt -D "-a 10 -r 100 -o out" -r 77')['seed'] == 77
+    assert command_params('python gametes_native.py -i m_Models.txt -D "-a 10 -r 100 -o out" -z 5')['seed'] == 5
+    assert 'seed' not in command_params('java -jar g.jar -i m_Models.txt -D "-a 10 -r 100 -o out"')
+
+def test_unparseable_rows_are_reported_not_raised(tmp_path):
+    good = text_dataset(tmp_path/'good_EDM-1_1.txt',5,samples=10,seed=1)
+    bad = text_dataset(tmp_path/'bad_EDM-1_1.txt',5,samples=10,seed=2)
+    lines = bad.read_text().splitlines(True)
+    lines[4] = 'x'+lines[4][1:]
+    lines[7] = lines[7][:4]+'\n'
+    bad.write_text(''.join(lines))
+    assert convert_file(str(bad),'packed') == (str(bad),"row 4: invalid literal for int() with base 10: 'x'")
+    assert not (tmp_path/'bad_EDM-1_1.gt2').exists() and not (tmp_path/'bad_EDM-1_1.json').exists()
+    lines[4] = lines[3]
+    bad.write_text(''.join(lines))
+    assert convert_file(str(bad),'npy') == (str(bad),'row 7: 2 fields, expected 6')
+    failed = convert_archive([str(tmp_path)],'packed',workers=1)
+    assert failed == [(str(bad),'row 7: 2 fields, expected 6')]
+    assert (tmp_path/'good_EDM-1_1.gt2').exists() and good.exists()
@@ -0,0 +1,58 @@
+""" Compression verifies each copy before removing the original, and the manifest and readers find compressed datasets. """
+
+import os
+import numpy as np
+import pytest
+import gametes_compress
+from gametes_compress import compress_paths, compress_file, apply_compression, find_dataset_file
+from gametes_jobs import Job
+from gametes_manifest import manifest_dir_for, record_planned, record_completion
+from gametes_binary import archive_records
+from gametes_reader import open_dataset
+from gametes_index import primary_file
+
+METHODS = [pytest.param('gzip'),pytest.param('zstd',marks=pytest.mark.skipif(gametes_compress.zstandard is None,reason='zstandard is not installed'))]
+
+def write_dataset(path,samples=30):
+    rng = np.random.default_rng(1)
+    lines = ['N0\tN1\tM0P0\tClass\n']+['\t'.join(str(value) for value in rng.integers(0,3,size=3))+'\t'+str(row%2)+'\n' for row in range(samples)]
+    path.write_text(''.join(lines))
+    return path.read_bytes()
+
+@pytest.mark.parametrize('method',METHODS)
+def test_original_removed_only_after_verification(tmp_path,method):
+    cell = tmp_path/'cell'
+    cell.mkdir()
+    original = write_dataset(cell/'cell_EDM-1_1.txt')
+    (cell/'notes.txt').write_text('not a dataset')
+    assert compress_paths([str(tmp_path)],method) == []
+    assert sorted(os.listdir(str(cell))) == ['cell_EDM-1_1.txt'+gametes_compress.SUFFIXES[method],'notes.txt']
+    assert gametes_compress.open_dataset_file(find_dataset_file(str(cell/'cell_EDM-1_1.txt')),'rb').read() == original
+
+def test_failed_verification_keeps_the_original(tmp_path,monkeypatch):
+    path = tmp_path/'cell_EDM-1_1.txt'
+    original = write_dataset(path)
+    def corrupted(handle):
+        handle.close()
+        return '0'*64, len(original)
+    monkeypatch.setattr(gametes_compress,'file_digest',corrupted)
+    assert compress_file(str(path),'gzip') == (str(path),'compressed copy does not decompress to the original')
+    assert os.listdir(str(tmp_path)) == ['cell_EDM-1_1.txt'] and path.read_bytes() == original
+
+@pytest.mark.parametrize('method',METHODS)
+def test_manifest_and_readers_find_compressed_datasets(tmp_path,method):
+    suffix = gametes_compress.SUFFIXES[method]
+    cell = tmp_path/'archive'/'gametes_univariate'/'cell'
+    cell.mkdir(parents=True)
+    text = str(cell/'cell_EDM-1_1.txt')
+    jobs = apply_compression([Job('data_cell','true','gametes_univariate',outputs=[text])],method)
+    assert jobs[0].outputs == [text+suffix] and 'gametes_compress.py '+str(cell)+' --method '+method in jobs[0].command
+    manifest_dir = manifest_dir_for(str(tmp_path/'archive'/'temporary'/'jobs'))
+    record_planned(jobs,manifest_dir)
+    write_dataset(cell/'cell_EDM-1_1.txt')
+    compress_paths([str(cell)],method)
+    assert record_completion(manifest_dir,'data_cell',0) == 0
+    assert archive_records(str(cell))[text[:-len('.txt')]]['name'] == 'data_cell'
+    assert primary_file(text[:-len('.txt')]) == (text+suffix,method)
+    dataset = open_dataset(text+suffix)
+    assert dataset.genotypes.shape == (30,3) and list(dataset.endpoint[:4]) == [0,1,0,1]
@@ -0,0 +1,38 @@
+""" Rebuilding the archive index rescans only changed files and drops files that are gone. """
+
+import os
+import json
+import numpy as np
+from gametes_index import build_index, query_index
+
+def write_dataset(path,seed,samples=20):
+    rng = np.random.default_rng(seed)
+    lines = ['N0\tN1\tM0P0\tM0P1\tClass\n']
+    for row in range(samples):
+        lines.append('\t'.join(str(value) for value in rng.integers(0,3,size=4))+'\t'+str(row%2)+'\n')
+    path.write_text(''.join(lines))
+
+def test_rebuild_rescans_changed_and_drops_removed(tmp_path,capsys):
+    cell = tmp_path/'archive'/'gametes_univariate'/'gametes_univariate_A_4_S_20_H_0.2_F_0.2_K_0.3'
+    cell.mkdir(parents=True)
+    for replicate in (1,2,3):
+        write_dataset(cell/('gametes_univariate_A_4_S_20_H_0.2_F_0.2_K_0.3_EDM-1_'+str(replicate)+'.txt'),replicate)
+    archive = str(tmp_path/'archive')
+    db = str(tmp_path/'index.sqlite')
+    assert build_index([archive],db,workers=1) == 0
+    first = dict((row['replicate'],row) for row in query_index(db))
+    assert sorted(first) == [1,2,3]
+    assert first[1]['rows'] == 20 and first[1]['cases'] == 10
+    assert json.loads(first[1]['params'])['heritability'] == 0.2
+
+    touched = cell/'gametes_univariate_A_4_S_20_H_0.2_F_0.2_K_0.3_EDM-1_1.txt'
+    write_dataset(touched,seed=9,samples=21)
+    os.utime(str(touched),(first[1]['mtime']+10,first[1]['mtime']+10))
+    os.remove(str(cell/'gametes_univariate_A_4_S_20_H_0.2_F_0.2_K_0.3_EDM-1_3.txt'))
+    capsys.readouterr()
+    assert build_index([archive],db,workers=1) == 0
+    assert '1 of 2 dataset(s) and 0 of 0 model file(s) (re)scanned, 1 removed' in capsys.readouterr().out
+    second = dict((row['replicate'],row) for row in query_index(db))
+    assert sorted(second) == [1,2]
+    assert second[1]['rows'] == 21 and second[1]['indexed'] > first[1]['indexed']
+    assert second[2]['indexed'] == first[2]['indexed']
@@ -0,0 +1,61 @@
+""" Completion manifest states (new, failed, stale, complete) and --force. """
+
+import os
+import time
+from gametes_jobs import Job
+from gametes_manifest import select_jobs, record_planned, record_completion, read_record
+
+def make_jobs(tmp_path):
+    model = str(tmp_path/'L_2_Models.txt')
+    data = str(tmp_path/'cell_EDM-1_1.txt')
+    return [Job('models_L_2','search '+model,'models',outputs=[model]),
+            Job('data_cell','generate -i '+model,'data',inputs=[model],outputs=[data])]
+
+def complete(manifest_dir,jobs):
+    record_planned(jobs,manifest_dir)
+    for job in jobs:
+        for path in job.outputs:
+            open(path,'w').write(job.name)
+        assert record_completion(manifest_dir,job.name,0) == 0
+
+def names(jobs):
+    return [job.name for job in jobs]
+
+def test_new_and_failed_jobs_rerun(tmp_path,capsys):
+    manifest_dir = str(tmp_path/'manifest')
+    jobs = make_jobs(tmp_path)
+    assert names(select_jobs(jobs,manifest_dir)) == ['models_L_2','data_cell']
+    assert 'Manifest: 2 new' in capsys.readouterr().out
+    record_planned(jobs,manifest_dir)
+    open(jobs[0].outputs[0],'w').write('models')
+    assert record_completion(manifest_dir,'models_L_2',0) == 0
+    assert record_completion(manifest_dir,'data_cell',0) == 1 #output missing
+    assert read_record(manifest_dir,'data_cell')['missing'] == jobs[1].outputs
+    assert names(select_jobs(make_jobs(tmp_path),manifest_dir)) == ['data_cell']
+    assert 'Manifest: 1 complete, 1 failed' in capsys.readouterr().out
+
+def test_complete_jobs_are_skipped_unless_forced(tmp_path,capsys):
+    manifest_dir = str(tmp_path/'manifest')
+    complete(manifest_dir,make_jobs(tmp_path))
+    assert select_jobs(make_jobs(tmp_path),manifest_dir) == []
+    assert 'Manifest: 2 complete' in capsys.readouterr().out
+    assert names(select_jobs(make_jobs(tmp_path),manifest_dir,force=True)) == ['models_L_2','data_cell']
+    assert 'Manifest: 2 stale (--force: rerunning all)' in capsys.readouterr().out
+
+def test_stale_jobs_and_their_dependents_rerun(tmp_path,capsys):
+    manifest_dir = str(tmp_path/'manifest')
+    complete(manifest_dir,make_jobs(tmp_path))
+    #a changed command reruns the model search, and the dataset job depending on it
+    jobs = make_jobs(tmp_path)
+    jobs[0].command += ' -p 1000'
+    assert names(select_jobs(jobs,manifest_dir)) == ['models_L_2','data_cell']
+    assert 'Manifest: 2 stale' in capsys.readouterr().out
+    #an output that changed size
+    open(str(tmp_path/'cell_EDM-1_1.txt'),'a').write('more')
+    assert names(select_jobs(make_jobs(tmp_path),manifest_dir)) == ['data_cell']
+    assert 'Manifest: 1 complete, 1 stale' in capsys.readouterr().out
+    #an input newer than the last completion
+    complete(manifest_dir,make_jobs(tmp_path))
+    later = time.time()+60
+    os.utime(str(tmp_path/'L_2_Models.txt'),(later,later))
+    assert names(select_jobs(make_jobs(tmp_path),manifest_dir)) == ['data_cell']
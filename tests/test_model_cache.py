@@ -0,0 +1,26 @@
+""" Model cache hits are copies, so rewriting an archive's model file leaves the cache entry intact. """
+
+import os
+import argparse
+from gametes_jobs import Job
+from gametes_model_cache import add_cache_arguments, apply_model_cache, model_cache_key, store
+
+def test_cache_hit_is_a_copy(tmp_path):
+    parser = argparse.ArgumentParser()
+    add_cache_arguments(parser)
+    options = parser.parse_args(['--model-cache',str(tmp_path/'cache')])
+    params = {'locus':2,'heritability':0.1,'minorAF':[0.2,0.2],'K':0.3,'quantiles':1,'pop_count':10,'try_count':100}
+    finished = tmp_path/'first'/'L_2_Models.txt'
+    finished.parent.mkdir()
+    finished.write_text('cached model\n')
+    entry = store(options.model_cache,model_cache_key(params),[str(finished)])
+
+    output = tmp_path/'second'/'L_2_Models.txt'
+    output.parent.mkdir()
+    job = Job('model','false','models',outputs=[str(output)],params=params)
+    assert apply_model_cache([job],options) == []
+    assert output.read_text() == 'cached model\n'
+    assert os.stat(str(output)).st_nlink == 1
+
+    output.write_text('rewritten in place\n')
+    assert open(os.path.join(entry,'Models.txt')).read() == 'cached model\n'
@@ -0,0 +1,45 @@
+""" The monitor on its local stand-in backend: in-flight limit, retries with backoff and the final failed count. """
+
+import asyncio
+from gametes_jobs import Job, resolve_dependencies
+from gametes_monitor import Monitor, LocalBackend
+
+class CountingBackend(LocalBackend):
+    """ Local backend recording the most jobs ever running at once. """
+    def __init__(self,log_dest):
+        LocalBackend.__init__(self,log_dest)
+        self.most_running = 0
+
+    async def submit(self,job,attempt):
+        job_id = await LocalBackend.submit(self,job,attempt)
+        running = len([process for process in self.processes.values() if process.returncode is None])
+        self.most_running = max(self.most_running,running)
+        return job_id
+
+def flaky(marker):
+    """ A command failing on its first attempt and succeeding on the next. """
+    return 'if [ -f '+marker+' ]; then sleep 0.2; else touch '+marker+'; exit 1; fi'
+
+def test_limit_retries_and_failed_count(tmp_path,capsys):
+    jobs = [Job('flaky_'+str(k),flaky(str(tmp_path/('attempted_'+str(k)))),'data') for k in range(5)]
+    jobs.append(Job('broken','exit 2','models',outputs=['broken_Models.txt']))
+    jobs.append(Job('after_broken','echo never','data',inputs=['broken_Models.txt']))
+    jobs.append(Job('steady','sleep 0.2','data'))
+    resolve_dependencies(jobs)
+    backend = CountingBackend(str(tmp_path))
+    monitor = Monitor(backend,2,retries=2,retry_delay=0.1,poll_seconds=0.05)
+    failed = asyncio.run(monitor.run(jobs))
+    out = capsys.readouterr().out
+
+    assert failed == 2 #broken, and the job waiting on it
+    assert backend.most_running <= 2
+    assert monitor.attempts[id(jobs[5])] == 3
+    assert all(monitor.attempts[id(job)] == 2 for job in jobs[:5])
+    assert monitor.attempts[id(jobs[7])] == 1 and monitor.attempts[id(jobs[6])] == 0
+    #the broken job is retried twice, after 0.1 s and then 0.2 s
+    assert 'RETRY broken (attempt 2 of 3) in 0.1 s' in out
+    assert 'RETRY broken (attempt 3 of 3) in 0.2 s' in out
+    assert 'FAILED after 3 attempt(s): broken' in out
+    assert 'SKIPPED (dependency failed): after_broken' in out
+    assert '6 of 8 jobs completed successfully' in out
+    assert open(str(tmp_path/'flaky_0.e')).read() == '' and (tmp_path/'flaky_0.o').exists()
@@ -0,0 +1,98 @@
+""" Statistics of native datasets: noise MAFs, case/control balance, class-conditional genotype frequencies and the
+effect of hierarchical -w weights, plus the statistical equivalence of jar and native output where java is installed. """
+
+import os
+import glob
+import shutil
+import subprocess
+import numpy as np
+import pytest
+from gametes_model_search import score_models, write_models, genotype_frequencies
+from gametes_native import hwe_frequencies, genotype_distribution, sample_class_conditional, generate_datasets, parse_dataset_options, read_dataset, chi_square_2df, compare_datasets, GENOTYPES
+
+JAR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),'gametes_2.2_dev.jar')
+TABLE = np.array([0.1,0.3,0.7]) #one locus with a strong main effect
+
+@pytest.fixture
+def model_file(tmp_path):
+    mafs = np.array([0.3])
+    tables = TABLE.reshape(1,GENOTYPES)
+    prevalence = (genotype_frequencies(mafs)*tables).sum(axis=1)
+    edm, cor = score_models(tables,prevalence,mafs)
+    return write_models(str(tmp_path/'L_1'),tables,prevalence,edm,cor,mafs,0.2,[0])[0]
+
+def generate(model_files,weights,options,seed=1):
+    dataset = parse_dataset_options(options)
+    return generate_datasets(model_files,weights,dataset,seed)
+
+def genotype_counts(paths,column,case):
+    counts = np.zeros(GENOTYPES)
+    for path in paths:
+        header, values = read_dataset(path)
+        rows = values[:,-1] == (1 if case else 0)
+        counts += np.bincount(values[rows,header.index(column)].astype(int),minlength=GENOTYPES)
+    return counts
+
+def test_noise_mafs_and_class_balance(tmp_path,model_file):
+    paths = generate([model_file],[],'-n 0.1 -x 0.3 -a 60 -s 300 -w 200 -r 2 -o '+str(tmp_path/'cell'))
+    assert len(paths) == 2
+    noise = []
+    for path in paths:
+        header, values = read_dataset(path)
+        assert header[-1] == 'Class' and header[-2] == 'M0P0'
+        assert values.shape == (500,61)
+        assert (values[:,-1] == 1).sum() == 300
+        mafs = values[:,:59].mean(axis=0)/2
+        noise.extend(mafs)
+    noise = np.array(noise)
+    assert noise.min() > 0.05 and noise.max() < 0.35
+    assert abs(noise.mean()-0.2) < 0.02
+
+def effect(paths,column):
+    """ Chi-square statistic of the genotypes of column between cases and controls. """
+    return chi_square_2df(genotype_counts(paths,column,True),genotype_counts(paths,column,False))[0]
+
+def test_hierarchical_weights_shift_the_effect(tmp_path,model_file):
+    options = '-h hierarchical -n 0.1 -x 0.3 -a 10 -s 1000 -w 1000 -r 2 -o '
+    heavy_first = generate([model_file,model_file],[75,25],options+str(tmp_path/'W_75'))
+    heavy_second = generate([model_file,model_file],[25,75],options+str(tmp_path/'W_25'))
+    assert effect(heavy_first,'M0P0') > 2*effect(heavy_first,'M1P0')
+    assert effect(heavy_second,'M1P0') > 2*effect(heavy_second,'M0P0')
+
+def test_hierarchical_cases_follow_weighted_penetrance(tmp_path,model_file):
+    paths = generate([model_file,model_file],[75,25],'-h hierarchical -n 0.1 -x 0.3 -a 10 -s 2000 -w 2000 -r 2 -o '+str(tmp_path/'cell'))
+    frequencies = hwe_frequencies(0.3)
+    #Marginal P(g | case) of the first locus: P(g)(0.75 f(g) + 0.25 E[f]) normalized
+    expected = frequencies*(0.75*TABLE+0.25*(frequencies*TABLE).sum())
+    expected = expected/expected.sum()*4000
+    observed = genotype_counts(paths,'M0P0',True)
+    assert abs(observed-expected).max() < 5*np.sqrt(expected).max()
+
+@pytest.mark.skipif(shutil.which('java') is None,reason='java is not installed')
+def test_jar_and_native_agree(tmp_path,model_file):
+    options = '-n 0.1 -x 0.3 -a 20 -s 500 -w 500 -r 5'
+    jar_folder = str(tmp_path/'jar'/'cell')
+    os.makedirs(os.path.dirname(jar_folder))
+    subprocess.run(['java','-jar',JAR,'-i',model_file,'-D',options+' -o '+jar_folder],check=True)
+    native_folder = str(tmp_path/'native'/'cell')
+    generate([model_file],[],options+' -o '+native_folder)
+    assert glob.glob(os.path.join(jar_folder,'*_EDM-*.txt'))
+    assert compare_datasets(jar_folder,native_folder)
+
+def test_class_conditional_genotype_frequencies(tmp_path,model_file):
+    #One locus through the whole engine: P(g|case) ~ P(g)f(g), P(g|control) ~ P(g)(1-f(g))
+    paths = generate([model_file],[],'-n 0.1 -x 0.3 -a 5 -s 3000 -w 3000 -r 2 -o '+str(tmp_path/'cell'),seed=11)
+    frequencies = hwe_frequencies(0.3)
+    for case, weights in ((True,frequencies*TABLE),(False,frequencies*(1-TABLE))):
+        expected = weights/weights.sum()*6000
+        observed = genotype_counts(paths,'M0P0',case)
+        assert (((observed-expected)**2)/expected).sum() < 13.8 #chi-square, 2 df, p 0.001
+    #Two interacting loci: the joint genotypes follow the joint table, not the product of its margins
+    mafs = np.array([0.3,0.4])
+    table = np.array([[0.1,0.5,0.1],[0.5,0.1,0.5],[0.1,0.5,0.1]])
+    frequencies = genotype_distribution(mafs)
+    genotypes = sample_class_conditional(np.random.default_rng(5),mafs,table,20000,20000)
+    for rows, weights in ((genotypes[:20000],frequencies*table),(genotypes[20000:],frequencies*(1-table))):
+        observed = np.bincount(np.ravel_multi_index(tuple(rows.T.astype(np.intp)),table.shape),minlength=table.size)
+        expected = (weights/weights.sum()*len(rows)).ravel()
+        assert (((observed-expected)**2)/expected).sum() < 26.1 #chi-square, 8 df, p 0.001
@@ -0,0 +1,28 @@
+""" --plan-only costs the whole archive (models and datasets) unless --use is given, and submits or creates nothing. """
+
+import os
+import gametes_full_archive_gen
+import gametes_planner
+
+def plan(tmp_path,capsys,*extra):
+    argv = ['gametes_full_archive_gen.py','--output-path',str(tmp_path/'out'),'--archive-name','A','--plan-only',
+            '--resource-history',str(tmp_path/'history.jsonl'),'--no-model-cache']+list(extra)
+    assert gametes_full_archive_gen.main(argv) == 0
+    return capsys.readouterr().out
+
+def test_plan_only_covers_the_whole_archive(tmp_path,capsys):
+    out = plan(tmp_path,capsys)
+    assert 'models_L_2' in out and 'gametes_2way_epistasis_numfeat' in out
+    assert 'Plan only: nothing submitted' in out
+    assert os.listdir(str(tmp_path)) == []
+
+def test_plan_only_honours_use(tmp_path,capsys):
+    out = plan(tmp_path,capsys,'--use','model')
+    assert 'models_L_2' in out and 'gametes_2way_epistasis_numfeat' not in out
+
+def test_planner_plan_only_creates_nothing(tmp_path,capsys):
+    argv = ['gametes_planner.py','--output-path',str(tmp_path/'out'),'--archive-name','A','--plan-only',
+            '--resource-history',str(tmp_path/'history.jsonl'),'--no-model-cache']
+    assert gametes_planner.main(argv) == 0
+    assert 'Plan only: nothing submitted' in capsys.readouterr().out
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,58 @@
+""" Archive-wide planning: duplicates across the archive scripts become link jobs, duplicate model searches are masked
+by the model they duplicate, and jobs start longest chain first. """
+
+import os
+import argparse
+import gametes_full_archive_gen
+import gametes_2way_epistasis_archive_gen
+from gametes_jobs import Job, resolve_dependencies, order_jobs
+from gametes_planner import dedupe_jobs, add_duplicate_links, link_files, prioritize
+
+def test_cell_planned_by_both_archives_is_linked(tmp_path,capsys):
+    output_path = str(tmp_path)
+    jobs = gametes_full_archive_gen.plan_archive(output_path,'A','all')+gametes_2way_epistasis_archive_gen.plan_archive(output_path,'A','all')
+    planned, duplicates = dedupe_jobs(jobs)
+    assert len(planned)+len(duplicates) == len(jobs)
+    assert 'Planner: '+str(len(duplicates))+' duplicate job(s) removed, '+str(len(duplicates))+' linked' in capsys.readouterr().out
+    #the 2-way script's cell uses its own copy of the full archive's model, so it is only a duplicate through the alias
+    cell = [duplicate for duplicate in duplicates if duplicate[2].name == 'gametes_A_100_S_200_H_0.05_F_0.2'][0]
+    kept = [job for job in planned if job.name == cell[0]][0]
+    assert 'H_0.05_F_0.2_K_0.3_Models.txt' in cell[2].command and 'L_2_H_0.05_F_0.2_K_0.3_Models.txt' in kept.command
+    count = len(planned)
+    links = add_duplicate_links(planned,duplicates)[count:]
+    assert len(links) == len(duplicates)
+    link = [job for job in links if job.name == cell[2].name][0]
+    assert 'gametes_planner.py link '+cell[1]+' '+cell[3] in link.command
+    assert link.inputs == kept.outputs
+    assert link.outputs == [cell[3]+output[len(cell[1]):] for output in kept.outputs]
+    assert resolve_dependencies([kept,link])[1].depends == [kept]
+
+def test_duplicate_model_search_is_masked(tmp_path):
+    search = 'java -jar gametes.jar -M " -h 0.2 -p 0.3 -o '
+    data = 'java -jar gametes.jar -i {} -D " -a 100 -s 800 -w 800 -r 10 -o '+str(tmp_path)+'/{}"'
+    jobs = [Job('model_a',search+str(tmp_path/'a.txt')+'"','models',outputs=[str(tmp_path/'a_Models.txt')]),
+            Job('model_b',search+str(tmp_path/'b.txt')+'"','models',outputs=[str(tmp_path/'b_Models.txt')]),
+            Job('model_c',search.replace('0.2','0.4')+str(tmp_path/'c.txt')+'"','models',outputs=[str(tmp_path/'c_Models.txt')]),
+            Job('cell_a',data.format(tmp_path/'a_Models.txt','cell_a'),'data'),
+            Job('cell_b',data.format(tmp_path/'b_Models.txt','cell_b'),'data'),
+            Job('cell_c',data.format(tmp_path/'c_Models.txt','cell_c'),'data')]
+    planned, duplicates = dedupe_jobs(jobs)
+    assert [job.name for job in planned] == ['model_a','model_c','cell_a','cell_c']
+    assert [(name,duplicate.name) for name, prefix, duplicate, duplicate_prefix in duplicates] == [('model_a','model_b'),('cell_a','cell_b')]
+
+def test_link_files(tmp_path):
+    for suffix in ('_Models.txt','_Scores.txt'):
+        (tmp_path/('a'+suffix)).write_text(suffix)
+    assert link_files(str(tmp_path/'a'),str(tmp_path/'linked'/'b')) == 2
+    assert os.path.samefile(str(tmp_path/'a_Models.txt'),str(tmp_path/'linked'/'b_Models.txt'))
+
+def test_longest_chain_starts_first(tmp_path):
+    def job(name,minutes,inputs=(),outputs=()):
+        planned = Job(name,'echo '+name,'data',inputs=list(inputs),outputs=list(outputs))
+        planned.resources = {'walltime_min':minutes}
+        return planned
+    jobs = [job('short',5),job('long',8),job('model',1,outputs=['m']),job('first',1,inputs=['m'],outputs=['d']),job('slow',10,inputs=['d'])]
+    options = argparse.Namespace(order='longest',resource_history=str(tmp_path/'none.jsonl'),data_format='text')
+    assert [job.name for job in order_jobs(prioritize(resolve_dependencies(jobs),options))] == ['model','first','slow','long','short']
+    options.order = 'planned'
+    assert [job.name for job in order_jobs(prioritize(resolve_dependencies(jobs),options))] == ['short','long','model','first','slow']
@@ -0,0 +1,75 @@
+""" Racing native model searches: pooled or merged racers give the usual _Models.txt/_Scores.txt layout, and --race is
+refused where the searches cannot pool. """
+
+import os
+import argparse
+import pytest
+import gametes_race
+from gametes_jobs import Job, NATIVE_COMMAND
+from gametes_native import parse_model_file
+from gametes_schedulers import add_run_arguments
+
+MODEL_OPTIONS = ' -h 0.2 -p 0.3 -a 0.3 -a 0.3 -o '
+
+def options_for(*args):
+    parser = argparse.ArgumentParser()
+    add_run_arguments(parser)
+    return parser.parse_args(list(args))
+
+def racer(output,race_dir,part,population,tries=20000):
+    return NATIVE_COMMAND+' -M "'+MODEL_OPTIONS+output+'.txt" -q 2 -p '+str(population)+' -t '+str(tries)+' -r '+str(part)+' --race-dir '+race_dir+' --race-part '+str(part)
+
+def check_layout(output,quantiles):
+    models = parse_model_file(output+'_Models.txt')
+    assert len(models) == quantiles
+    for model in models:
+        assert model['table'].shape == (3,3) and abs(model['heritability']-0.2) < 1e-9
+    scores = open(output+'_Scores.txt').read().splitlines()
+    assert scores[0] == 'Model\tHeritability\tK\tEDM\tCOR'
+    assert [line.split('\t')[0] for line in scores[1:]] == ['EDM-'+str(q+1) for q in range(quantiles)]
+
+def test_pool_two_native_racers(tmp_path,capsys):
+    output = str(tmp_path/'models'/'L_2_H_0.2')
+    race_dir = str(tmp_path/'race')
+    os.makedirs(race_dir)
+    commands = [racer(output,race_dir,k,50) for k in (1,2)]
+    assert gametes_race.race_pool(commands,race_dir,MODEL_OPTIONS+output+'.txt',2,50) == 0
+    check_layout(output,2)
+    assert 'valid model(s) pooled from 2 search(es)' in capsys.readouterr().out
+
+def test_merge_racers_run_as_tasks(tmp_path,capsys):
+    output = str(tmp_path/'L_2_H_0.2')
+    race_dir = str(tmp_path/'race')
+    os.makedirs(race_dir)
+    for k in (1,2):
+        assert os.system(racer(output,race_dir,k,30)+' --workers 1 > /dev/null') == 0
+    assert sorted(os.listdir(race_dir)) == ['1.count','1.npz','2.count','2.npz']
+    assert gametes_race.main(['gametes_race.py','merge','--race-dir',race_dir,'--model-options='+MODEL_OPTIONS+output+'.txt','-q','2','-p','30']) == 0
+    check_layout(output,2)
+
+def test_failed_racer_contributes_nothing(tmp_path,capsys):
+    output = str(tmp_path/'L_2_H_0.2')
+    race_dir = str(tmp_path/'race')
+    os.makedirs(race_dir)
+    commands = ['exit 3',racer(output,race_dir,2,40)]
+    assert gametes_race.race_pool(commands,race_dir,MODEL_OPTIONS+output+'.txt',2,1000000) == 0
+    out = capsys.readouterr().out
+    assert 'pooled from 1 search(es)' in out and 'only ' in out
+    check_layout(output,2)
+
+def test_apply_race_plans_seeded_racers(tmp_path):
+    job_dest = str(tmp_path/'temporary'/'jobs')
+    search = NATIVE_COMMAND+' -M "'+MODEL_OPTIONS+str(tmp_path/'L_2')+'.txt" -q 2 -p 100 -t 1000000'
+    job = Job('gametes_L_2',search+' && echo cached','models',outputs=[str(tmp_path/'L_2_Models.txt')],params={'quantiles':2,'pop_count':100})
+    raced = gametes_race.apply_race([job],options_for('--model-engine','native','--race','2'),job_dest,str(tmp_path/'manifest'),dry_run=True)
+    assert raced == [job]
+    assert job.command.startswith(gametes_race.runner('pool')) and job.command.endswith(' && echo cached')
+    assert job.command.count('-t 500000 -r ') == 2 and '--race-part 2' in job.command
+
+def test_race_is_refused_where_it_cannot_pool():
+    with pytest.raises(ValueError,match='model-engine native'):
+        gametes_race.check_race_options(options_for('--race','2'))
+    with pytest.raises(ValueError,match='adaptive-tries'):
+        gametes_race.check_race_options(options_for('--race','2','--model-engine','native','--adaptive-tries'))
+    gametes_race.check_race_options(options_for('--race','2','--model-engine','native'))
+    gametes_race.check_race_options(options_for('--adaptive-tries'))
@@ -0,0 +1,43 @@
+""" The reader builds a dataset's sidecar once, and again only when the text is newer. """
+
+import os
+import numpy as np
+import pytest
+import gametes_reader
+from gametes_reader import open_dataset, sidecar_current
+
+def write_dataset(path,seed,samples=24):
+    rng = np.random.default_rng(seed)
+    genotypes = rng.integers(0,3,size=(samples,4))
+    lines = ['N0\tN1\tM0P0\tM0P1\tClass\n']+['\t'.join(str(value) for value in row)+'\t'+str(i%2)+'\n' for i, row in enumerate(genotypes)]
+    path.write_text(''.join(lines))
+    return genotypes
+
+def test_sidecar_built_once_and_rebuilt_when_stale(tmp_path,monkeypatch):
+    path = tmp_path/'cell_EDM-1_1.txt'
+    base = str(path)[:-len('.txt')]
+    genotypes = write_dataset(path,1)
+    with pytest.raises(IOError,match='No current sidecar'):
+        open_dataset(str(path),build=False)
+    builds = []
+    build_sidecar = gametes_reader.build_sidecar
+    def counted(base):
+        builds.append(base)
+        return build_sidecar(base)
+    monkeypatch.setattr(gametes_reader,'build_sidecar',counted)
+
+    data = open_dataset(str(path))
+    assert builds == [base] and sidecar_current(base)
+    assert (np.asarray(data.genotypes) == genotypes).all() and data.model_loci == [2,3]
+    assert list(data.endpoint[:4]) == [0,1,0,1]
+    open_dataset(base+'.npy')
+    open_dataset(base)
+    assert builds == [base]
+
+    genotypes = write_dataset(path,2,samples=30)
+    later = os.path.getmtime(base+'.npy')+10
+    os.utime(str(path),(later,later))
+    assert not sidecar_current(base)
+    data = open_dataset(str(path))
+    assert builds == [base,base]
+    assert data.genotypes.shape == (30,4) and (np.asarray(data.genotypes) == genotypes).all()
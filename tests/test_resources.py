@@ -0,0 +1,29 @@
+""" Calibration of the cost model from recorded runs. """
+
+import pytest
+from gametes_jobs import Job
+from gametes_resources import PRIORS, MIN_FIT_RUNS, record_usage, read_history, calibrate, estimate
+
+def record(history,sizes,memory,walltime,returncode=0):
+    """ Runs of native dataset jobs whose memory and walltime follow the given (a, b) exactly. """
+    for values in sizes:
+        usage = {'wall_s':60.0*(walltime[0]+walltime[1]*values),'max_rss_mb':memory[0]+memory[1]*values,'cpu_s':0.0}
+        record_usage(history,'data','native',{'memory':values,'walltime':values},returncode,usage,0.0)
+
+def test_calibrate_recovers_a_linear_cost(tmp_path):
+    history = str(tmp_path/'history.jsonl')
+    record(history,[1e6,5e6,2e7,4e7,1e8],(100.0,3e-6),(0.5,4e-8))
+    record(history,[1e6,1e8],(1e4,1.0),(1e3,1.0),returncode=1) #failed runs are left out
+    coefficients = calibrate(read_history(history))
+    assert coefficients[('data','native','memory')] == pytest.approx((100.0,3e-6))
+    assert coefficients[('data','native','walltime')] == pytest.approx((0.5,4e-8))
+    assert coefficients[('data','gametes','memory')] == PRIORS[('data','gametes','memory')]
+    job = Job('cell','python gametes_native.py -i m -D "..."','data',params={'attributes':1000,'samples':1000,'replicates':10})
+    predicted = estimate(job,coefficients)
+    assert predicted['memory_mb'] == pytest.approx(103.0) and predicted['walltime_min'] == pytest.approx(0.9)
+
+def test_too_few_runs_scale_the_prior(tmp_path):
+    history = str(tmp_path/'history.jsonl')
+    prior = PRIORS[('data','native','memory')]
+    record(history,[1e6,1e7][:MIN_FIT_RUNS-1],(2*prior[0],2*prior[1]),(0.5,4e-8))
+    assert calibrate(read_history(history))[('data','native','memory')] == pytest.approx((2*prior[0],2*prior[1]))
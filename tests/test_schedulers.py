@@ -0,0 +1,110 @@
+""" LSF and SLURM submission against fake bsub and sbatch executables put first on the PATH. """
+
+import os
+import glob
+import argparse
+import pytest
+from gametes_jobs import Job, resolve_dependencies, order_jobs
+from gametes_schedulers import add_run_arguments, get_scheduler, LSFScheduler, SlurmScheduler
+
+#Each fake keeps the script it was given (stdin) as submitted_<n>.sh and prints job id n like the real command
+FAKE_BSUB = """#!/bin/bash
+n=$(( $(ls "$FAKE_SUBMISSIONS" | wc -l) + 1 ))
+cat > "$FAKE_SUBMISSIONS/submitted_$n.sh"
+echo "Job <$n> is submitted to queue <normal>."
+"""
+FAKE_SBATCH = """#!/bin/bash
+n=$(( $(ls "$FAKE_SUBMISSIONS" | wc -l) + 1 ))
+cat > "$FAKE_SUBMISSIONS/submitted_$n.sh"
+echo "$n;cluster"
+"""
+FAKE_GARBLED = """#!/bin/bash
+n=$(( $(ls "$FAKE_SUBMISSIONS" | wc -l) + 1 ))
+cat > "$FAKE_SUBMISSIONS/submitted_$n.sh"
+echo "queue is closed for maintenance"
+"""
+
+@pytest.fixture
+def cluster(tmp_path,monkeypatch):
+    """ Folders of a run, with a bin folder first on the PATH for the fake executables. """
+    for folder in ('bin','jobs','logs','submissions'):
+        (tmp_path/folder).mkdir()
+    monkeypatch.setenv('PATH',str(tmp_path/'bin')+os.pathsep+os.environ['PATH'])
+    monkeypatch.setenv('FAKE_SUBMISSIONS',str(tmp_path/'submissions'))
+    return tmp_path
+
+def install(cluster,name,script):
+    path = cluster/'bin'/name
+    path.write_text(script)
+    path.chmod(0o755)
+
+def options_for(*args):
+    parser = argparse.ArgumentParser()
+    add_run_arguments(parser)
+    return parser.parse_args(list(args))
+
+def planned_jobs():
+    """ A model search and two dataset cells reading its models. """
+    jobs = [Job('model','echo model','models',outputs=['m_Models.txt']),
+            Job('cell_1','echo cell 1','data_folder',inputs=['m_Models.txt'],outputs=['c1.txt']),
+            Job('cell_2','echo cell 2','data_folder',inputs=['m_Models.txt'],outputs=['c2.txt'])]
+    return order_jobs(resolve_dependencies(jobs))
+
+def submitted(cluster):
+    paths = sorted(glob.glob(str(cluster/'submissions'/'submitted_*.sh')),key=lambda path: int(path.split('_')[-1][:-3]))
+    return [open(path).read() for path in paths]
+
+def run(cluster,*args):
+    options = options_for(*args)
+    scheduler = get_scheduler(options,str(cluster/'jobs'),str(cluster/'logs'))
+    return scheduler, scheduler.run(planned_jobs())
+
+def test_lsf_array_waits_on_model_job(cluster):
+    install(cluster,'bsub',FAKE_BSUB)
+    scheduler, failed = run(cluster,'--scheduler','lsf','--array','generator')
+    assert failed == 0
+    model_script, array_script = submitted(cluster)
+    assert '#BSUB -J "models_'+scheduler.run_ref+'[1-1]"' in model_script
+    assert '#BSUB -J "data_folder_'+scheduler.run_ref+'[1-2]"' in array_script
+    assert '#BSUB -w "done(1)"' in array_script
+    assert 'sed -n "${LSB_JOBINDEX}p"' in array_script
+    tasks = open(str(cluster/'jobs'/('data_folder_'+scheduler.run_ref+'_tasks.txt'))).read()
+    assert tasks == 'echo cell 1\necho cell 2\n'
+
+def test_lsf_jobs_wait_on_every_dependency(cluster):
+    install(cluster,'bsub',FAKE_BSUB)
+    scheduler, failed = run(cluster,'--scheduler','lsf')
+    assert failed == 0
+    scripts = submitted(cluster)
+    assert len(scripts) == 3
+    assert '#BSUB -w' not in scripts[0]
+    assert scripts[0].rstrip().endswith('echo model')
+    for script in scripts[1:]:
+        assert '#BSUB -w "done(1)"' in script
+
+def test_slurm_array_waits_on_model_job(cluster):
+    install(cluster,'sbatch',FAKE_SBATCH)
+    scheduler, failed = run(cluster,'--scheduler','slurm','--array','generator','--array-limit','5')
+    assert failed == 0
+    model_script, array_script = submitted(cluster)
+    assert '#SBATCH --dependency' not in model_script
+    assert '#SBATCH --dependency=afterok:1' in array_script
+    assert '#SBATCH --array=1-2%5' in array_script
+    assert 'sed -n "${SLURM_ARRAY_TASK_ID}p"' in array_script
+
+def test_unreadable_job_id_fails_the_chain(cluster):
+    install(cluster,'bsub',FAKE_GARBLED)
+    scheduler, failed = run(cluster,'--scheduler','lsf')
+    assert failed == 3
+    #the dataset jobs are never submitted with a broken dependency expression
+    assert len(submitted(cluster)) == 1
+
+def test_parse_job_id():
+    options = options_for('--scheduler','lsf')
+    lsf = LSFScheduler({},options,'jobs','logs')
+    slurm = SlurmScheduler({},options,'jobs','logs')
+    assert lsf.parse_job_id('Job <12345> is submitted to queue <normal>.\n') == '12345'
+    assert lsf.parse_job_id('Request aborted by esub.\n') is None
+    assert slurm.parse_job_id('678\n') == '678'
+    assert slurm.parse_job_id('678;cluster_a\n') == '678'
+    assert slurm.parse_job_id('sbatch: error: invalid partition\n') is None
@@ -0,0 +1,50 @@
+""" Replicate shards of a native cell end up with the file names of an unsharded run, and reproduce exactly. """
+
+import os
+import subprocess
+import numpy as np
+from gametes_model_search import score_models, write_models, genotype_frequencies
+from gametes_jobs import Job, NATIVE_COMMAND, dataset_files
+from gametes_shards import apply_sharding, add_placement_step
+
+def write_model(path):
+    mafs = np.array([0.3])
+    tables = np.array([[0.1,0.3,0.7]])
+    prevalence = (genotype_frequencies(mafs)*tables).sum(axis=1)
+    edm, cor = score_models(tables,prevalence,mafs)
+    return write_models(path,tables,prevalence,edm,cor,mafs,0.2,[0])[0]
+
+def cell_job(tmp_path):
+    model = write_model(str(tmp_path/'L_1'))
+    cell = str(tmp_path/'data'/'cell_A_10_S_40')
+    command = NATIVE_COMMAND+' -i '+model+' -D "-n 0.1 -x 0.3 -a 10 -s 20 -w 20 -r 10 -o '+cell+'"'
+    params = {'attributes':10,'samples':40,'replicates':10,'quantiles':1}
+    return Job('data_cell_A_10_S_40',command,'data',inputs=[model],outputs=dataset_files(cell,1,10),params=params), cell
+
+def run(job):
+    subprocess.run(job.command,shell=True,check=True,stdout=subprocess.DEVNULL)
+
+def test_placed_files_match_an_unsharded_run(tmp_path):
+    job, cell = cell_job(tmp_path)
+    shards = add_placement_step(apply_sharding([job],3))
+    assert [shard.params['replicates'] for shard in shards] == [4,3,3]
+    assert sorted(sum([shard.outputs for shard in shards],[])) == sorted(dataset_files(cell,1,10))
+    os.makedirs(os.path.dirname(cell))
+    for shard in shards:
+        run(shard)
+    assert sorted(os.listdir(cell)) == sorted(os.path.basename(path) for path in dataset_files(cell,1,10))
+    assert os.listdir(os.path.dirname(cell)) == [os.path.basename(cell)] #shard folders removed
+
+def test_shard_seeds_are_stable(tmp_path):
+    job, cell = cell_job(tmp_path)
+    first = add_placement_step(apply_sharding([job],3))
+    again = add_placement_step(apply_sharding([cell_job(tmp_path)[0]],3))
+    assert [shard.command for shard in first] == [shard.command for shard in again]
+    assert len(set(shard.params['seed'] for shard in first)) == 3
+    os.makedirs(os.path.dirname(cell))
+    run(first[1])
+    produced = dict((path,open(path,'rb').read()) for path in first[1].outputs)
+    for path in produced:
+        os.remove(path)
+    run(again[1])
+    assert all(open(path,'rb').read() == data for path, data in produced.items())
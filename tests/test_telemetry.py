@@ -0,0 +1,34 @@
+""" The telemetry runner records one row per attempt, and the report lists the failed cells. """
+
+import subprocess
+from gametes_jobs import Job
+from gametes_manifest import record_planned
+from gametes_telemetry import add_telemetry_step, load_runs, report
+
+def test_runner_rows_and_report(tmp_path,capsys):
+    manifest_dir = str(tmp_path/'manifest')
+    db = str(tmp_path/'telemetry.sqlite')
+    written = str(tmp_path/'ok_EDM-1_1.txt')
+    jobs = [Job('cell_ok','printf 0123456789 > '+written,'gametes_univariate',outputs=[written],params={'heritability':0.2,'minorAF':0.2}),
+            Job('cell_broken','exit 3','gametes_univariate',outputs=[str(tmp_path/'broken_EDM-1_1.txt')],params={'heritability':0.4,'minorAF':0.4})]
+    record_planned(jobs,manifest_dir)
+    add_telemetry_step(jobs,db,manifest_dir,'run_1')
+    assert [subprocess.run(job.command,shell=True).returncode for job in jobs] == [0,3]
+
+    rows = dict((row['job'],row) for row in load_runs(db))
+    assert rows['cell_ok']['returncode'] == 0 and rows['cell_ok']['outputs_missing'] == 0 and rows['cell_ok']['output_bytes'] == 10
+    assert rows['cell_broken']['returncode'] == 3 and rows['cell_broken']['outputs_missing'] == 1 and rows['cell_broken']['output_bytes'] == 0
+    assert rows['cell_ok']['params'] == '{"heritability": 0.2, "minorAF": 0.2}'
+    assert all(row['run'] == 'run_1' and row['generator'] == 'gametes_univariate' and row['wall_s'] >= 0 for row in rows.values())
+
+    capsys.readouterr()
+    assert report(db) == 1
+    out = capsys.readouterr().out
+    assert 'Telemetry: 2 job attempt(s) from 1 run(s), 1 failed' in out
+    assert 'cell_broken [gametes_univariate]: exit 3, 1 output(s) missing' in out
+    assert 'heritability=0.4 minorAF=0.4' in out
+    assert 'cell_ok' not in out.split('Slowest cells:')[0]
+
+    #a second attempt replaces the first in the report, unless all attempts are asked for
+    subprocess.run(jobs[1].command,shell=True)
+    assert len(load_runs(db)) == 2 and len(load_runs(db,all_attempts=True)) == 3
@@ -0,0 +1,64 @@
+""" Validation of a native-generated cell planned in the completion manifest: a clean cell passes, a truncated replicate
+and a swapped penetrance table fail. """
+
+import os
+import json
+import numpy as np
+import pytest
+from gametes_model_search import score_models, write_models, genotype_frequencies
+from gametes_native import generate_datasets, parse_dataset_options, GENOTYPES
+from gametes_manifest import write_record
+from gametes_jobs import NATIVE_COMMAND
+from gametes_validate import validate_archive
+
+TABLE = np.array([0.1,0.3,0.7])
+OPTIONS = '-n 0.1 -x 0.3 -a 10 -s 400 -w 400 -r 2 -o '
+
+def write_model(path,table):
+    mafs = np.array([0.3])
+    tables = table.reshape(1,GENOTYPES)
+    prevalence = (genotype_frequencies(mafs)*tables).sum(axis=1)
+    edm, cor = score_models(tables,prevalence,mafs)
+    return write_models(path,tables,prevalence,edm,cor,mafs,0.2,[0])[0]
+
+@pytest.fixture
+def archive(tmp_path):
+    """ An archive with one model and one native cell (one quantile, two replicates) recorded as complete. """
+    os.makedirs(str(tmp_path/'models'))
+    model = write_model(str(tmp_path/'models'/'L_1'),TABLE)
+    cell = str(tmp_path/'gametes_univariate'/'gametes_univariate_A_10_S_800')
+    os.makedirs(os.path.dirname(cell))
+    options = OPTIONS+cell
+    paths = generate_datasets([model],[],parse_dataset_options(options),seed=3)
+    write_record(str(tmp_path/'temporary'/'manifest'),{'name':'data_cell','command':NATIVE_COMMAND+' -i '+model+' -D "'+options+'" -z 3',
+                 'inputs':[model],'expected':paths,'outputs':{},'params':{'replicates':2},'status':'complete'})
+    return tmp_path, model, paths
+
+def validate(root):
+    report = str(root/'report.jsonl')
+    failed = validate_archive([str(root)],report,workers=1)
+    entries = [json.loads(line) for line in open(report)]
+    assert len(entries) == 1
+    return failed, entries[0]
+
+def test_clean_cell_passes(archive):
+    failed, entry = validate(archive[0])
+    assert failed == 0 and entry['status'] == 'pass', entry['problems']
+    assert entry['planned'] == entry['datasets'] == 2
+    assert entry['quantiles'][0]['fit'] == 'pass'
+
+def test_truncated_replicate_fails(archive):
+    root, model, paths = archive
+    text = open(paths[1]).read()
+    open(paths[1],'w').write(text[:len(text)-len(text)//3])
+    failed, entry = validate(root)
+    assert failed == 1 and entry['status'] == 'fail'
+    assert any(problem.startswith(os.path.basename(paths[1])[:-len('.txt')]+': ') for problem in entry['problems'])
+
+def test_swapped_penetrance_table_fails(archive):
+    root, model, paths = archive
+    write_model(model[:-len('_Models.txt')],TABLE[::-1].copy())
+    failed, entry = validate(root)
+    assert failed == 1 and entry['status'] == 'fail'
+    assert entry['quantiles'][0]['fit'] == 'fail'
+    assert any('does not fit its model' in problem for problem in entry['problems'])
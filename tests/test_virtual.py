@@ -0,0 +1,56 @@
+""" A virtual archive materializes units on demand, evicts the least recently used ones past its budget and
+regenerates them byte for byte. """
+
+import os
+import json
+import sqlite3
+import numpy as np
+import pytest
+from gametes_model_search import score_models, write_models, genotype_frequencies
+from gametes_jobs import Job, NATIVE_COMMAND, dataset_files
+from gametes_shards import add_placement_step
+from gametes_virtual import plan_units, write_index, VirtualArchive
+
+@pytest.fixture
+def archive(tmp_path):
+    """ A virtual archive of one native cell with three replicates (three units). """
+    os.makedirs(str(tmp_path/'models'))
+    mafs = np.array([0.3])
+    tables = np.array([[0.1,0.3,0.7]])
+    prevalence = (genotype_frequencies(mafs)*tables).sum(axis=1)
+    edm, cor = score_models(tables,prevalence,mafs)
+    model = write_models(str(tmp_path/'models'/'L_1'),tables,prevalence,edm,cor,mafs,0.2,[0])[0]
+    cell = str(tmp_path/'data'/'cell_A_20_S_100')
+    os.makedirs(os.path.dirname(cell))
+    command = NATIVE_COMMAND+' -i '+model+' -D "-n 0.1 -x 0.3 -a 20 -s 50 -w 50 -r 3 -o '+cell+'"'
+    params = {'attributes':20,'samples':100,'replicates':3,'quantiles':1}
+    jobs = add_placement_step(plan_units([Job('data_cell',command,'data',inputs=[model],outputs=dataset_files(cell,1,3),params=params)]))
+    assert write_index(jobs,str(tmp_path/'temporary'/'virtual_index.json')) == []
+    return str(tmp_path), dataset_files(cell,1,3)
+
+def test_evicted_units_regenerate_byte_identical(archive):
+    output_path, paths = archive
+    first = VirtualArchive(output_path).materialize(paths[0])
+    assert first == paths[0]
+    original = open(first,'rb').read()
+    #room for one unit and a half: materializing a second unit evicts the first
+    virtual = VirtualArchive(output_path,budget_gb=1.5*len(original)/1024.0**3)
+    virtual.materialize(paths[1])
+    assert not os.path.exists(paths[0]) and os.path.isfile(paths[1])
+    assert not os.path.exists(paths[2])
+    virtual.materialize(paths[0])
+    assert open(paths[0],'rb').read() == original
+    assert not os.path.exists(paths[1])
+    assert virtual.open(paths[0]).genotypes.shape == (100,20)
+
+def test_regenerated_copy_is_checked_against_the_first(archive):
+    output_path, paths = archive
+    virtual = VirtualArchive(output_path)
+    virtual.materialize(paths[0])
+    connection = sqlite3.connect(os.path.join(output_path,'temporary','virtual_cache.sqlite'))
+    connection.execute('UPDATE units SET digests = ?',(json.dumps({paths[0]:'0'*64}),))
+    connection.commit()
+    connection.close()
+    os.remove(paths[0])
+    with pytest.raises(IOError,match='differs from the copy generated first'):
+        virtual.materialize(paths[0])